@@ -8,17 +8,37 @@ if str(ROOT_DIR) not in sys.path:
     sys.path.insert(0, str(ROOT_DIR))
 
 # Re-exporta módulos da raiz
-from extractor import Extractor
-from processor import filter_and_prepare, map_columns, DEFAULT_DISPLAY_COLUMNS
-from emailer import Emailer
+from extractor import Extractor, SheetCache, clear_sheet_cache, file_identity, invalidate_workbook, on_invalidate_workbook, read_sheet_names, find_region_sheet, WorkbookIndex, workbook_index
+from processor import filter_and_prepare, map_columns, DEFAULT_DISPLAY_COLUMNS, RegionFrame, RecipientDirectory, prepare_all_units, build_monthly_cube, cube_totals
+from emailer import Emailer, TemplateRegistry, template_registry, AssetManifest, asset_manifest
 import utils
+import money
 
 __all__ = [
     'Extractor', 
+    'SheetCache',
+    'clear_sheet_cache',
+    'file_identity',
+    'invalidate_workbook',
+    'on_invalidate_workbook',
+    'read_sheet_names',
+    'find_region_sheet',
+    'WorkbookIndex',
+    'workbook_index',
     'filter_and_prepare', 
     'map_columns', 
     'DEFAULT_DISPLAY_COLUMNS',
+    'RegionFrame',
+    'RecipientDirectory',
+    'prepare_all_units',
+    'build_monthly_cube',
+    'cube_totals',
     'Emailer', 
+    'TemplateRegistry',
+    'template_registry',
+    'AssetManifest',
+    'asset_manifest',
     'utils',
+    'money',
     'ROOT_DIR',
 ]
@@ -3,7 +3,7 @@ Router para preview de arquivos HTML gerados.
 Serve os arquivos reais da pasta output_html.
 """
 from fastapi import APIRouter, HTTPException
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, StreamingResponse
 from pathlib import Path
 from typing import List, Dict, Any, Optional
 from pydantic import BaseModel, Field
@@ -385,7 +385,10 @@ async def get_html_file(filename: str):
     except ValueError:
         raise HTTPException(status_code=403, detail="Acesso negado")
     
-    return file_path.read_text(encoding="utf-8")
+    # Enviado em pedaços; com LOGO_MODE=cid a logo é embutida aqui (o navegador não resolve cid:)
+    from app.services.pipeline_service import get_pipeline_service
+    chunks = get_pipeline_service().emailer.stream_html_file(file_path)
+    return StreamingResponse(chunks, media_type="text/html; charset=utf-8")
 
 
 @router.get("/regions", summary="Listar regiões disponíveis")
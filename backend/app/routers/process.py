@@ -3,7 +3,7 @@
 # de rotas com parâmetros dinâmicos (/{job_id}) para evitar conflitos de roteamento.
 
 from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
-from fastapi.responses import FileResponse, HTMLResponse
+from fastapi.responses import FileResponse, HTMLResponse, StreamingResponse
 from sqlalchemy.orm import Session
 from pydantic import BaseModel, Field
 from typing import Optional, List, Dict, Any
@@ -191,23 +191,12 @@ def execute_pipeline_batch(request: BatchExecuteRequest):
     successful = 0
     failed = 0
     
-    for unit_request in request.units:
-        result = service.execute(
-            region=unit_request.region,
-            unit=unit_request.unit,
-            month=unit_request.month,
-            dry_run=unit_request.dry_run,
-            send_email=unit_request.send_email,
-            visible_columns=unit_request.visible_columns,
-            copy_overrides=unit_request.copy_overrides,
-            sender_email=unit_request.sender_email,
-            sender_name=unit_request.sender_name,
-            reply_to=unit_request.reply_to,
-            cc_emails=unit_request.cc_emails,
-            mandatory_cc=unit_request.mandatory_cc,
-            use_existing_html=unit_request.use_existing_html,
-        )
-        
+    # Unidades da mesma região/mês são preparadas juntas (planilha lida e formatada uma vez)
+    batch_results = service.execute_batch([
+        unit_request.model_dump() for unit_request in request.units
+    ])
+    
+    for result in batch_results:
         preview_url = None
         if result.html_path:
             from pathlib import Path
@@ -438,7 +427,7 @@ def preview_job_result(
         job_id: ID do job processado
     
     Returns:
-        HTML renderizado
+        HTML do resultado, enviado em pedaços (StreamingResponse)
     """
     processor = JobProcessor(db)
     
@@ -458,8 +447,8 @@ def preview_job_result(
     
     file_path, _ = result
     
-    with open(file_path, "r", encoding="utf-8") as f:
-        html_content = f.read()
-    
-    return HTMLResponse(content=html_content)
+    return StreamingResponse(
+        processor.stream_result_html_for_browser(file_path),
+        media_type="text/html; charset=utf-8",
+    )
 
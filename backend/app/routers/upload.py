@@ -4,6 +4,7 @@ from typing import List, Optional
 from app.database import get_db
 from app.models.job import ProcessingJob
 from app.schemas.job import JobResponse
+from app.core import invalidate_workbook, read_sheet_names, find_region_sheet
 import shutil
 import os
 from datetime import datetime
@@ -37,6 +38,8 @@ def delete_existing_region_files(db: Session, region: str):
         # Remove arquivo físico se existir
         if job.file_url:
             file_path = Path(job.file_url)
+            # Abas em cache desse arquivo não serão mais usadas
+            invalidate_workbook(file_path)
             if file_path.exists():
                 try:
                     os.remove(file_path)
@@ -49,6 +52,22 @@ def delete_existing_region_files(db: Session, region: str):
     db.commit()
 
 
+def validate_region_sheet(file: UploadFile, region: Optional[str]):
+    """
+    Confere, antes de salvar, se a planilha enviada tem a aba
+    'Faturamento <região>' lendo só o catálogo de abas. Arquivos cujo
+    catálogo não pode ser lido passam (o processamento reporta o erro depois).
+    """
+    if not region:
+        return
+    sheet_names = read_sheet_names(file.file)
+    if sheet_names and not find_region_sheet(sheet_names, region):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Arquivo '{file.filename}' não tem a aba 'Faturamento {region.upper()}'. Abas: {', '.join(sheet_names)}"
+        )
+
+
 @router.post("/", response_model=JobResponse)
 async def upload_file(
     file: UploadFile = File(...), 
@@ -76,6 +95,8 @@ async def upload_file(
             detail=f"Região inválida. Regiões válidas: {', '.join(VALID_REGIONS)}"
         )
     
+    validate_region_sheet(file, region)
+    
     # Remove arquivos anteriores da mesma região (apenas 1 por região)
     if region:
         delete_existing_region_files(db, region)
@@ -88,6 +109,7 @@ async def upload_file(
     
     with open(file_path, "wb") as buffer:
         shutil.copyfileobj(file.file, buffer)
+    invalidate_workbook(file_path)
         
     # 2. Criar Job no Banco
     job = ProcessingJob(
@@ -142,24 +164,23 @@ async def upload_multiple_files(
                     detail=f"Região inválida: {r}. Regiões válidas: {', '.join(VALID_REGIONS)}"
                 )
     
-    jobs = []
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    # Determina a região de cada arquivo
+    file_regions = [region_list[i] if i < len(region_list) and region_list[i] else None for i in range(len(files))]
     
-    for i, file in enumerate(files):
+    # Valida todos os arquivos antes de salvar qualquer um (nada fica pela metade)
+    for file, file_region in zip(files, file_regions):
         # Valida extensão
         if not file.filename.endswith(('.xlsx', '.xls')):
             raise HTTPException(
                 status_code=400, 
                 detail=f"Arquivo '{file.filename}' não é um arquivo Excel válido"
             )
-        
-        # Determina região para este arquivo
-        file_region = None
-        if i < len(region_list) and region_list[i]:
-            file_region = region_list[i]
-            # Remove arquivos anteriores da mesma região
-            delete_existing_region_files(db, file_region)
-        
+        validate_region_sheet(file, file_region)
+    
+    jobs = []
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    
+    for i, (file, file_region) in enumerate(zip(files, file_regions)):
         # Salvar arquivo
         safe_filename = "".join(c if c.isalnum() or c in ('_', '-', '.') else '_' for c in file.filename)
         filename = f"{timestamp}_{i+1}_{safe_filename}"
@@ -167,6 +188,11 @@ async def upload_multiple_files(
         
         with open(file_path, "wb") as buffer:
             shutil.copyfileobj(file.file, buffer)
+        invalidate_workbook(file_path)
+        
+        # Remove arquivos anteriores da mesma região
+        if file_region:
+            delete_existing_region_files(db, file_region)
         
         # Criar Job
         job = ProcessingJob(
@@ -13,15 +13,20 @@ if str(PROJECT_ROOT) not in sys.path:
 # Assim outros módulos do backend podem fazer:
 # from app.services.core_imports import Extractor, filter_and_prepare, etc.
 
-from extractor import Extractor
+from extractor import Extractor, SheetCache, clear_sheet_cache, file_identity, invalidate_workbook, on_invalidate_workbook, read_sheet_names, find_region_sheet, WorkbookIndex, workbook_index
 from processor import (
     filter_and_prepare,
     map_columns,
+    RegionFrame,
+    RecipientDirectory,
+    prepare_all_units,
+    build_monthly_cube,
+    cube_totals,
     DEFAULT_DISPLAY_COLUMNS,
     DISPLAY_HEADER_SYNONYMS,
     SLA_DESCONTO_CANONICAL,
 )
-from emailer import Emailer
+from emailer import Emailer, TemplateRegistry, template_registry, AssetManifest, asset_manifest
 from config_loader import (
     load_overrides,
     resolve_overrides,
@@ -32,6 +37,7 @@ from utils import (
     fmt_brl,
     normalize_unit,
     parse_year_month,
+    parse_year_month_series,
     previous_month_from_today,
     safe_write_text,
     safe_read_text,
@@ -48,14 +54,32 @@ from utils import (
 __all__ = [
     # Extractor
     'Extractor',
+    'SheetCache',
+    'clear_sheet_cache',
+    'file_identity',
+    'invalidate_workbook',
+    'on_invalidate_workbook',
+    'read_sheet_names',
+    'find_region_sheet',
+    'WorkbookIndex',
+    'workbook_index',
     # Processor
     'filter_and_prepare',
     'map_columns',
+    'RegionFrame',
+    'RecipientDirectory',
+    'prepare_all_units',
+    'build_monthly_cube',
+    'cube_totals',
     'DEFAULT_DISPLAY_COLUMNS',
     'DISPLAY_HEADER_SYNONYMS',
     'SLA_DESCONTO_CANONICAL',
     # Emailer
     'Emailer',
+    'TemplateRegistry',
+    'template_registry',
+    'AssetManifest',
+    'asset_manifest',
     # Config Loader
     'load_overrides',
     'resolve_overrides',
@@ -65,6 +89,7 @@ __all__ = [
     'fmt_brl',
     'normalize_unit',
     'parse_year_month',
+    'parse_year_month_series',
     'previous_month_from_today',
     'safe_write_text',
     'safe_read_text',
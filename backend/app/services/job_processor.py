@@ -4,14 +4,14 @@ import os
 import json
 import logging
 from pathlib import Path
-from typing import Dict, Any, Optional, List, Tuple
+from typing import Dict, Any, Iterator, Optional, List, Tuple
 from datetime import datetime
 from sqlalchemy.orm import Session
 from dotenv import dotenv_values
 
 from app.models.job import ProcessingJob
 # Importa módulos core da raiz (elimina duplicação)
-from app.services.core_imports import Extractor, filter_and_prepare, map_columns, Emailer
+from app.services.core_imports import Extractor, filter_and_prepare, map_columns, Emailer, parse_year_month_series
 
 # Configuração de logging
 logger = logging.getLogger(__name__)
@@ -132,10 +132,7 @@ class JobProcessor:
         mes_col = col_mapping.get("Mes_Emissao_NF") or col_mapping.get("Mês_Emissão_NF")
         months = []
         if mes_col and mes_col in df.columns:
-            from app.services.utils import normalize_text_full
-            from app.services.processor import _vectorized_parse_year_month
-            
-            parsed = _vectorized_parse_year_month(df[mes_col])
+            parsed = parse_year_month_series(df[mes_col])
             months = parsed.dropna().unique().tolist()
             months = [m for m in months if m]
             months.sort(reverse=True)  # Mais recente primeiro
@@ -195,8 +192,9 @@ class JobProcessor:
                 raise JobProcessorError(f"Arquivo não encontrado: {file_path}")
             
             # 4. Extrai dados da planilha
+            # Relatório usa as colunas padrão: lê só as colunas que o pipeline usa
             extractor = Extractor(file_path.parent)
-            df, sheet_name = extractor.read_region_sheet(file_path, region)
+            df, sheet_name = extractor.read_region_sheet(file_path, region, prune_columns=True)
             
             logger.info(f"Job {job_id}: Planilha carregada ({len(df)} linhas, aba: {sheet_name})")
             
@@ -226,7 +224,13 @@ class JobProcessor:
             # Formata destinatários para exibição
             destinatarios_exibicao = "; ".join(recipients) if recipients else ""
             
-            html_content = emailer.render_html(
+            # 7. Grava o HTML direto no disco, à medida que o template é renderizado
+            safe_unit = "".join(c if c.isalnum() or c in (' ', '-', '_') else '_' for c in unit)
+            output_filename = f"{safe_unit}_{month}.html"
+            output_path = OUTPUT_DIR / output_filename
+            
+            emailer.render_to_file(
+                output_path,
                 unidade=unit,
                 regiao=region,
                 ym=month,
@@ -235,14 +239,6 @@ class JobProcessor:
                 destinatarios_exibicao=destinatarios_exibicao,
             )
             
-            # 7. Salva HTML no disco
-            safe_unit = "".join(c if c.isalnum() or c in (' ', '-', '_') else '_' for c in unit)
-            output_filename = f"{safe_unit}_{month}.html"
-            output_path = OUTPUT_DIR / output_filename
-            
-            with open(output_path, "w", encoding="utf-8") as f:
-                f.write(html_content)
-            
             logger.info(f"Job {job_id}: HTML salvo em {output_path}")
             
             # 8. Monta resultado
@@ -302,3 +298,12 @@ class JobProcessor:
         
         filename = job.result_summary.get("output_filename", path.name)
         return (path, filename)
+
+    def stream_result_html_for_browser(self, path: Path) -> Iterator[str]:
+        """
+        HTML de resultado para exibir no navegador, em pedaços (sem ler o
+        arquivo inteiro): com LOGO_MODE=cid a logo é embutida aqui, já que
+        o navegador não resolve cid:.
+        """
+        emailer = Emailer(templates_dir=TEMPLATES_DIR, assets_dir=ASSETS_DIR, env_cfg=self._load_env_config())
+        return emailer.stream_html_file(path)
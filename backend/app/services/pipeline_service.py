@@ -4,8 +4,10 @@ Serviço de pipeline: orquestra extração → processamento → geração HTML
 import os
 import re
 import logging
+import threading
+from collections import OrderedDict
 from pathlib import Path
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime
 from dataclasses import dataclass, field
 from dotenv import load_dotenv
@@ -16,7 +18,10 @@ load_dotenv()
 logger = logging.getLogger(__name__)
 
 # Importa módulos core
-from app.core import Extractor, filter_and_prepare, map_columns, Emailer, utils, ROOT_DIR
+from app.core import (
+    Extractor, RegionFrame, prepare_all_units, map_columns, Emailer, utils, ROOT_DIR,
+    file_identity, find_region_sheet, on_invalidate_workbook, read_sheet_names,
+)
 
 # Caminhos
 PLANILHAS_DIR = ROOT_DIR / "planilhas"
@@ -31,8 +36,7 @@ OUTPUT_HTML_DIR = ROOT_DIR / "output_html"
 class PipelineResult:
     """Resultado de uma execução do pipeline."""
     success: bool = False
-    html_content: str = ""
-    html_path: Optional[str] = None
+    html_path: Optional[str] = None  # o HTML fica só no disco (read_html)
     emails_found: List[str] = field(default_factory=list)
     emails_sent_to: List[str] = field(default_factory=list)
     error: Optional[str] = None
@@ -42,10 +46,19 @@ class PipelineResult:
     region: str = ""
     month: str = ""
 
+    def read_html(self) -> str:
+        """Lê o HTML gravado em html_path (vazio se não houver)."""
+        if not self.html_path:
+            return ""
+        return Path(self.html_path).read_text(encoding="utf-8")
+
 
 class PipelineService:
     """Serviço que orquestra o pipeline de extração, processamento e envio."""
     
+    # RegionFrames mantidos (abas usadas mais recentemente)
+    FRAMES_CACHE_SIZE = 8
+    
     def __init__(self):
         self.extractor = Extractor(PLANILHAS_DIR)
         # Extractor secundário para uploads (sempre existe pois criamos o dir)
@@ -60,15 +73,39 @@ class PipelineService:
             "SENDER_EMAIL": os.getenv("SENDGRID_FROM_EMAIL", os.getenv("SENDER_EMAIL", "")),
             "SLA_URL": os.getenv("SLA_URL", ""),
             "LOGO_FILE": os.getenv("LOGO_FILE", "logo-performance-horizontal-azul.png"),
+            "LOGO_MODE": os.getenv("LOGO_MODE", "inline"),
+            "LOGO_CID": os.getenv("LOGO_CID", "atlas-logo"),
+            "LOGO_HTTP_URL": os.getenv("LOGO_HTTP_URL", ""),
             "SUBJECT_TEMPLATE": os.getenv("SUBJECT_TEMPLATE", "Medição {unidade} - {mes_ref}"),
             "USE_TEST_SUBJECT": os.getenv("USE_TEST_SUBJECT", "false"),
         }
         
         self.emailer = Emailer(TEMPLATES_DIR, ASSETS_DIR, self.env_cfg)
         
+        # Abas indexadas por versão do arquivo (caminho, mtime_ns, tamanho) e nome da aba —
+        # evita reler e reindexar a aba a cada unidade; descartadas em invalidate_workbook
+        self._frames: "OrderedDict[Tuple[Tuple[str, int, int], str], RegionFrame]" = OrderedDict()
+        self._frames_lock = threading.Lock()
+        on_invalidate_workbook(self.invalidate_workbook)
+        
         # Importa ConfigService aqui para evitar circular import
         from app.services.config_service import ConfigService
         self.config_service = ConfigService()
+        self.precompile_copy()
+    
+    def precompile_copy(self) -> None:
+        """Compila no Emailer os textos de copy do .env e da configuração do portal (padrão, regiões, unidades)."""
+        config: Dict[str, Any] = {}
+        if self.config_service.config_path.exists():  # não cria o arquivo só para isso
+            try:
+                config = self.config_service.get_config()
+            except Exception as e:
+                logger.warning(f"[PIPELINE] Configuração indisponível para pré-compilar textos: {e}")
+        copy_sets = [(config.get("defaults") or {}).get("copy")]
+        for section in ("regions", "units"):
+            copy_sets += [(cfg or {}).get("copy") for cfg in (config.get(section) or {}).values()]
+        compiled = self.emailer.precompile_copy(*copy_sets)
+        logger.info(f"[PIPELINE] {compiled} textos de copy pré-compilados")
     
     def _find_workbook_with_priority(self, region: str) -> Optional[Path]:
         """
@@ -96,6 +133,69 @@ class PipelineService:
         logger.warning(f"[PIPELINE] Planilha NÃO encontrada para região {region} em nenhuma pasta")
         return None
     
+    def invalidate_workbook(self, path: Path) -> int:
+        """Descarta os RegionFrames lidos do arquivo (chamado por invalidate_workbook)."""
+        target = str(Path(path).resolve())
+        with self._frames_lock:
+            keys = [key for key in self._frames if key[0][0] == target]
+            for key in keys:
+                del self._frames[key]
+        return len(keys)
+
+    def _load_region_frame(self, region: str) -> Tuple[Optional[RegionFrame], Optional[str]]:
+        """
+        Localiza a planilha da região e devolve o RegionFrame da aba.
+
+        Returns:
+            (frame, None) em caso de sucesso ou (None, mensagem de erro)
+        """
+        # Busca primeiro nos uploads, depois na pasta padrão
+        workbook_path = self._find_workbook_with_priority(region)
+        if not workbook_path:
+            return None, f"Planilha não encontrada para região {region}. Faça upload da planilha no Dashboard."
+
+        # Determina qual extractor usar baseado no path
+        if str(workbook_path).startswith(str(UPLOADS_DIR)):
+            extractor = self.extractor_uploads
+        else:
+            extractor = self.extractor
+
+        # Mesma versão do arquivo e mesma aba: reaproveita o frame já indexado
+        ident = file_identity(workbook_path)
+        key = (ident, find_region_sheet(read_sheet_names(workbook_path, extractor.cache), region))
+        if ident is not None and key[1] is not None:
+            with self._frames_lock:
+                frame = self._frames.get(key)
+                if frame is not None:
+                    self._frames.move_to_end(key)
+                    return frame, None
+
+        df, sheet_name = extractor.read_region_sheet(workbook_path, region)
+        logger.info(f"[PIPELINE] Aba lida: {sheet_name} ({len(df)} linhas)")
+        frame = RegionFrame(df)
+        if ident is not None:
+            with self._frames_lock:
+                self._frames[(ident, sheet_name)] = frame
+                self._frames.move_to_end((ident, sheet_name))
+                while len(self._frames) > self.FRAMES_CACHE_SIZE:
+                    self._frames.popitem(last=False)
+        return frame, None
+
+    def _resolve_unit_config(
+        self,
+        unit: str,
+        region: str,
+        visible_columns: Optional[List[str]],
+        copy_overrides: Optional[Dict[str, str]],
+    ) -> Tuple[Optional[List[str]], Dict[str, str]]:
+        """Completa colunas e textos com a configuração mesclada da unidade."""
+        config = self.config_service.get_effective_config(unit, region)
+        if visible_columns is None:
+            visible_columns = config.get("visible_columns")
+        if copy_overrides is None:
+            copy_overrides = config.get("copy", {})
+        return visible_columns, copy_overrides
+    
     def _extract_emails_from_html(self, html: str) -> List[str]:
         """Extrai emails do HTML (do rodapé/destinatários)."""
         # Procura no footer-meta por "Destinatários:"
@@ -145,6 +245,8 @@ class PipelineService:
         cc_emails: Optional[List[str]] = None,
         mandatory_cc: Optional[str] = None,  # Email obrigatório em cópia (consultoria)
         use_existing_html: bool = False,  # Se True, usa HTML existente sem regenerar
+        prepared: Optional[Tuple[List[Dict[str, Any]], List[str], Dict[str, Any]]] = None,
+        rendered: bool = False,
     ) -> PipelineResult:
         """
         Executa o pipeline completo para uma unidade.
@@ -163,6 +265,9 @@ class PipelineService:
             cc_emails: Lista de emails em cópia (opcional)
             mandatory_cc: Email obrigatório em cópia (consultoria)
             use_existing_html: Se True, usa HTML existente (editado) sem regenerar
+            prepared: (rows, emails, summary) já preparados por execute_batch;
+                dispensa a leitura da planilha (colunas e textos já resolvidos)
+            rendered: HTML já gravado em output_html por execute_batch (render_many)
         
         Returns:
             PipelineResult com o resultado da execução
@@ -173,58 +278,41 @@ class PipelineService:
             logger.info(f"[PIPELINE] Iniciando: {unit} ({region}) - {month}")
             
             # Verifica se deve usar HTML existente
-            safe_unit = unit.replace(" ", "_").replace("/", "_")
-            filename = f"{safe_unit}_{month}.html"
-            html_path = OUTPUT_HTML_DIR / filename
+            html_path = self._html_path(unit, month)
             
             if use_existing_html and html_path.exists():
                 # Usa o HTML existente (editado na tela de preview)
                 logger.info(f"[PIPELINE] Usando HTML existente: {html_path}")
-                html = html_path.read_text(encoding='utf-8')
-                result.html_content = html
                 result.html_path = str(html_path)
                 
                 # Extrai emails do HTML existente (do footer)
-                emails = self._extract_emails_from_html(html)
+                emails = self._extract_emails_from_html(result.read_html())
                 result.emails_found = emails
                 result.rows_count = -1  # Indica que usou HTML existente
                 result.summary = {"source": "existing_html"}
                 
             else:
                 # Pipeline normal: regenera do Excel
-                # 1. Localiza a planilha (busca primeiro nos uploads, depois na pasta padrão)
-                workbook_path = self._find_workbook_with_priority(region)
-                if not workbook_path:
-                    result.error = f"Planilha não encontrada para região {region}. Faça upload da planilha no Dashboard."
-                    logger.error(result.error)
-                    return result
-                
-                # Determina qual extractor usar baseado no path
-                if str(workbook_path).startswith(str(UPLOADS_DIR)):
-                    extractor = self.extractor_uploads
+                if prepared is not None:
+                    rows, emails, summary = prepared
                 else:
-                    extractor = self.extractor
-                
-                # 2. Lê a aba da região
-                df, sheet_name = extractor.read_region_sheet(workbook_path, region)
-                logger.info(f"[PIPELINE] Aba lida: {sheet_name} ({len(df)} linhas)")
-                
-                # 3. Obtém configuração mesclada para a unidade
-                config = self.config_service.get_effective_config(unit, region)
-                
-                # Usa parâmetros passados ou da config
-                if visible_columns is None:
-                    visible_columns = config.get("visible_columns")
-                if copy_overrides is None:
-                    copy_overrides = config.get("copy", {})
-                
-                # 4. Filtra e processa os dados
-                rows, emails, summary = filter_and_prepare(
-                    df=df,
-                    unidade=unit,
-                    ym=month,
-                    columns_whitelist=visible_columns
-                )
+                    # 1-2. Localiza a planilha (uploads, depois pasta padrão) e lê a aba da região
+                    frame, error = self._load_region_frame(region)
+                    if error:
+                        result.error = error
+                        logger.error(result.error)
+                        return result
+                    
+                    # 3. Obtém configuração mesclada para a unidade
+                    visible_columns, copy_overrides = self._resolve_unit_config(
+                        unit, region, visible_columns, copy_overrides
+                    )
+                    
+                    # 4. Filtra e processa os dados (formatação do mês fica em cache no frame)
+                    prepared_units = prepare_all_units(frame, month, {unit: visible_columns})
+                    rows, emails, summary = prepared_units.get(utils.normalize_unit(unit)) or (
+                        [], [], {"row_count": 0, "sum_valor_mensal_final": 0.0}
+                    )
                 
                 if not rows:
                     result.error = f"Nenhum dado encontrado para {unit} em {month}"
@@ -237,33 +325,23 @@ class PipelineService:
                 
                 logger.info(f"[PIPELINE] Dados processados: {len(rows)} linhas, {len(emails)} emails")
                 
-                # 5. Gera o HTML
-                destinatarios_str = ", ".join(emails) if emails else ""
-                html = self.emailer.render_html(
-                    unidade=unit,
-                    regiao=region,
-                    ym=month,
-                    rows=rows,
-                    summary=summary,
-                    destinatarios_exibicao=destinatarios_str,
-                    copy_overrides=copy_overrides,
-                    table_columns=visible_columns,
-                )
-                
-                result.html_content = html
-                
-                # 6. Salva o HTML
-                OUTPUT_HTML_DIR.mkdir(parents=True, exist_ok=True)
-                html_path.write_text(html, encoding='utf-8')
+                # 5-6. Gera o HTML direto no arquivo (sem cópia inteira na memória)
+                if not rendered:
+                    OUTPUT_HTML_DIR.mkdir(parents=True, exist_ok=True)
+                    self.emailer.render_to_file(
+                        html_path,
+                        **self._render_payload(unit, region, month, rows, summary, emails, visible_columns, copy_overrides),
+                    )
                 result.html_path = str(html_path)
                 
                 logger.info(f"[PIPELINE] HTML salvo: {html_path}")
             
             # 7. Envia email se não for dry_run (comum aos dois fluxos)
             emails = result.emails_found
-            html = result.html_content
             
             if not dry_run and send_email and emails:
+                # O HTML só volta à memória para o envio
+                html = result.read_html()
                 # Se usou HTML existente, extrai o subject do HTML (pode ter sido editado)
                 if use_existing_html:
                     subject = self._extract_subject_from_html(html)
@@ -319,6 +397,132 @@ class PipelineService:
         
         return result
     
+    @staticmethod
+    def _html_path(unit: str, month: str) -> Path:
+        """Arquivo do HTML da unidade em output_html/."""
+        safe_unit = unit.replace(" ", "_").replace("/", "_")
+        return OUTPUT_HTML_DIR / f"{safe_unit}_{month}.html"
+
+    @staticmethod
+    def _render_payload(
+        unit: str,
+        region: str,
+        month: str,
+        rows: List[Dict[str, Any]],
+        summary: Dict[str, Any],
+        emails: List[str],
+        visible_columns: Optional[List[str]],
+        copy_overrides: Optional[Dict[str, str]],
+    ) -> Dict[str, Any]:
+        """Argumentos de Emailer.render_html para uma unidade."""
+        return {
+            "unidade": unit,
+            "regiao": region,
+            "ym": month,
+            "rows": rows,
+            "summary": summary,
+            "destinatarios_exibicao": ", ".join(emails) if emails else "",
+            "copy_overrides": copy_overrides,
+            "table_columns": visible_columns,
+        }
+
+    @staticmethod
+    def _prepare_group(frame: RegionFrame, month: str, group: List[Dict[str, Any]]) -> None:
+        """
+        Preenche req["prepared"] de cada requisição do grupo com prepare_all_units.
+
+        O plano de prepare_all_units tem uma entrada por unidade normalizada:
+        requisições da mesma unidade com colunas diferentes vão para rodadas
+        seguintes (o mês formatado fica em cache no frame), e cada uma recebe
+        as linhas das próprias colunas.
+        """
+        pending = list(group)
+        while pending:
+            plan: Dict[str, Tuple[str, Optional[List[str]]]] = {}
+            current: List[Tuple[str, Dict[str, Any]]] = []
+            deferred: List[Dict[str, Any]] = []
+            for req in pending:
+                nu = utils.normalize_unit(req["unit"])
+                columns = req["visible_columns"]
+                if nu in plan and plan[nu][1] != columns:
+                    deferred.append(req)
+                    continue
+                plan.setdefault(nu, (req["unit"], columns))
+                current.append((nu, req))
+            prepared_units = prepare_all_units(frame, month, {unit: columns for unit, columns in plan.values()})
+            for nu, req in current:
+                req["prepared"] = prepared_units.get(nu) or ([], [], {"row_count": 0, "sum_valor_mensal_final": 0.0})
+            pending = deferred
+
+    def execute_batch(self, requests: List[Dict[str, Any]], render_workers: int = 1) -> List[PipelineResult]:
+        """
+        Executa o pipeline para várias unidades.
+
+        As unidades da mesma região/mês são preparadas juntas por
+        prepare_all_units: a planilha é lida e formatada uma única vez por
+        lote, e cada unidade só monta as próprias linhas. Os HTMLs do lote
+        saem de Emailer.render_many direto para output_html (template, logo
+        e marca resolvidos uma vez; render_workers > 1 usa um pool de processos).
+
+        Args:
+            requests: Parâmetros de execute() por unidade (mesmas chaves)
+            render_workers: Processos para renderizar cada lote
+
+        Returns:
+            Lista de PipelineResult na ordem das requisições
+        """
+        requests = [dict(req) for req in requests]
+        groups: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+        for req in requests:
+            if req.get("use_existing_html"):
+                continue
+            groups.setdefault((req["region"], req["month"]), []).append(req)
+
+        for (region, month), group in groups.items():
+            try:
+                frame, error = self._load_region_frame(region)
+                if error:
+                    # execute() reporta o erro por unidade
+                    continue
+                for req in group:
+                    req["visible_columns"], req["copy_overrides"] = self._resolve_unit_config(
+                        req["unit"], region, req.get("visible_columns"), req.get("copy_overrides")
+                    )
+                self._prepare_group(frame, month, group)
+                logger.info(f"[PIPELINE] Lote preparado: {region} {month} ({len(group)} unidades)")
+            except Exception as e:
+                # Sem preparo em lote: cada unidade segue o fluxo individual
+                logger.warning(f"[PIPELINE] Falha ao preparar lote {region} {month}: {e}")
+                continue
+
+            # Unidades repetidas no lote gravam o mesmo arquivo: essas renderizam
+            # no próprio execute(), logo antes do envio de cada uma
+            paths = [self._html_path(req["unit"], month) for req in group]
+            renderable = [
+                req for req, path in zip(group, paths)
+                if req.get("prepared") and req["prepared"][0] and paths.count(path) == 1
+            ]
+            try:
+                OUTPUT_HTML_DIR.mkdir(parents=True, exist_ok=True)
+                self.emailer.render_many(
+                    [
+                        self._render_payload(
+                            req["unit"], region, month, req["prepared"][0], req["prepared"][2],
+                            req["prepared"][1], req["visible_columns"], req["copy_overrides"],
+                        )
+                        for req in renderable
+                    ],
+                    workers=render_workers,
+                    paths=[self._html_path(req["unit"], month) for req in renderable],
+                )
+                for req in renderable:
+                    req["rendered"] = True
+            except Exception as e:
+                # Sem render em lote: cada unidade renderiza no próprio execute()
+                logger.warning(f"[PIPELINE] Falha ao renderizar lote {region} {month}: {e}")
+
+        return [self.execute(**req) for req in requests]
+
     def _send_via_sendgrid(
         self,
         subject: str,
@@ -358,7 +562,8 @@ class PipelineService:
                 from_email=Email(from_email, from_name),
                 to_emails=[To(email) for email in recipients],
                 subject=subject,
-                html_content=Content("text/html", html)
+                # LOGO_MODE=cid: a logo só é embutida no HTML na hora do envio
+                html_content=Content("text/html", self.emailer.inline_assets(html))
             )
             
             # Adiciona CCs se fornecidos
@@ -413,12 +618,8 @@ class PipelineService:
             mes_col = mapping.get("Mes_Emissao_NF") or mapping.get("Mes_Emissão_NF")
             
             if mes_col and mes_col in df.columns:
-                months = set()
-                for val in df[mes_col].dropna():
-                    parsed = utils.parse_year_month(val)
-                    if parsed:
-                        months.add(parsed)
-                return sorted(list(months), reverse=True)
+                months = utils.parse_year_month_series(df[mes_col]).dropna().unique()
+                return sorted(months.tolist(), reverse=True)
             
             return []
         except Exception as e:
@@ -426,14 +627,15 @@ class PipelineService:
             return []
     
     def list_available_regions(self) -> List[str]:
-        """Lista regiões disponíveis (baseado em planilhas existentes)."""
-        regions = []
-        for file in PLANILHAS_DIR.glob("*.xlsx"):
-            if file.name.startswith("~$"):
-                continue
-            for region in ["RJ", "SP1", "SP2", "SP3", "NNE"]:
-                if region in file.name and region not in regions:
-                    regions.append(region)
+        """Lista regiões disponíveis (abas 'Faturamento <região>' das planilhas de uploads e da pasta padrão)."""
+        all_regions = ["RJ", "SP1", "SP2", "SP3", "NNE"]
+        regions = set()
+        for extractor in (self.extractor_uploads, self.extractor):
+            regions.update(extractor.available_regions(all_regions))
+            for file in extractor.workbook_files():
+                # Arquivo sem catálogo legível: usa o nome do arquivo
+                if not extractor._get_sheet_names(file):
+                    regions.update(r for r in all_regions if r in file.name)
         return sorted(regions)
 
 
@@ -275,6 +275,9 @@ class TemplateService:
     ) -> str:
         """
         Gera preview de um template com dados de exemplo.
+
+        Renderiza o documento inteiro (não em streaming): erros de um
+        template editado viram TemplateServiceError antes da resposta.
         """
         content = self.get_template_content(template_id)
         if not content:
@@ -314,7 +317,7 @@ class TemplateService:
             ]
         
         # Usa o Emailer para renderizar
-        from app.services.emailer import Emailer
+        from app.services.core_imports import Emailer
         from pathlib import Path
         import os
         
@@ -345,7 +348,8 @@ class TemplateService:
                 summary=summary,
                 destinatarios_exibicao="preview@exemplo.com"
             )
-            return html
+            # Preview no navegador: LOGO_MODE=cid precisa da logo embutida
+            return emailer.inline_assets(html)
         except Exception as e:
             logger.exception(f"Erro ao renderizar preview: {e}")
             raise TemplateServiceError(f"Erro ao renderizar preview: {e}")
@@ -0,0 +1,154 @@
+"""
+Benchmark de memória do processamento de uma região inteira.
+
+Roda filter_and_prepare para todas as unidades de um mês (DataFrame bruto,
+RegionFrame e prepare_all_units), cada cenário em um subprocesso novo, e
+mostra o pico de RSS e o pico de alocações (tracemalloc) de cada um.
+O pico de RSS usa o módulo resource (só Unix); no Windows sai apenas o
+pico de alocações.
+
+Uso:
+    python bench_memory.py                          # planilha sintética larga
+    python bench_memory.py --rows 50000 --extra-cols 80
+    python bench_memory.py --xlsx planilha.xlsx --regiao RJ --mes 2025-06
+
+Para comparar com uma versão anterior, rode o mesmo comando apontando
+--root para outro checkout (ex.: git worktree add /tmp/antes <commit>).
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource  # só Unix
+except ImportError:
+    resource = None
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SCENARIOS = ["dataframe", "regionframe", "batch"]
+
+
+def _synthetic_df(rows: int, units: int, months: int, extra_cols: int):
+    """Aba regional larga, toda em texto (como o Extractor entrega)."""
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(7)
+
+    def choice(values) -> np.ndarray:
+        # Sorteia entre textos já criados: a planilha não é dominada por strings novas
+        return rng.choice(np.array(values, dtype=object), rows)
+
+    unit_names = [f"Shopping {i:03d}" for i in range(units)]
+    month_names = [f"{(m % 12) + 1:02d}/{2024 + m // 12}" for m in range(months)]
+    amounts = [f"{v:.2f}" for v in rng.uniform(0, 50000, 5000)]
+    data = {
+        "Unidade": choice(unit_names),
+        "Fornecedor": choice(["Forn A", "Forn B", "Forn C"]),
+        "Horas Atrasos": choice(["1:30", "0:45", "2,5", ""]),
+        "Valor Planilha": choice(amounts),
+        "Valor Mensal Final": choice(amounts),
+        "Mês de emissão da NF": choice(month_names),
+        "E-mail": choice(["a@x.com; b@x.com", "c@y.com", "d@z.com"]),
+    }
+    extras = [str(v) for v in range(1000)]
+    for i in range(extra_cols):
+        data[f"Coluna extra {i}"] = choice(extras)
+    return pd.DataFrame(data), month_names[-1][3:] + "-" + month_names[-1][:2]
+
+
+def _peak_rss_mb():
+    """Pico de RSS do processo em MB, ou None sem o módulo resource."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss vem em bytes no macOS e em KB no Linux
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+
+def _run_scenario(args) -> dict:
+    """Executa um cenário neste processo e devolve as medições."""
+    sys.path.insert(0, args.root)
+    from processor import RegionFrame, filter_and_prepare, map_columns
+
+    if args.xlsx:
+        from extractor import Extractor
+        df, _ = Extractor(os.path.dirname(os.path.abspath(args.xlsx))).read_region_sheet(args.xlsx, args.regiao)
+        ym = args.mes
+    else:
+        df, ym = _synthetic_df(args.rows, args.units, args.months, args.extra_cols)
+        ym = args.mes or ym
+
+    uni_col = map_columns(df, warn_missing=False).get("Unidade")
+    units = list(dict.fromkeys(df[uni_col].dropna().astype(str)))
+    baseline_rss = _peak_rss_mb()
+
+    def workload() -> int:
+        rows = 0
+        if args.scenario == "batch":
+            from processor import prepare_all_units
+            for result in prepare_all_units(RegionFrame(df), ym).values():
+                rows += len(result[0])
+        else:
+            source = RegionFrame(df) if args.scenario == "regionframe" else df
+            for unidade in units:
+                rows += len(filter_and_prepare(source, unidade, ym)[0])
+        return rows
+
+    # Tempo e RSS sem tracemalloc (que deixa o pandas bem mais lento)
+    start = time.perf_counter()
+    rows = workload()
+    elapsed = time.perf_counter() - start
+    rss_peak = _peak_rss_mb()
+
+    tracemalloc.start()
+    workload()
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    has_rss = rss_peak is not None
+    return {
+        "scenario": args.scenario,
+        "units": len(units),
+        "rows": rows,
+        "seconds": round(elapsed, 3),
+        "traced_peak_mb": round(traced_peak / 2**20, 1),
+        "rss_peak_mb": round(rss_peak, 1) if has_rss else "-",
+        "rss_growth_mb": round(rss_peak - baseline_rss, 1) if has_rss else "-",
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pico de memória do processamento de uma região")
+    parser.add_argument("--root", default=ROOT_DIR, help="Raiz do projeto (processor.py) a medir")
+    parser.add_argument("--xlsx", help="Planilha real (senão usa uma sintética)")
+    parser.add_argument("--regiao", default="RJ")
+    parser.add_argument("--mes", help="Mês YYYY-MM (padrão: último mês da planilha sintética)")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--units", type=int, default=40)
+    parser.add_argument("--months", type=int, default=2)
+    parser.add_argument("--extra-cols", type=int, default=60)
+    parser.add_argument("--scenario", choices=SCENARIOS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scenario:
+        print(json.dumps(_run_scenario(args)))
+        return
+
+    print(f"Raiz: {args.root}")
+    print(f"{'cenário':<12} {'unid.':>6} {'linhas':>7} {'tempo s':>8} {'pico alloc MB':>14} {'pico RSS MB':>12} {'Δ RSS MB':>9}")
+    for scenario in SCENARIOS:
+        cmd = [sys.executable, os.path.abspath(__file__), "--scenario", scenario] + sys.argv[1:]
+        out = subprocess.run(cmd, capture_output=True, text=True, check=True).stdout
+        r = json.loads(out.strip().splitlines()[-1])
+        print(f"{r['scenario']:<12} {r['units']:>6} {r['rows']:>7} {r['seconds']:>8} "
+              f"{r['traced_peak_mb']:>14} {r['rss_peak_mb']:>12} {r['rss_growth_mb']:>9}")
+
+
+if __name__ == "__main__":
+    main()
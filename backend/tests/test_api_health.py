@@ -91,6 +91,13 @@ class TestTemplatesEndpoint:
         response = client.get("/api/templates/nonexistent_id")
         assert response.status_code == 404
 
+    def test_preview_html(self):
+        """Verifica o preview do template padrão (HTML completo)."""
+        response = client.get("/api/templates/email_template_dark/preview")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/html")
+        assert "Shopping Exemplo" in response.text
+
 
 class TestSchedulesEndpoint:
     """Testes para endpoints de agendamentos."""
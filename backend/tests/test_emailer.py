@@ -0,0 +1,263 @@
+"""
+Testes do emailer (módulo core da raiz).
+
+Testa:
+- KPIs calculados em Python (build_kpis): totais, mês anterior e ranking
+- Cache de textos de copy compilados (precompile_copy)
+- Registro de templates compartilhado (template_registry)
+- Render em lote (render_many) e em streaming (render_stream/render_to_file)
+- Manifesto de assets da logo (AssetManifest) e LOGO_MODE=cid
+"""
+
+import os
+
+import pandas as pd
+import pytest
+
+from app.core import ROOT_DIR, Emailer, build_monthly_cube, cube_totals, filter_and_prepare, money, prepare_all_units, utils
+import emailer  # noqa: E402 (raiz no sys.path via app.core)
+
+
+class TestBuildKpis:
+    """Testes para os KPIs passados prontos ao template."""
+
+    def test_totals_and_ranking(self):
+        """Soma as colunas das rows e ordena fornecedores pelo Valor Mensal Final."""
+        rows = [
+            {"Fornecedor": "A", "Valor Planilha": "R$ 1.000,00", "Valor Mensal Final": money.MoneyCell("R$ 900,00", 90000),
+             "Desconto SLA Mês": "R$ -100,00"},
+            {"Fornecedor": "B", "Valor Planilha": "", "Valor Mensal Final": money.MoneyCell("R$ 950,00", 95000)},
+            {"Fornecedor": "A", "Valor Mensal Final": "R$ 100,00", "Outros descontos": "Informação pendente"},
+        ]
+        kpis = emailer.build_kpis(rows)
+
+        assert kpis["vplanilha_total"] == 1000.0
+        assert kpis["vmf_total"] == 1950.0
+        assert kpis["desc_total"] == -100.0
+        assert kpis["fornecedores"] == [("A", 1000.0), ("B", 950.0)]
+        assert (kpis["top_fornecedor"], kpis["top_valor"]) == ("A", 1000.0)
+        assert kpis["vmf_prev"] is None and kpis["vmf_delta_pct"] is None
+
+    def test_summary_and_previous_month(self):
+        """Totais do sumário e do cubo têm prioridade sobre as rows."""
+        rows = [{"Valor Mensal Final": "R$ 10,00"}]
+        prev = {"sum_valor_planilha": 50.0, "sum_valor_mensal_final": 40.0, "sum_descontos_gerais": 0.0}
+        kpis = emailer.build_kpis(rows, {"sum_valor_mensal_final": 60.0}, prev_summary=prev)
+
+        assert kpis["vmf_total"] == 60.0
+        assert kpis["vmf_prev"] == 40.0
+        assert kpis["vmf_delta_pct"] == pytest.approx(40.0)
+        assert kpis["top_fornecedor"] == "—"
+
+    def test_previous_month_without_rows(self):
+        """Cubo sem linhas no mês anterior não vira comparação com zero."""
+        prev = {"row_count": 0, "sum_valor_planilha": 0.0, "sum_valor_mensal_final": 0.0, "sum_descontos_gerais": 0.0}
+        kpis = emailer.build_kpis([{"Valor Mensal Final": "R$ 10,00"}], prev_summary=prev)
+        assert kpis["vmf_prev"] is None and kpis["vmf_delta_pct"] is None
+        assert kpis["vplanilha_delta_pct"] is None and kpis["desc_delta_pct"] is None
+
+    @pytest.mark.parametrize("prepare", ["batch", "unit"])
+    def test_identical_months_with_reduced_columns(self, prepare):
+        """Mês atual (sumário) e anterior (cubo) somam as mesmas colunas, exibidas ou não."""
+        month = {
+            "Unidade": ["Bangu Shopping", "Bangu Shopping"],
+            "Fornecedor": ["Forn A", "Forn B"],
+            "Valor Planilha": ["1000", "R$ 2.000,50"],
+            "Valor Mensal Final": ["900", "1999.99"],
+            "Desconto SLA Mês": ["R$ 10,00", "5"],
+            "Desconto Equipamentos": ["R$ 3,00", ""],
+            "Desconto SLA Retroativo": ["150.5", "-"],
+            "E-mail": ["a@x.com", "b@x.com"],
+        }
+        df = pd.DataFrame({
+            **{k: v * 2 for k, v in month.items()},
+            "Mês de emissão da NF": ["12/2024", "12/2024", "01/2025", "01/2025"],
+        })
+        columns = ["Unidade", "Fornecedor", "Valor Mensal Final"]
+        if prepare == "batch":
+            rows, _rec, summary = prepare_all_units(df, "2025-01", {"Bangu Shopping": columns})["bangu shopping"]
+        else:
+            rows, _rec, summary = filter_and_prepare(df, "Bangu Shopping", "2025-01", columns)
+        prev = cube_totals(build_monthly_cube(df), "Bangu Shopping", "2024-12")
+
+        kpis = emailer.build_kpis(rows, summary, prev_summary=prev)
+        assert kpis["vplanilha_total"] == kpis["vplanilha_prev"] == pytest.approx(3000.5)
+        assert kpis["desc_total"] == kpis["desc_prev"] == pytest.approx(168.5)
+        for key in ("vmf_delta_pct", "vplanilha_delta_pct", "desc_delta_pct"):
+            assert kpis[key] == 0.0
+
+    def test_plain_cells_parsed_like_cube(self):
+        """Células sem MoneyCell seguem o parse BRL do cubo ("150.5" vale 150,50)."""
+        rows = [{"Desconto SLA Retroativo": "150.5", "Valor Planilha": "R$ 1.234,50"}, {"Desconto SLA Retroativo": "-"}]
+        kpis = emailer.build_kpis(rows)
+        assert (kpis["desc_total"], kpis["vplanilha_total"]) == (150.5, 1234.5)
+
+    def test_rows_prev_without_cube(self):
+        """Sem cubo, o mês anterior sai das rows_prev."""
+        kpis = emailer.build_kpis([], rows_prev=[{"Valor Planilha": "R$ 5,00", "Valor Mensal Final": "R$ 4,00"}])
+        assert (kpis["vplanilha_prev"], kpis["vmf_prev"], kpis["desc_prev"]) == (5.0, 4.0, 0.0)
+        assert kpis["fornecedores"] == [] and kpis["top_valor"] == 0.0
+
+
+class TestCopyTemplateCache:
+    """Testes para os textos de copy compilados uma única vez."""
+
+    def test_precompile_and_reuse(self):
+        """Padrões, .env e overrides são compilados antes; renders só reutilizam."""
+        em = Emailer(ROOT_DIR / "templates", ROOT_DIR / "assets", {"COPY_GREETING": "Olá {{ unidade }},"})
+        compiled = em.precompile_copy({"intro": "Texto do portal", "texto": "ignorado"})
+        assert compiled == len(Emailer.COPY_DEFAULTS) + 2
+
+        summary = {"row_count": 0, "sum_valor_mensal_final": 0.0}
+        misses = em._copy_template.cache_info().misses
+        html = em.render_html("Unidade X", "RJ", "2025-06", [], summary, copy_overrides={"intro": "Texto do portal"})
+        assert em._copy_template.cache_info().misses == misses
+        assert "Olá Unidade X," in html
+
+
+class TestTemplateRegistry:
+    """Testes para o Environment Jinja compartilhado por pasta de templates."""
+
+    def test_shared_between_emailers(self):
+        """Dois Emailer da mesma pasta usam o mesmo Environment e o mesmo LRU de copy."""
+        a = Emailer(ROOT_DIR / "templates", ROOT_DIR / "assets", {})
+        b = Emailer(ROOT_DIR / "templates" / ".." / "templates", ROOT_DIR / "assets", {})
+        assert a.jenv is b.jenv
+        assert a._copy_template is b._copy_template
+
+    def test_reload_on_template_change(self, tmp_path):
+        """Template editado é recompilado; o bytecode em disco não serve a versão antiga."""
+        templates = tmp_path / "templates"
+        templates.mkdir()
+        page = templates / "page.html"
+        page.write_text("v1 {{ x }}", encoding="utf-8")
+
+        registry = emailer.TemplateRegistry(templates, tmp_path / "bytecode")
+        assert registry.env.get_template("page.html").render(x=1) == "v1 1"
+        assert list((tmp_path / "bytecode").iterdir())
+
+        page.write_text("v2 {{ x }}", encoding="utf-8")
+        stat = page.stat()
+        os.utime(page, (stat.st_atime, stat.st_mtime + 5))
+        assert registry.env.get_template("page.html").render(x=1) == "v2 1"
+
+        # Processo novo (registro novo) com o bytecode em disco
+        fresh = emailer.TemplateRegistry(templates, tmp_path / "bytecode")
+        assert fresh.env.get_template("page.html").render(x=2) == "v2 2"
+
+
+class TestRenderMany:
+    """Testes para o render em lote com contexto compartilhado."""
+
+    PAYLOADS = [
+        {"unidade": f"Unidade {i}", "regiao": "RJ", "ym": "2025-06",
+         "rows": [{"Fornecedor": "A", "Valor Mensal Final": money.MoneyCell("R$ 10,00", 1000 * (i + 1))}],
+         "summary": {"row_count": 1, "sum_valor_mensal_final": 10.0 * (i + 1), "display_columns": ["Fornecedor", "Valor Mensal Final"]}}
+        for i in range(3)
+    ]
+
+    def test_same_html_as_render_html(self):
+        """render_many (no processo ou em pool) gera o mesmo HTML do render_html."""
+        em = Emailer(ROOT_DIR / "templates", ROOT_DIR / "assets", {})
+        batch = em.batch_context()
+        expected = [em.render_html(**p, batch=batch) for p in self.PAYLOADS]
+
+        em.today_str = lambda: batch.hoje
+        assert em.render_many(self.PAYLOADS) == expected
+        assert em.render_many(self.PAYLOADS, workers=2) == expected
+
+    def test_column_order_memoized(self):
+        """A ordem final das colunas é calculada uma vez por lista pedida."""
+        batch = Emailer(ROOT_DIR / "templates", ROOT_DIR / "assets", {}).batch_context()
+        cols = ["Fornecedor", "Mês de emissão da NF", "Valor Mensal Final"]
+        first = batch.column_order(cols)
+        assert batch.column_order(list(cols)) is first
+        assert first[-1] == "Mês de emissão da NF"
+
+
+class TestRenderStream:
+    """Testes para o HTML gerado em pedaços, sem o documento inteiro na memória."""
+
+    def test_stream_and_file_match_render_html(self, tmp_path):
+        """Pedaços do render_stream e o arquivo do render_to_file batem com o render_html."""
+        em = Emailer(ROOT_DIR / "templates", ROOT_DIR / "assets", {})
+        em.STREAM_CHUNK_SIZE = 1024
+        batch = em.batch_context()
+        payload = TestRenderMany.PAYLOADS[0]
+        html = em.render_html(**payload, batch=batch)
+
+        chunks = list(em.render_stream(**payload, batch=batch))
+        assert len(chunks) > 1 and "".join(chunks) == html
+
+        out = em.render_to_file(tmp_path / "u.html", **payload, batch=batch)
+        assert out.read_text(encoding="utf-8") == html
+        assert [p.name for p in tmp_path.iterdir()] == ["u.html"]
+
+    def test_render_many_to_paths(self, tmp_path):
+        """Com paths, render_many grava cada unidade no seu arquivo."""
+        em = Emailer(ROOT_DIR / "templates", ROOT_DIR / "assets", {})
+        paths = [tmp_path / f"{i}.html" for i in range(len(TestRenderMany.PAYLOADS))]
+        assert em.render_many(TestRenderMany.PAYLOADS, paths=paths) == paths
+        assert "Unidade 2" in paths[2].read_text(encoding="utf-8")
+        with pytest.raises(ValueError):
+            em.render_many(TestRenderMany.PAYLOADS, paths=paths[:1])
+
+
+class TestAssetManifest:
+    """Testes para a logo resolvida e codificada uma vez por mtime."""
+
+    PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 16
+
+    def test_resolution_follows_directory_changes(self, tmp_path):
+        """Logo nova na pasta é vista; conteúdo alterado gera outro data URI."""
+        manifest = emailer.AssetManifest(tmp_path)
+        assert manifest.logo_path({}) is None
+
+        logo = tmp_path / "logo.png"
+        logo.write_bytes(self.PNG)
+        os.utime(tmp_path, ns=(0, tmp_path.stat().st_mtime_ns + 10**9))
+        assert manifest.logo_path({}) == logo
+        first = utils.to_base64_image(logo)
+
+        logo.write_bytes(self.PNG + b"\x01")
+        assert utils.to_base64_image(logo) != first
+
+    def test_cid_mode_inlines_only_at_send_time(self, tmp_path):
+        """LOGO_MODE=cid deixa cid: no HTML salvo; inline_assets troca pelo data URI."""
+        (tmp_path / "logo.png").write_bytes(self.PNG)
+        em = Emailer(ROOT_DIR / "templates", tmp_path, {"LOGO_MODE": "cid", "LOGO_CID": "marca"})
+        html = em.render_html(**TestRenderMany.PAYLOADS[0])
+
+        assert "data:image/png;base64" not in html and 'src="cid:marca"' in html
+        sent = em.inline_assets(html)
+        assert "cid:marca" not in sent and sent.count("data:image/png;base64") == 2
+
+        inline = Emailer(ROOT_DIR / "templates", tmp_path, {}).render_html(**TestRenderMany.PAYLOADS[0])
+        assert "data:image/png;base64" in inline
+
+    def test_stream_html_file_inlines_split_reference(self, tmp_path, monkeypatch):
+        """stream_html_file lê em pedaços e troca cid: mesmo partido entre dois pedaços."""
+        (tmp_path / "logo.png").write_bytes(self.PNG)
+        em = Emailer(ROOT_DIR / "templates", tmp_path, {"LOGO_MODE": "cid", "LOGO_CID": "marca"})
+        html = em.render_html(**TestRenderMany.PAYLOADS[0])
+        path = tmp_path / "saida.html"
+        path.write_text(html, encoding="utf-8")
+
+        monkeypatch.setattr(Emailer, "STREAM_CHUNK_SIZE", 7)
+        chunks = list(em.stream_html_file(path))
+        assert len(chunks) > 1
+        assert "".join(chunks) == em.inline_assets(html)
+        joined = "".join(em.inline_asset_chunks(['<img src="ci', "d:mar", 'ca"> cid:m']))
+        assert joined.startswith('<img src="data:image/png;base64') and joined.endswith('"> cid:m')
+
+        with pytest.raises(FileNotFoundError):
+            em.stream_html_file(tmp_path / "inexistente.html")
+
+    def test_pipeline_passes_logo_settings(self, monkeypatch):
+        """O PipelineService repassa LOGO_MODE/LOGO_CID ao Emailer, como jobs e CLI."""
+        from app.services.pipeline_service import PipelineService
+
+        monkeypatch.setenv("LOGO_MODE", "cid")
+        monkeypatch.setenv("LOGO_CID", "marca")
+        em = PipelineService().emailer
+        assert (em.logo_mode(), em.logo_cid()) == ("cid", "marca")
@@ -0,0 +1,422 @@
+"""
+Testes do extractor (módulo core da raiz).
+
+Testa:
+- Snapshot em disco das abas regionais (chave caminho + mtime + tamanho)
+- Leitura em streaming (engine="stream") equivalente ao pandas
+- Decodificação direta do XLSX (engine="fast") e leitura de várias abas
+- Cache em memória limitado por bytes (SheetCache)
+- Catálogo de abas lido do xl/workbook.xml
+- Índice de planilhas por pasta (WorkbookIndex)
+- RegionFrames do PipelineService por versão do arquivo
+- Extração tipada (typed=True)
+- Colunas de texto categóricas (categorical=True)
+"""
+
+import datetime as dt
+import os
+
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+
+from app.core import Extractor, SheetCache, WorkbookIndex, read_sheet_names
+
+
+def _write_workbook(path, valor="1000"):
+    """Cria planilha mínima com a aba 'Faturamento RJ'."""
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Faturamento RJ"
+    ws.append(["Unidade", " Valor\nPlanilha ", "Mês de emissão da NF"])
+    ws.append(["Bangu Shopping", valor, "2025-01"])
+    ws.append(["Carioca Shopping", None, "2025-01"])
+    wb.save(path)
+
+
+@pytest.fixture
+def workbook(tmp_path):
+    path = tmp_path / "planilha Medição Mensal_RJ_2025.xlsx"
+    _write_workbook(path)
+    return path
+
+
+class TestSheetSnapshots:
+    """Testes para o cache em disco das abas."""
+
+    def test_snapshot_reused_by_new_extractor(self, workbook, tmp_path, monkeypatch):
+        """Um Extractor novo deve ler o snapshot em vez do XLSX."""
+        snap_dir = tmp_path / "snapshots"
+        df, sheet = Extractor(workbook.parent, snapshot_dir=snap_dir).read_region_sheet(workbook, "RJ")
+        assert len(list(snap_dir.iterdir())) == 1
+
+        def _fail(*args, **kwargs):
+            raise AssertionError("XLSX relido apesar do snapshot")
+
+        monkeypatch.setattr("extractor.pd.read_excel", _fail)
+        monkeypatch.setattr("extractor.pd.ExcelFile", _fail)
+        df2, sheet2 = Extractor(workbook.parent, snapshot_dir=snap_dir).read_region_sheet(workbook, "RJ")
+
+        assert sheet2 == sheet == "Faturamento RJ"
+        assert list(df2.columns) == ["Unidade", "Valor Planilha", "Mês de emissão da NF"]
+        assert df2.equals(df)
+
+    def test_changed_file_invalidates_snapshot(self, workbook, tmp_path):
+        """Arquivo alterado deve ser relido e o snapshot antigo removido."""
+        snap_dir = tmp_path / "snapshots"
+        Extractor(workbook.parent, snapshot_dir=snap_dir).read_region_sheet(workbook, "RJ")
+        old_files = set(snap_dir.iterdir())
+
+        _write_workbook(workbook, valor="2500")
+        st = workbook.stat()
+        os.utime(workbook, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+        df, _ = Extractor(workbook.parent, snapshot_dir=snap_dir).read_region_sheet(workbook, "RJ")
+        assert df["Valor Planilha"].tolist() == ["2500", ""]
+        new_files = set(snap_dir.iterdir())
+        assert len(new_files) == 1 and new_files != old_files
+
+    def test_use_cache_false_skips_snapshot(self, workbook, tmp_path):
+        """use_cache=False não lê nem grava snapshots."""
+        snap_dir = tmp_path / "snapshots"
+        Extractor(workbook.parent, snapshot_dir=snap_dir).read_region_sheet(workbook, "RJ", use_cache=False)
+        assert not snap_dir.exists()
+
+
+@pytest.fixture
+def edge_workbook(tmp_path):
+    """Planilha com cabeçalhos duplicados/vazios, tipos variados e linhas formatadas vazias."""
+    path = tmp_path / "planilha Medição Mensal_RJ_2025.xlsx"
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Faturamento RJ"
+    ws.append(["Unidade", "Valor", "Valor", None, 2025, " Mês de emissão\nda NF ", "Valor.1", "Coluna Inutil"])
+    ws.append(["A", 1.0, 2, 3.25, True, dt.datetime(2025, 1, 1), "n/a", " x "])
+    ws.append([None] * 8)
+    ws.append(["B", 1e16, "NA", -0.0, "null", dt.date(2025, 2, 3), dt.time(12, 30), None, "além do cabeçalho"])
+    for row in range(6, 200):
+        ws.cell(row=row, column=3).number_format = "0.00"
+    wb.save(path)
+    return path
+
+
+def _read(path, engine, tmp_path):
+    extractor = Extractor(path.parent, engine=engine, snapshot_dir=tmp_path / "snapshots")
+    return extractor.read_region_sheet(path, "RJ", use_cache=False)
+
+
+class TestStreamingReader:
+    """Testes para os engines alternativos ("stream" e "fast")."""
+
+    @pytest.mark.parametrize("engine", ["stream", "fast"])
+    def test_same_dataframe_as_pandas(self, edge_workbook, tmp_path, engine):
+        """Deve produzir exatamente o DataFrame da leitura via pandas."""
+        expected, _ = _read(edge_workbook, "pandas", tmp_path)
+        result, sheet = _read(edge_workbook, engine, tmp_path)
+
+        assert sheet == "Faturamento RJ"
+        assert list(result.columns) == list(expected.columns)
+        assert result.equals(expected)
+        assert result["Valor"].tolist() == ["1", "", "10000000000000000"]
+
+    def test_prune_columns(self, edge_workbook, tmp_path):
+        """prune_columns mantém só as colunas do catálogo e as pedidas."""
+        extractor = Extractor(edge_workbook.parent, snapshot_dir=tmp_path / "snapshots")
+
+        df, _ = extractor.read_region_sheet(edge_workbook, "RJ", prune_columns=True)
+        assert list(df.columns) == ["Unidade", "Mês de emissão da NF"]
+
+        df, _ = extractor.read_region_sheet(edge_workbook, "RJ", prune_columns=True, keep_columns=["Coluna Inutil"])
+        assert list(df.columns) == ["Unidade", "Mês de emissão da NF", "Coluna Inutil"]
+        assert df["Coluna Inutil"].tolist() == ["x", "", ""]
+
+    @pytest.mark.parametrize("engine", ["stream", "fast"])
+    def test_numeric_column_without_blanks(self, tmp_path, engine):
+        """Coluna só com números mistura int/float como o pandas (1 vira "1.0")."""
+        path = tmp_path / "planilha Medição Mensal_RJ_2025.xlsx"
+        wb = Workbook()
+        ws = wb.active
+        ws.title = "Faturamento RJ"
+        ws.append(["Unidade", "Pct", "Qtd", "Quando"])
+        ws.append(["A", 0.125, 2, dt.datetime(2025, 1, 1)])
+        ws.append(["B", 1.0, 3, dt.datetime(2025, 2, 1)])
+        wb.save(path)
+
+        expected, _ = _read(path, "pandas", tmp_path)
+        result, _ = _read(path, engine, tmp_path)
+
+        assert result.equals(expected)
+        assert result["Pct"].tolist() == ["0.125", "1.0"]
+        assert result["Qtd"].tolist() == ["2", "3"]
+
+    def test_read_region_sheets_parallel(self, edge_workbook, tmp_path):
+        """Várias abas do mesmo arquivo, decodificadas em processos, iguais à leitura individual."""
+        from openpyxl import load_workbook
+
+        wb = load_workbook(edge_workbook)
+        wb.copy_worksheet(wb["Faturamento RJ"]).title = "Faturamento SP1"
+        wb.save(edge_workbook)
+
+        extractor = Extractor(edge_workbook.parent, snapshot_dir=tmp_path / "snapshots")
+        result = extractor.read_region_sheets(edge_workbook, ["RJ", "SP1"], use_cache=False, workers=2)
+
+        assert {r: sheet for r, (_df, sheet) in result.items()} == {"RJ": "Faturamento RJ", "SP1": "Faturamento SP1"}
+        expected, _ = _read(edge_workbook, "pandas", tmp_path)
+        assert result["SP1"][0].equals(expected)
+
+
+class TestSheetCache:
+    """Testes para o LRU em memória das abas."""
+
+    def test_hits_misses_and_file_change(self, workbook, tmp_path):
+        """Arquivo alterado não deve servir a aba antiga."""
+        cache = SheetCache(max_bytes=10 * 1024 * 1024)
+        extractor = Extractor(workbook.parent, snapshot_dir=tmp_path / "snapshots", cache=cache)
+
+        df, _ = extractor.read_region_sheet(workbook, "RJ")
+        assert extractor.read_region_sheet(workbook, "RJ")[0].equals(df)
+        assert cache.stats()["hits"] == 1
+
+        _write_workbook(workbook, valor="2500")
+        st = workbook.stat()
+        os.utime(workbook, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+        df2, _ = extractor.read_region_sheet(workbook, "RJ")
+        assert df2["Valor Planilha"].tolist() == ["2500", ""]
+        # A versão antiga do arquivo foi descartada
+        assert cache.stats()["entries"] == 2  # aba + nomes de abas
+
+    def test_byte_budget_evicts_least_recent(self, tmp_path):
+        """Ao passar do limite, sai a entrada usada há mais tempo."""
+        files = []
+        for i in range(3):
+            path = tmp_path / f"f{i}.xlsx"
+            path.write_bytes(b"x")
+            files.append(path)
+        df = pd.DataFrame({"a": ["x" * 100] * 10})
+        size = int(df.memory_usage(index=True, deep=True).sum())
+        cache = SheetCache(max_bytes=size * 2 + 200)
+
+        cache.put(files[0], "sheet:RJ", df)
+        cache.put(files[1], "sheet:RJ", df)
+        assert cache.get(files[0], "sheet:RJ").equals(df)  # f0 passa a ser o mais recente
+        cache.put(files[2], "sheet:RJ", df)
+
+        assert cache.get(files[1], "sheet:RJ") is None
+        assert cache.get(files[0], "sheet:RJ").equals(df)
+        stats = cache.stats()
+        assert stats["evictions"] == 1
+        assert stats["bytes"] <= stats["max_bytes"]
+
+    def test_invalidate(self, workbook, tmp_path):
+        """invalidate(path) remove só as entradas do arquivo."""
+        cache = SheetCache()
+        other = tmp_path / "outro.xlsx"
+        other.write_bytes(b"x")
+        cache.put(workbook, "sheet:RJ", ("a", "b"))
+        cache.put(other, "sheet:RJ", ("c", "d"))
+
+        assert cache.invalidate(workbook) == 1
+        assert cache.get(workbook, "sheet:RJ") is None
+        assert cache.get(other, "sheet:RJ") == ("c", "d")
+
+    def test_hits_are_copies(self, workbook, tmp_path):
+        """Alterar a aba recebida não muda o que o cache entrega depois."""
+        extractor = Extractor(workbook.parent, snapshot_dir=tmp_path / "snapshots", cache=SheetCache())
+
+        df, _ = extractor.read_region_sheet(workbook, "RJ")
+        df.loc[0, "Valor Planilha"] = "999"
+        df["extra"] = 1
+        again, _ = extractor.read_region_sheet(workbook, "RJ")
+
+        assert again is not df
+        assert "extra" not in again.columns
+        assert again.loc[0, "Valor Planilha"] != "999"
+
+    def test_clear_cache_scoped_to_instance(self, workbook, tmp_path):
+        """clear_cache() só tira o que o Extractor leu; clear_sheet_cache() esvazia o compartilhado."""
+        from extractor import clear_sheet_cache, shared_sheet_cache
+
+        cache = SheetCache()
+        other = tmp_path / "outro.xlsx"
+        other.write_bytes(b"x")
+        cache.put(other, "sheet:SP1", ("c", "d"))
+        extractor = Extractor(workbook.parent, snapshot_dir=tmp_path / "snapshots", cache=cache)
+        extractor.read_region_sheet(workbook, "RJ")
+
+        assert extractor.clear_cache() == 2  # aba + nomes de abas
+        assert cache.get(other, "sheet:SP1") == ("c", "d")
+
+        shared_sheet_cache().put(other, "sheet:SP1", ("c", "d"))
+        clear_sheet_cache()
+        assert shared_sheet_cache().stats()["entries"] == 0
+
+
+class TestPipelineFrames:
+    """Testes para os RegionFrames reaproveitados pelo PipelineService."""
+
+    def test_keyed_by_file_version_and_bounded(self, workbook, tmp_path, monkeypatch):
+        """Arquivo regravado gera frame novo; o antigo sai pelo limite e invalidate_workbook limpa tudo."""
+        from app.core import invalidate_workbook
+        from app.services.pipeline_service import PipelineService
+
+        service = PipelineService()
+        service.extractor = service.extractor_uploads = Extractor(workbook.parent, snapshot_dir=tmp_path / "snapshots")
+        monkeypatch.setattr(service, "FRAMES_CACHE_SIZE", 1)
+
+        frame, error = service._load_region_frame("RJ")
+        assert error is None
+        assert service._load_region_frame("RJ")[0] is frame
+
+        _write_workbook(workbook, valor="2500")
+        st = workbook.stat()
+        os.utime(workbook, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+        fresh, _ = service._load_region_frame("RJ")
+        assert fresh is not frame
+        assert fresh.df["Valor Planilha"].tolist() == ["2500", ""]
+        assert list(service._frames.values()) == [fresh]
+
+        invalidate_workbook(workbook)
+        assert not service._frames
+
+
+class TestSheetCatalog:
+    """Testes para a leitura dos nomes de abas."""
+
+    def test_reads_names_without_opening_workbook(self, workbook, monkeypatch):
+        """Deve ler os nomes só do workbook.xml, sem pandas/openpyxl."""
+        def _fail(*args, **kwargs):
+            raise AssertionError("workbook aberto para listar abas")
+
+        monkeypatch.setattr("extractor.pd.ExcelFile", _fail)
+        assert read_sheet_names(workbook, SheetCache()) == ("Faturamento RJ",)
+
+    def test_unreadable_file(self, tmp_path):
+        """Arquivo que não é planilha retorna tupla vazia."""
+        path = tmp_path / "falso.xlsx"
+        path.write_bytes(b"PK\x03\x04" + b"\x00" * 100)
+        assert read_sheet_names(path, SheetCache()) == ()
+
+    def test_find_workbook_and_available_regions(self, workbook, tmp_path):
+        """Arquivo com nome fora do padrão é achado pela aba."""
+        renamed = workbook.rename(tmp_path / "outro_nome.xlsx")
+        extractor = Extractor(tmp_path, cache=SheetCache())
+
+        assert extractor.find_workbook("RJ") == renamed
+        assert extractor.find_workbook("SP1") is None
+        assert extractor.available_regions(["RJ", "SP1"]) == ["RJ"]
+
+
+class TestWorkbookIndex:
+    """Testes para o índice de planilhas da pasta."""
+
+    def _touch(self, path, mtime):
+        path.write_bytes(b"x")
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def test_pattern_priority_and_newest(self, tmp_path):
+        """Primeiro padrão com resultados vence; dentro dele, o mais recente."""
+        self._touch(tmp_path / "planilha Medição Mensal_RJ_2024.xlsx", 2000)
+        newest = self._touch(tmp_path / "planilha Medição Mensal_RJ_2025.xlsx", 3000)
+        self._touch(tmp_path / "Medição RJ revisada.xlsx", 9000)
+        self._touch(tmp_path / "~$planilha Medição Mensal_RJ_2026.xlsx", 9999)
+
+        index = WorkbookIndex(tmp_path)
+        assert index.find("RJ") == newest
+        assert index.find("SP1") is None
+        assert len(index.files()) == 3
+
+    def test_refresh_picks_up_new_file(self, tmp_path):
+        """Arquivo novo aparece após refresh() (evento de upload)."""
+        self._touch(tmp_path / "planilha Medição Mensal_RJ_2024.xlsx", 2000)
+        index = WorkbookIndex(tmp_path)
+        index.find("RJ")
+
+        novo = self._touch(tmp_path / "planilha Medição Mensal_RJ_2025.xlsx", 3000)
+        index.refresh()
+        assert index.find("RJ") == novo
+
+    def test_case_follows_platform(self, tmp_path, monkeypatch):
+        """Com normcase do Windows, região e nome do arquivo casam sem distinção de caixa."""
+        self._touch(tmp_path / "medição mensal_RJ.xlsx", 2000)
+        newest = self._touch(tmp_path / "Medição Mensal_RJ.XLSX", 3000)
+        assert WorkbookIndex(tmp_path).find("rj") is None
+
+        monkeypatch.setattr(os.path, "normcase", lambda s: s.replace("/", "\\").lower())
+        assert WorkbookIndex(tmp_path).find("rj") == newest
+
+
+class TestTypedExtraction:
+    """Testes para a extração tipada das colunas de valor e mês."""
+
+    @pytest.fixture
+    def typed_workbook(self, tmp_path):
+        path = tmp_path / "planilha Medição Mensal_RJ_2025.xlsx"
+        wb = Workbook()
+        ws = wb.active
+        ws.title = "Faturamento RJ"
+        ws.append(["Unidade", "Valor Mensal Final", "Mês de emissão da NF", "HC Planilha"])
+        ws.append([" Bangu ", 1500.5, dt.datetime(2025, 1, 1), 2])
+        ws.append(["Carioca", None, "02/2025", 3.0])
+        ws.append(["Norte", "R$ 10,00", 45717, None])
+        wb.save(path)
+        return path
+
+    @pytest.mark.parametrize("engine", ["pandas", "stream", "fast"])
+    def test_native_values_in_money_and_month_columns(self, typed_workbook, tmp_path, engine):
+        """Valor e mês ficam nativos; demais colunas continuam texto."""
+        extractor = Extractor(typed_workbook.parent, engine=engine, snapshot_dir=tmp_path / "snapshots", typed=True)
+        df, _ = extractor.read_region_sheet(typed_workbook, "RJ", use_cache=False)
+
+        assert df["Valor Mensal Final"].tolist() == [1500.5, "", "R$ 10,00"]
+        assert df["Mês de emissão da NF"].tolist() == [dt.datetime(2025, 1, 1), "02/2025", 45717]
+        assert df["Unidade"].tolist() == ["Bangu", "Carioca", "Norte"]
+        assert df["HC Planilha"].tolist() == ["2", "3", ""]
+
+    def test_typed_and_text_reads_cached_separately(self, typed_workbook, tmp_path):
+        """Leituras tipada e texto da mesma aba não compartilham cache."""
+        extractor = Extractor(typed_workbook.parent, snapshot_dir=tmp_path / "snapshots", cache=SheetCache())
+        text, _ = extractor.read_region_sheet(typed_workbook, "RJ")
+        typed, _ = extractor.read_region_sheet(typed_workbook, "RJ", typed=True)
+
+        assert text["Valor Mensal Final"].tolist()[0] == "1500.5"
+        assert typed["Valor Mensal Final"].tolist()[0] == 1500.5
+
+
+class TestCategoricalExtraction:
+    """Testes para as colunas de texto categóricas."""
+
+    @pytest.fixture
+    def repeated_workbook(self, tmp_path):
+        path = tmp_path / "planilha Medição Mensal_RJ_2025.xlsx"
+        wb = Workbook()
+        ws = wb.active
+        ws.title = "Faturamento RJ"
+        ws.append(["Unidade", "Valor Mensal Final", "Mês de emissão da NF", "Funcionário"])
+        for i in range(6):
+            ws.append(["Bangu" if i % 2 else "Carioca", 100 + i, "01/2025", f"Pessoa {i}"])
+        wb.save(path)
+        return path
+
+    @pytest.mark.parametrize("engine", ["pandas", "stream", "fast"])
+    def test_low_cardinality_text_becomes_category(self, repeated_workbook, tmp_path, engine):
+        """Texto repetitivo vira Categorical com os mesmos valores; colunas distintas continuam object."""
+        extractor = Extractor(repeated_workbook.parent, engine=engine, snapshot_dir=tmp_path / "snapshots", categorical=True)
+        df, _ = extractor.read_region_sheet(repeated_workbook, "RJ", use_cache=False)
+        text, _ = _read(repeated_workbook, engine, tmp_path)
+
+        assert df["Unidade"].dtype == "category"
+        assert df["Mês de emissão da NF"].dtype == "category"
+        assert df["Funcionário"].dtype == object
+        assert df["Valor Mensal Final"].dtype == object
+        assert df.astype(object).equals(text)
+
+    def test_categorical_and_text_reads_cached_separately(self, repeated_workbook, tmp_path):
+        """Leituras categórica e texto da mesma aba não compartilham cache."""
+        extractor = Extractor(repeated_workbook.parent, snapshot_dir=tmp_path / "snapshots", cache=SheetCache())
+        text, _ = extractor.read_region_sheet(repeated_workbook, "RJ")
+        categorical, _ = extractor.read_region_sheet(repeated_workbook, "RJ", categorical=True)
+
+        assert text["Unidade"].dtype == object
+        assert categorical["Unidade"].dtype == "category"
@@ -0,0 +1,107 @@
+"""
+Testes do money (módulo core da raiz).
+
+Testa:
+- Conversão em lote para centavos (parse_cents), igual ao Decimal/parse BRL
+- Formatação BRL em lote (format_brl_cents), igual a fmt_brl
+- Células monetárias (MoneyCell): texto de exibição com centavos
+"""
+
+import json
+import pickle
+from decimal import Decimal, ROUND_HALF_UP
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.core import money, utils
+
+
+VALUES = [
+    "1000", "2000.5", "100.125", "-100.125", "0.005", "-0.004", " 12.3 ", "+7", ".5", "5.",
+    "1e3", "1_000", 1500, 1500.75, 0.1 + 0.2, Decimal("3.335"), None, np.nan,
+]
+
+
+class TestParseCents:
+    """Testes para a conversão de colunas em centavos."""
+
+    def test_decimal_mode_matches_decimal(self):
+        """Números simples, notação científica e Decimal seguem Decimal(str(x)) arredondado."""
+        series = pd.Series(VALUES, dtype=object)
+        cents, failed = money.parse_cents(series)
+
+        for value, c in zip(VALUES, cents.tolist()):
+            if value is None or (isinstance(value, float) and np.isnan(value)):
+                assert c == 0
+                continue
+            expected = Decimal(str(value)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+            assert c == int(expected * 100), value
+        assert not failed.any()
+
+    def test_failures_from_mask(self):
+        """Texto não numérico vale 0 e é marcado como falha (ausentes não)."""
+        series = pd.Series(["10", "", "R$ 51.020,50", "abc", None, True], dtype=object)
+        cents, failed = money.parse_cents(series)
+
+        assert cents.tolist() == [1000, 0, 0, 0, 0, 0]
+        assert failed.tolist() == [False, True, True, True, False, True]
+
+    def test_brl_mode_matches_parse_brl(self):
+        """Modo BRL aceita "R$ 1.234,50", parênteses e afins como _coerce_decimal_for_brl."""
+        values = ["R$ 1.234,50", "(R$ 10,00)", "1.234.567,891", "12,5", "- 3,00", "R$", "", "1500", 99.999]
+        cents, failed = money.parse_cents(pd.Series(values, dtype=object), brl=True)
+
+        for value, c in zip(values, cents.tolist()):
+            dec = utils._coerce_decimal_for_brl(value)
+            expected = 0 if dec is None else int(dec.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP) * 100)
+            assert c == expected, value
+        assert not failed.any()
+
+    def test_integer_dtype(self):
+        """Coluna int64 vira centavos sem passar por texto."""
+        cents, _ = money.parse_cents(pd.Series([1, -2, 300]))
+        assert cents.tolist() == [100, -200, 30000]
+
+
+class TestFormatBrlCents:
+    """Testes para a formatação BRL em lote."""
+
+    @pytest.mark.parametrize("cents", [0, 1, 99, 100, 123456, -123456, 100000000, -5])
+    def test_same_as_fmt_brl(self, cents):
+        """Deve produzir o mesmo texto de fmt_brl."""
+        expected = utils.fmt_brl(Decimal(cents) / 100)
+        assert money.format_brl_cents(np.array([cents])) == [expected]
+
+    def test_sum_is_cent_exact(self):
+        """Somas em centavos não acumulam erro de ponto flutuante."""
+        cents, _ = money.parse_cents(pd.Series(["0.1"] * 10 + ["0.2"] * 10, dtype=object))
+        assert money.cents_to_float(cents.sum()) == 3.0
+
+
+class TestMoneyCell:
+    """Testes para as células monetárias das rows."""
+
+    def test_behaves_as_text(self):
+        """É o próprio texto BRL para template/JSON, com os centavos ao lado."""
+        cell = money.money_cells(np.array([123450]))[0]
+        assert cell == "R$ 1.234,50"
+        assert cell.cents == 123450 and cell.value == 1234.5
+        assert json.dumps({"v": cell}) == '{"v": "R$ 1.234,50"}'
+
+        copy = pickle.loads(pickle.dumps(cell))
+        assert isinstance(copy, money.MoneyCell) and copy.cents == 123450
+
+    @pytest.mark.parametrize("cents", [0, 5, -5, 100000, -123456789])
+    def test_brl_cell_round_trip(self, cents):
+        """Texto de fmt_brl vira MoneyCell com os mesmos centavos."""
+        cell = money.brl_cell(utils.fmt_brl(Decimal(cents) / 100))
+        assert isinstance(cell, money.MoneyCell)
+        assert cell.cents == cents
+
+    @pytest.mark.parametrize("text", ["R$ 1234,50", "R$ 1.234,5", "R$ 01,00", "R$ -0,00", "Preenchimento pendente"])
+    def test_brl_cell_keeps_other_text(self, text):
+        """Textos fora do formato exato continuam texto simples."""
+        cell = money.brl_cell(text)
+        assert cell == text and not isinstance(cell, money.MoneyCell)
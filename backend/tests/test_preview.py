@@ -68,6 +68,22 @@ class TestPreviewView:
         # Depende da implementação
         assert response.status_code in [400, 404]
 
+    
+    def test_view_file_streamed(self, client: TestClient, tmp_path, monkeypatch):
+        """Arquivo gerado é enviado em pedaços, com o conteúdo completo."""
+        from app.routers import preview
+
+        html = "<html><body>" + "x" * 200000 + "</body></html>"
+        (tmp_path / "Unidade_2024-11.html").write_text(html, encoding="utf-8")
+        monkeypatch.setattr(preview, "OUTPUT_HTML_PATH", tmp_path)
+
+        response = client.get("/preview/files/Unidade_2024-11.html")
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/html")
+        assert "content-length" not in response.headers
+        assert response.text == html
+
 
 class TestPreviewDelete:
     """Testes para exclusão de arquivos."""
@@ -0,0 +1,374 @@
+"""
+Testes do processor (módulo core da raiz).
+
+Testa:
+- RegionFrame equivalente a filter_and_prepare sobre o DataFrame
+- Cubo mensal (build_monthly_cube / cube_totals)
+- Preparação em lote (prepare_all_units)
+- Colunas já tipadas (extração tipada)
+- Parse de mês por coluna (parse_year_month_series)
+- Formatação de Horas Atrasos por coluna
+- Mapeamento de colunas memoizado por layout de cabeçalho
+- Colunas categóricas (Extractor categorical=True)
+- Diretório de destinatários por planilha (RecipientDirectory)
+- Modos de preparação (summary/rows) e plano de colunas
+"""
+
+import datetime as dt
+
+import pytest
+import pandas as pd
+
+from app.core import RecipientDirectory, RegionFrame, build_monthly_cube, cube_totals, filter_and_prepare, prepare_all_units, utils
+import processor
+
+
+@pytest.fixture
+def region_df():
+    """Aba regional simulada (valores já como texto, igual ao Extractor)."""
+    return pd.DataFrame({
+        "Unidade": ["Bangu Shopping", "bangu  shopping", "Carioca Shopping", "Bangu Shopping", "Carioca Shopping"],
+        "Fornecedor": ["Forn A", "Forn B", "Forn A", "Forn A", "Forn C"],
+        "Horas Atrasos": ["1:30", "4h 30m", "", "2,5", "0:45"],
+        "Valor Planilha": ["1000", "2000.5", "300", "10", "R$ 1.234,50"],
+        "Valor Mensal Final": ["900", "1999.99", "250", "5", "100.125"],
+        "Mês de emissão da NF": ["2025-01-01 00:00:00", "01/2025", "Janeiro/2025", "2024-12", "15/01/2025"],
+        "Desconto SLA Mês": ["R$ 10,00", "", "5", "1.5", "-"],
+        "E-mail": ["a@x.com; b@x.com", "B@x.com", "c@y.com", "old@x.com", "invalido"],
+    })
+
+
+class TestRegionFrame:
+    """Testes para a planilha indexada por unidade/mês."""
+
+    @pytest.mark.parametrize("unidade,ym", [
+        ("Bangu Shopping", "2025-01"),
+        ("BANGU SHOPPING", "2024-12"),
+        ("Carioca Shopping", "2025-01"),
+        ("Carioca Shopping", "2024-12"),
+        ("Inexistente", "2025-01"),
+    ])
+    def test_equivalent_to_dataframe(self, region_df, unidade, ym):
+        """Deve produzir o mesmo resultado que a consulta direta no DataFrame."""
+        frame = RegionFrame(region_df)
+
+        expected = filter_and_prepare(region_df, unidade, ym)
+        result = filter_and_prepare(frame, unidade, ym)
+
+        assert result[0] == expected[0]
+        assert result[1] == expected[1]
+        assert result[2]["row_count"] == expected[2]["row_count"]
+        assert result[2]["sum_valor_mensal_final"] == expected[2]["sum_valor_mensal_final"]
+
+    def test_months(self, region_df):
+        """Deve listar os meses disponíveis, do mais recente ao mais antigo."""
+        assert RegionFrame(region_df).months == ["2025-01", "2024-12"]
+
+    def test_does_not_mutate_source(self, region_df):
+        """Consultas não devem alterar o DataFrame original."""
+        before = region_df.copy()
+        frame = RegionFrame(region_df)
+        frame.filter_and_prepare("Bangu Shopping", "2025-01")
+        pd.testing.assert_frame_equal(region_df, before)
+
+    def test_copies_only_plan_columns(self, region_df):
+        """Só as colunas usadas pelas rows são recortadas; a planilha não muda."""
+        before = region_df.copy()
+        rows, _, _ = filter_and_prepare(region_df, "Bangu Shopping", "2025-01", columns_whitelist=["Fornecedor"])
+        pd.testing.assert_frame_equal(region_df, before)
+        assert list(rows[0]) == ["Fornecedor", "Valor Mensal Final", "Mês de emissão da NF"]
+
+        dfu = processor._take_rows(region_df, [3, 0], ["Unidade", "E-mail"])
+        assert list(dfu.columns) == ["Unidade", "E-mail"]
+        assert dfu.index.tolist() == [3, 0]
+
+
+    def test_prepared_months_bounded(self, region_df, monkeypatch):
+        """Só os meses usados mais recentemente ficam formatados em cache."""
+        monkeypatch.setattr(RegionFrame, "MONTHS_CACHE_SIZE", 2)
+        frame = RegionFrame(region_df)
+        first = frame.prepare_month("2025-01")
+        frame.prepare_month("2024-12")
+        assert frame.prepare_month("2025-01") is first  # volta a ser o mais recente
+        frame.prepare_month("2024-11")
+
+        assert list(frame._months_prepared) == ["2025-01", "2024-11"]
+
+
+class TestMonthlyCube:
+    """Testes para o cubo unidade × mês usado nos KPIs."""
+
+    def test_totals_match_filter_and_prepare(self, region_df):
+        """Contagem e Valor Mensal Final devem bater com o sumário de filter_and_prepare."""
+        frame = RegionFrame(region_df)
+        cube = build_monthly_cube(frame)
+
+        for unidade, ym in [("Bangu Shopping", "2025-01"), ("Carioca Shopping", "2025-01"), ("Bangu Shopping", "2024-12")]:
+            _rows, _rec, summary = filter_and_prepare(frame, unidade, ym)
+            totals = cube_totals(cube, unidade, ym)
+            assert totals["row_count"] == summary["row_count"]
+            assert totals["sum_valor_mensal_final"] == pytest.approx(summary["sum_valor_mensal_final"])
+
+    def test_money_and_discounts(self, region_df):
+        """Valores monetários seguem o parse BRL; vazios contam como zero."""
+        totals = cube_totals(build_monthly_cube(region_df), "Bangu Shopping", "2025-01")
+        assert totals["sum_valor_planilha"] == pytest.approx(3000.5)
+        assert totals["sum_descontos_gerais"] == pytest.approx(10.0)
+        assert totals["descontos"] == {"Desconto SLA Mês": pytest.approx(10.0)}
+
+    def test_ytd_and_missing_unit(self, region_df):
+        """Somas de vários meses acumulam; unidade inexistente retorna zeros."""
+        cube = build_monthly_cube(region_df)
+        ytd = cube_totals(cube, "Bangu Shopping", ["2024-12", "2025-01"])
+        assert ytd["row_count"] == 3
+        assert ytd["sum_valor_mensal_final"] == pytest.approx(2904.99)
+
+        empty = cube_totals(cube, "Inexistente", "2025-01")
+        assert empty["row_count"] == 0
+        assert empty["sum_valor_mensal_final"] == 0.0
+
+
+class TestPrepareAllUnits:
+    """Testes para a preparação de todas as unidades de um mês."""
+
+    def test_equivalent_to_filter_and_prepare(self, region_df):
+        """Cada unidade deve sair igual à consulta individual."""
+        result = prepare_all_units(region_df, "2025-01")
+
+        assert set(result) == {"bangu shopping", "carioca shopping"}
+        for unidade in ["Bangu Shopping", "Carioca Shopping"]:
+            expected = filter_and_prepare(region_df, unidade, "2025-01")
+            rows, recipients, summary = result[unidade.lower()]
+            assert rows == expected[0]
+            assert recipients == expected[1]
+            assert summary["row_count"] == expected[2]["row_count"]
+
+    def test_whitelist_selects_units(self, region_df):
+        """Com colunas por unidade, só as unidades pedidas são preparadas."""
+        frame = RegionFrame(region_df)
+        result = prepare_all_units(frame, "2025-01", {"CARIOCA SHOPPING": ["Fornecedor"]})
+
+        assert list(result) == ["carioca shopping"]
+        rows, _recipients, summary = result["carioca shopping"]
+        assert summary["display_columns"] == ["Fornecedor", "Valor Mensal Final", "Mês de emissão da NF"]
+        assert list(rows[0]) == ["Fornecedor", "Valor Mensal Final", "Mês de emissão da NF"]
+
+    def test_batch_keeps_columns_per_request(self, region_df):
+        """No lote do pipeline, a mesma unidade pedida com colunas diferentes não se mistura."""
+        from app.services.pipeline_service import PipelineService
+
+        group = [
+            {"unit": "Bangu Shopping", "visible_columns": ["Fornecedor"]},
+            {"unit": "BANGU SHOPPING", "visible_columns": None},
+            {"unit": "Carioca Shopping", "visible_columns": ["Fornecedor"]},
+        ]
+        PipelineService._prepare_group(RegionFrame(region_df), "2025-01", group)
+
+        assert list(group[0]["prepared"][0][0]) == ["Fornecedor", "Valor Mensal Final", "Mês de emissão da NF"]
+        assert group[1]["prepared"][0] == filter_and_prepare(region_df, "Bangu Shopping", "2025-01")[0]
+        assert group[2]["prepared"][2]["row_count"] == 2
+
+    def test_month_without_data(self, region_df):
+        """Mês sem linhas retorna dicionário vazio."""
+        assert prepare_all_units(region_df, "2023-05") == {}
+
+
+class TestTypedColumns:
+    """Testes para colunas de valor/mês já tipadas (Extractor typed=True)."""
+
+    def test_same_result_as_text_columns(self, region_df):
+        """Números e datas nativos devem gerar as mesmas linhas e totais do texto."""
+        typed_df = region_df.copy()
+        typed_df["Valor Mensal Final"] = pd.Series([900, 1999.99, 250, 5, 100.125], dtype=object)
+        typed_df["Mês de emissão da NF"] = pd.Series(
+            [dt.datetime(2025, 1, 1), "01/2025", "Janeiro/2025", dt.datetime(2024, 12, 1), dt.date(2025, 1, 15)],
+            dtype=object,
+        )
+
+        expected = prepare_all_units(region_df, "2025-01")
+        result = prepare_all_units(typed_df, "2025-01")
+
+        assert set(result) == set(expected)
+        for nu, (rows, recipients, summary) in result.items():
+            assert rows == expected[nu][0]
+            assert recipients == expected[nu][1]
+            assert summary["sum_valor_mensal_final"] == pytest.approx(expected[nu][2]["sum_valor_mensal_final"])
+
+    def test_datetime64_month_column(self, region_df):
+        """Coluna de mês com dtype datetime64 é indexada sem parse de texto."""
+        typed_df = region_df.copy()
+        typed_df["Mês de emissão da NF"] = pd.to_datetime(
+            ["2025-01-01", "2025-01-10", "2025-01-31", "2024-12-01", None]
+        )
+        assert RegionFrame(typed_df).months == ["2025-01", "2024-12"]
+
+
+class TestParseYearMonthSeries:
+    """Testes para o parse de mês de uma coluna inteira."""
+
+    VALUES = [
+        "2025-06", "2025/6", "2025.13", "06/2025", "13/2025", "01/06/2025", "1/13/2025", "2025-06-01 00:00:00",
+        "2025-06-01T10:00", "Junho/2025", "junho 2025", "Março-2024", "JULHO2023", "45000", "00045000", "000000000045000", "000", "0", "2958466",
+        "", "nan", "abc", "٢٠٢٥-٠٦", "00/2025", None, float("nan"), 45000, 45000.0, True,
+        dt.datetime(2024, 3, 5, 10), dt.date(2023, 1, 2),
+    ]
+
+    def test_same_as_parse_year_month(self):
+        """Cada célula deve dar o mesmo resultado de parse_year_month."""
+        result = utils.parse_year_month_series(pd.Series(self.VALUES * 3, dtype=object))
+
+        for value, got in zip(self.VALUES * 3, result.tolist()):
+            if isinstance(value, dt.date):
+                assert got == f"{value.year:04d}-{value.month:02d}"
+            else:
+                assert got == utils.parse_year_month(value), value
+
+    def test_keeps_index(self):
+        """O resultado mantém o índice da coluna de entrada."""
+        series = pd.Series(["2025-01", "x"], index=[10, 20])
+        assert utils.parse_year_month_series(series).to_dict() == {10: "2025-01", 20: None}
+
+
+class TestHorasAtrasos:
+    """Testes para a formatação de Horas Atrasos por coluna."""
+
+    VALUES = [
+        "1:30", "4h 30m", "", "2,5", "0:45", "-1:30", "-1:90", "0:03", "0:09", "1:60", "4H", "4 h 30 m",
+        "Informação pendente", " ", "nan", "1e3", "-0", "-0.04", "5.", ".5", "0.05", "0.15", "0.250000001",
+        "1.234,5", "٣:٣٠", "Infinity", "abc", None, float("nan"), 0, 1.5,
+    ]
+
+    def test_same_as_per_cell(self):
+        """O texto deve ser idêntico ao da formatação célula a célula."""
+        series = pd.Series(self.VALUES * 2, dtype=object, name="Horas Atrasos")
+        result = processor._format_horas_atrasos_vectorized(series)
+
+        assert result.name == "Horas Atrasos"
+        assert result.tolist() == [processor._format_horas_atrasos_value(v) for v in self.VALUES * 2]
+
+    def test_examples(self):
+        """H:MM e "4h 30m" viram horas decimais com vírgula (meio décimo para par)."""
+        result = processor._format_horas_atrasos_vectorized(pd.Series(["1:30", "4h 30m", "0:03", "0:09", "-1:30"]))
+        assert result.tolist() == ["1,5", "4,5", "0,0", "0,2", "-1,5"]
+
+
+class TestColumnMapping:
+    """Testes para o mapeamento de colunas memoizado."""
+
+    def test_rename_plan_respects_existing_canonical(self):
+        """Sinônimos antes da coluna canônica são renomeados; os depois dela não."""
+        columns = ["Desc_Falta", "Desc. Falta Validado Atlas", "Desconto Falta Validado Atlas", "Desc SLA Ret"]
+        assert processor._canonical_rename_map(columns) == {
+            "Desc_Falta": "Desc. Falta Validado Atlas",
+            "Desc SLA Ret": "Desconto SLA Retroativo",
+        }
+
+    def test_mapping_is_memoized_per_layout(self, region_df):
+        """O mesmo cabeçalho é resolvido uma vez e cada chamada recebe uma cópia."""
+        processor._column_mapping.cache_clear()
+        first = processor.map_columns(region_df, warn_missing=False)
+        first["Unidade"] = "alterado"
+        second = processor.map_columns(region_df.copy(), warn_missing=False)
+
+        assert second["Unidade"] == "Unidade"
+        assert second["Mês_Emissão_NF"] == "Mês de emissão da NF"
+        assert processor._column_mapping.cache_info().hits == 1
+
+
+class TestCategoricalColumns:
+    """Testes para colunas de texto categóricas (processadas por categoria)."""
+
+    def test_same_result_as_text_columns(self, region_df):
+        """Linhas, destinatários, totais e cubo iguais aos das colunas object."""
+        categorical_df = region_df.astype("category")
+
+        expected = prepare_all_units(region_df, "2025-01")
+        result = prepare_all_units(categorical_df, "2025-01")
+
+        assert set(result) == set(expected)
+        for nu, (rows, recipients, summary) in result.items():
+            assert rows == expected[nu][0]
+            assert recipients == expected[nu][1]
+            assert summary["sum_valor_mensal_final"] == expected[nu][2]["sum_valor_mensal_final"]
+        assert build_monthly_cube(categorical_df).equals(build_monthly_cube(region_df))
+
+    def test_missing_category_values(self):
+        """Ausentes numa coluna Categorical seguem o resultado de NaN."""
+        series = pd.Series(["01/2025", None, "01/2025"], dtype="category")
+        assert utils.parse_year_month_series(series).tolist() == ["2025-01", None, "2025-01"]
+
+
+class TestRecipientDirectory:
+    """Testes para o diretório de destinatários montado uma vez por planilha."""
+
+    def test_same_recipients_as_filter_and_prepare(self, region_df):
+        """Por unidade/mês, as listas são as mesmas do filtro sobre o DataFrame."""
+        frame = RegionFrame(region_df)
+        for unidade, ym in [("Bangu Shopping", "2025-01"), ("Bangu Shopping", "2024-12"), ("Carioca Shopping", "2025-01")]:
+            _, expected, _ = filter_and_prepare(region_df, unidade, ym)
+            assert frame.recipients.lookup(unidade, ym) == expected
+
+    def test_by_unit_and_rejected(self, region_df, capsys):
+        """Lista da unidade em todos os meses, inválidos avisados uma vez."""
+        frame = RegionFrame(region_df)
+        directory = frame.recipients
+
+        assert directory.lookup("BANGU SHOPPING") == ["a@x.com", "b@x.com", "B@x.com", "old@x.com"]
+        assert directory.rejected == ["invalido"]
+        assert capsys.readouterr().out.count("invalido") == 1
+        assert frame.recipients is directory
+
+    def test_without_email_column(self, region_df):
+        """Sem coluna de e-mail o diretório fica vazio."""
+        frame = RegionFrame(region_df.drop(columns=["E-mail"]))
+        assert frame.recipients.lookup("Bangu Shopping", "2025-01") == []
+        assert isinstance(frame.recipients, RecipientDirectory)
+
+
+class TestPrepareModes:
+    """Testes para os modos "summary"/"rows" e o plano de colunas."""
+
+    def test_summary_mode_matches_full_totals(self, region_df):
+        """Modo summary devolve o mesmo sumário, sem rows nem destinatários."""
+        frame = RegionFrame(region_df)
+        _, _, full = filter_and_prepare(region_df, "Bangu Shopping", "2025-01")
+
+        for src in (region_df, frame):
+            rows, recipients, summary = filter_and_prepare(src, "Bangu Shopping", "2025-01", mode="summary")
+            assert rows == [] and recipients == []
+            assert summary == full
+
+        batch = prepare_all_units(frame, "2025-01", mode="summary")
+        assert batch["bangu shopping"][2] == full
+        assert batch["carioca shopping"][2]["row_count"] == 2
+
+    def test_rows_mode_skips_recipients(self, region_df):
+        """Modo rows devolve as mesmas rows, sem resolver destinatários."""
+        full_rows, _, _ = filter_and_prepare(region_df, "Bangu Shopping", "2025-01")
+        rows, recipients, _ = filter_and_prepare(RegionFrame(region_df), "Bangu Shopping", "2025-01", mode="rows")
+        assert rows == full_rows
+        assert recipients == []
+
+    def test_plan_formats_only_displayed_columns(self, region_df):
+        """Horas Atrasos fora da whitelist não é formatada; a whitelist do chamador não muda."""
+        whitelist = ["Unidade", "Horas Atrasos"]
+        rows, _, summary = filter_and_prepare(region_df, "Bangu Shopping", "2025-01", columns_whitelist=whitelist)
+        assert rows[0]["Horas Atrasos"] == "1,5"
+        assert summary["display_columns"] == ["Unidade", "Horas Atrasos", "Valor Mensal Final", "Mês de emissão da NF"]
+        assert whitelist == ["Unidade", "Horas Atrasos"]
+
+        plan = processor.ColumnPlan(["Unidade"])
+        assert not plan.needs("Horas Atrasos", region_df.columns)
+        assert plan.needs("Horas Atrasos", ["Outra"])
+
+    def test_rows_carry_cents(self, region_df):
+        """Valor Mensal Final das rows é texto BRL com os centavos ao lado."""
+        rows, _, summary = filter_and_prepare(region_df, "Bangu Shopping", "2025-01")
+        cells = [r["Valor Mensal Final"] for r in rows]
+        assert cells == ["R$ 900,00", "R$ 1.999,99"]
+        assert sum(c.cents for c in cells) / 100 == summary["sum_valor_mensal_final"]
+
+    def test_invalid_mode(self, region_df):
+        """Modo desconhecido é rejeitado."""
+        with pytest.raises(ValueError):
+            filter_and_prepare(region_df, "Bangu Shopping", "2025-01", mode="lazy")
@@ -6,14 +6,30 @@ Testa:
 - Upload de múltiplos arquivos (batch)
 - Validação de extensões
 - Validação de regiões
+- Validação da aba da região (catálogo de abas)
 - Limites de arquivos
 """
 
 import pytest
+from pathlib import Path
 from fastapi.testclient import TestClient
 from io import BytesIO
 from unittest.mock import patch, MagicMock
 
+from openpyxl import Workbook
+
+
+def _xlsx_bytes(*sheet_titles):
+    """Planilha real em memória com as abas informadas."""
+    wb = Workbook()
+    wb.active.title = sheet_titles[0]
+    for title in sheet_titles[1:]:
+        wb.create_sheet(title)
+    buffer = BytesIO()
+    wb.save(buffer)
+    buffer.seek(0)
+    return buffer
+
 
 class TestUploadSingle:
     """Testes para upload de arquivo único."""
@@ -90,6 +106,31 @@ class TestUploadSingle:
         assert response.status_code == 400
         assert "Região inválida" in response.json()["detail"]
     
+    def test_upload_rejects_missing_region_sheet(self, client: TestClient):
+        """Planilha legível sem a aba 'Faturamento <região>' deve ser rejeitada."""
+        response = client.post(
+            "/api/upload/",
+            files={"file": ("medicao_sp1.xlsx", _xlsx_bytes("Resumo", "Faturamento RJ"), "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")},
+            data={"region": "SP1"}
+        )
+        
+        assert response.status_code == 400
+        assert "Faturamento SP1" in response.json()["detail"]
+    
+    def test_upload_accepts_region_sheet(self, client: TestClient):
+        """Planilha com a aba da região deve ser aceita."""
+        response = client.post(
+            "/api/upload/",
+            files={"file": ("medicao_rj.xlsx", _xlsx_bytes("Resumo", "Faturamento RJ"), "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")},
+            data={"region": "RJ"}
+        )
+        
+        assert response.status_code == 200
+        assert response.json()["region"] == "RJ"
+        # A leitura do catálogo não consome o upload: o arquivo salvo fica inteiro
+        from app.core import read_sheet_names
+        assert read_sheet_names(Path(response.json()["file_url"])) == ("Resumo", "Faturamento RJ")
+    
     def test_upload_all_valid_regions(self, client: TestClient):
         """Deve aceitar todas as regiões válidas."""
         valid_regions = ["RJ", "SP1", "SP2", "SP3", "NNE"]
@@ -184,6 +225,26 @@ class TestUploadBatch:
         assert response.status_code == 400
         assert "Excel" in response.json()["detail"]
     
+    def test_batch_missing_region_sheet_saves_nothing(self, client: TestClient):
+        """Aba da região faltando em um arquivo rejeita o lote antes de salvar qualquer arquivo."""
+        from app.routers.upload import UPLOAD_DIR
+        
+        before = set(UPLOAD_DIR.iterdir())
+        files = [
+            ("files", ("rj.xlsx", _xlsx_bytes("Faturamento RJ"), "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")),
+            ("files", ("sp1.xlsx", _xlsx_bytes("Faturamento RJ"), "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")),
+        ]
+        
+        response = client.post(
+            "/api/upload/batch",
+            files=files,
+            data={"regions": "RJ,SP1"}
+        )
+        
+        assert response.status_code == 400
+        assert "Faturamento SP1" in response.json()["detail"]
+        assert set(UPLOAD_DIR.iterdir()) == before
+    
     def test_batch_upload_without_regions(self, client: TestClient):
         """Deve aceitar upload sem regiões especificadas."""
         files = [
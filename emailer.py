@@ -1,13 +1,21 @@
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-from typing import List, Dict, Any, Optional
-from jinja2 import Environment, FileSystemLoader, select_autoescape
+from typing import Iterable, Iterator, List, Dict, Any, Optional, Tuple
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, Template, select_autoescape
+import os
+import threading
 import urllib.parse
 import platform
 import unicodedata
 
-from utils import to_base64_image, fmt_brl, fmt_percentage, normalize_text_full, is_missing_like
+import numpy as np
+import pandas as pd
 
-from processor import DISPLAY_HEADER_SYNONYMS
+from utils import to_base64_image, image_mime, fmt_brl, fmt_percentage, normalize_text_full, is_missing_like
+
+from processor import DISPLAY_HEADER_SYNONYMS, KPI_DISCOUNT_COLUMNS
+from money import MoneyCell, brl_cell, parse_cents
 
 SLA_DISCOUNT_CANONICAL = "Desconto SLA Mês"
 SLA_DISCOUNT_COLUMN_ALIASES = {
@@ -54,6 +62,7 @@ def _norm_txt(s: Optional[str]) -> str:
     """
     return normalize_text_full(s)
 
+@lru_cache(maxsize=1024)
 def _canon(name: Optional[str]) -> Optional[str]:
     if not name:
         return name
@@ -73,7 +82,353 @@ def _canon(name: Optional[str]) -> Optional[str]:
 
     return n_raw
 
+
+# --------------------------
+# KPIs do e-mail (calculados antes do template)
+# Descontos: KPI_DISCOUNT_COLUMNS do processor, a mesma lista do cubo mensal
+# --------------------------
+
+def _column_values(rows: List[Dict[str, Any]], column: str) -> np.ndarray:
+    """
+    Valores (reais) de uma coluna das rows; 0 onde a coluna falta. MoneyCell
+    já traz os centavos; o resto passa por money.parse_cents no modo BRL,
+    o mesmo conversor do cubo mensal (o que não converte vale 0).
+    """
+    cells = [r[column] if column in r else None for r in rows]
+    cents = np.zeros(len(cells), dtype=np.int64)
+    other = []
+    for i, cell in enumerate(cells):
+        if isinstance(cell, MoneyCell):
+            cents[i] = cell.cents
+        else:
+            other.append(i)
+    if other:
+        cents[other] = parse_cents(pd.Series([cells[i] for i in other], dtype=object), brl=True)[0]
+    return cents / 100.0
+
+
+def _rows_totals(rows: List[Dict[str, Any]]) -> Dict[str, float]:
+    """Somas de Valor Planilha, Valor Mensal Final e descontos das rows."""
+    desc = sum(float(_column_values(rows, c).sum()) for c in KPI_DISCOUNT_COLUMNS if any(c in r for r in rows))
+    return {
+        "vplanilha": float(_column_values(rows, ANCHOR_VALOR_PLANILHA).sum()),
+        "vmf": float(_column_values(rows, ANCHOR_VALOR_MENSAL_FINAL).sum()),
+        "desc": desc,
+    }
+
+
+def _trend_pct(curr: Optional[float], prev: Optional[float]) -> Optional[float]:
+    """Variação simétrica (%) entre o mês e o anterior; None sem base de comparação."""
+    if curr is None or prev is None:
+        return None
+    denom = abs(curr) + abs(prev)
+    return 200.0 * (curr - prev) / denom if denom > 0 else None
+
+
+def build_kpis(
+    rows: List[Dict[str, Any]],
+    summary: Optional[Dict[str, Any]] = None,
+    rows_prev: Optional[List[Dict[str, Any]]] = None,
+    prev_summary: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    KPIs do e-mail prontos para o template: totais do mês e do mês
+    anterior, variações e o ranking de fornecedores por Valor Mensal Final.
+
+    Os totais do sumário (processor/cubo mensal) têm prioridade; as rows
+    só são somadas para o que o sumário não traz. Os dois meses vêm da
+    mesma fonte: com o mês anterior em rows_prev, o mês atual também é
+    somado das rows (que só têm as colunas exibidas). Cada coluna é lida uma
+    vez e somada em lote, e o ranking agrupa as linhas por fornecedor com
+    np.bincount (ordem estável: empates ficam na ordem de aparição).
+    """
+    summary = summary or {}
+    prev_summary = prev_summary or {}
+    if prev_summary.get("row_count") == 0:
+        # Cubo sem linhas no mês anterior: sem base de comparação (não é "zero")
+        prev_summary = {}
+    totals = _rows_totals(rows)
+
+    vmf_prev = vplanilha_prev = desc_prev = None
+    if "sum_valor_planilha" in prev_summary:
+        # Totais já agregados pelo cubo mensal (processor.build_monthly_cube)
+        vmf_prev = prev_summary.get("sum_valor_mensal_final")
+        vplanilha_prev = prev_summary.get("sum_valor_planilha")
+        desc_prev = prev_summary.get("sum_descontos_gerais")
+    elif rows_prev:
+        prev_totals = _rows_totals(rows_prev)
+        vmf_prev, vplanilha_prev, desc_prev = prev_totals["vmf"], prev_totals["vplanilha"], prev_totals["desc"]
+
+    current = summary if "sum_valor_planilha" in prev_summary or not rows_prev else {}
+    vmf_total = summary.get("sum_valor_mensal_final", totals["vmf"])
+    vplanilha_total = current.get("sum_valor_planilha", totals["vplanilha"])
+    desc_total = current.get("sum_descontos_gerais", totals["desc"])
+    vmf_prev = prev_summary.get("sum_valor_mensal_final", vmf_prev)
+    desc_prev = prev_summary.get("sum_descontos_gerais", desc_prev)
+
+    # Ranking de fornecedores (soma do Valor Mensal Final por fornecedor)
+    codes: Dict[Any, int] = {}
+    supplier_idx = np.array(
+        [codes.setdefault(r["Fornecedor"] if "Fornecedor" in r else "—", len(codes)) for r in rows],
+        dtype=np.intp,
+    )
+    by_supplier = np.bincount(supplier_idx, weights=_column_values(rows, ANCHOR_VALOR_MENSAL_FINAL), minlength=len(codes))
+    ranking = sorted(zip(codes, by_supplier.tolist()), key=lambda item: item[1], reverse=True)
+    top_fornecedor, top_valor = ranking[0] if ranking else ("—", 0.0)
+
+    return {
+        "vmf_total": vmf_total,
+        "vplanilha_total": vplanilha_total,
+        "desc_total": desc_total,
+        "vmf_prev": vmf_prev,
+        "vplanilha_prev": vplanilha_prev,
+        "desc_prev": desc_prev,
+        "vmf_delta_pct": _trend_pct(vmf_total, vmf_prev),
+        "vplanilha_delta_pct": _trend_pct(vplanilha_total, vplanilha_prev),
+        "desc_delta_pct": _trend_pct(abs(desc_total), abs(desc_prev) if desc_prev is not None else None),
+        "fornecedores": ranking,
+        "top_fornecedor": top_fornecedor,
+        "top_valor": top_valor,
+    }
+
+
+def _money_to_float(v: Any) -> float:
+    """Filtro money_to_float: texto BRL (ou MoneyCell) para float; inválidos valem 0."""
+    if isinstance(v, MoneyCell):
+        return v.value
+    if v is None:
+        return 0.0
+    s = str(v)
+    s = s.replace("\u00A0", " ").strip()
+    if not s:
+        return 0.0
+    low = s.lower()
+    if low in {"nan", "none", "inf", "+inf", "-inf", "infinity", "+infinity", "-infinity"}:
+        return 0.0
+    s = s.replace("R$", "").replace(".", "").replace(",", ".").replace(" ", "")
+    try:
+        return float(s)
+    except Exception:
+        try:
+            return float(str(v))
+        except Exception:
+            return 0.0
+
+
+# --------------------------
+# Registro de templates (um Environment por pasta, no processo)
+# --------------------------
+TEMPLATE_BYTECODE_DIR_ENV = "TEMPLATE_BYTECODE_DIR"
+DEFAULT_TEMPLATE_BYTECODE_DIR = Path(__file__).resolve().parent / ".cache" / "jinja"
+
+
+def default_template_bytecode_dir() -> Path:
+    """Pasta do bytecode dos templates: TEMPLATE_BYTECODE_DIR ou .cache/jinja na raiz do projeto."""
+    env_dir = os.getenv(TEMPLATE_BYTECODE_DIR_ENV, "").strip()
+    return Path(env_dir) if env_dir else DEFAULT_TEMPLATE_BYTECODE_DIR
+
+
+class TemplateRegistry:
+    """
+    Environment Jinja de uma pasta de templates, compartilhado por todos os
+    Emailer do processo (CLI, jobs, previews do portal).
+
+    - Templates compilados ficam no cache do Environment; com auto_reload o
+      mtime do arquivo é conferido a cada get_template e um template editado
+      é recompilado.
+    - O bytecode vai para disco (FileSystemBytecodeCache), então um processo
+      novo não recompila o template do zero. A entrada é validada pelo
+      checksum do fonte: template alterado nunca usa bytecode antigo.
+    - Textos de copy (from_string) ficam num LRU por texto-fonte.
+    """
+
+    # Textos de copy distintos mantidos compilados (padrões + .env + overrides)
+    COPY_CACHE_SIZE = 256
+
+    def __init__(self, templates_dir: Path, bytecode_dir: Optional[Path] = None):
+        self.templates_dir = Path(templates_dir)
+        self.bytecode_dir = Path(bytecode_dir) if bytecode_dir else default_template_bytecode_dir()
+        bytecode_cache = None
+        try:
+            self.bytecode_dir.mkdir(parents=True, exist_ok=True)
+            bytecode_cache = FileSystemBytecodeCache(str(self.bytecode_dir))
+        except OSError as e:
+            print(f"[WARN] Cache de bytecode dos templates desativado ({self.bytecode_dir}): {e}")
+        self.env = Environment(
+            loader=FileSystemLoader(str(self.templates_dir)),
+            autoescape=select_autoescape(["html", "xml"]),
+            auto_reload=True,
+            bytecode_cache=bytecode_cache,
+        )
+        # Filtros customizados
+        self.env.filters["money_to_float"] = _money_to_float
+        self.env.filters["urlencode"] = lambda x: urllib.parse.quote(str(x or ""))
+        self.copy_template = lru_cache(maxsize=self.COPY_CACHE_SIZE)(self.env.from_string)
+
+    def clear(self):
+        """Descarta templates e copies compilados (o bytecode em disco continua válido)."""
+        self.env.cache.clear()
+        self.copy_template.cache_clear()
+
+
+_template_registries: Dict[str, TemplateRegistry] = {}
+_template_registries_lock = threading.Lock()
+
+
+def template_registry(templates_dir: Path) -> TemplateRegistry:
+    """Registro compartilhado da pasta de templates (um por caminho absoluto, no processo)."""
+    key = str(Path(templates_dir).resolve())
+    with _template_registries_lock:
+        registry = _template_registries.get(key)
+        if registry is None:
+            registry = _template_registries[key] = TemplateRegistry(Path(templates_dir))
+        return registry
+
+
+def clear_template_registries():
+    """Descarta todos os registros de templates do processo."""
+    with _template_registries_lock:
+        _template_registries.clear()
+
+
+# --------------------------
+# Manifesto dos assets da marca (logo resolvida uma vez por mtime)
+# --------------------------
+LOGO_NAMES = ["logo-performance-horizontal-azul.png", "logo.png", "atlas.png", "logo.jpg", "logo.jpeg"]
+
+# inline: data URI no HTML (padrão); cid: src="cid:<LOGO_CID>", embutida só no envio;
+# url: sem imagem embutida, usa LOGO_HTTP_URL
+LOGO_MODES = ("inline", "cid", "url")
+
+
+def _dir_stamp(directory: Path) -> Optional[int]:
+    try:
+        return directory.stat().st_mtime_ns
+    except OSError:
+        return None
+
+
+class AssetManifest:
+    """
+    Resolução dos assets da marca de uma pasta (hoje, a logo).
+
+    Os candidatos (LOGO_FILE, nomes comuns, LOGO_URL) são testados uma vez;
+    o resultado vale enquanto o mtime das pastas dos candidatos não mudar
+    (arquivo criado, removido ou renomeado). O conteúdo da logo é validado
+    pelo mtime/tamanho do próprio arquivo em utils.to_base64_image.
+    """
+
+    def __init__(self, assets_dir: Path):
+        self.assets_dir = Path(assets_dir)
+        self._lock = threading.Lock()
+        # (LOGO_FILE, LOGO_URL) -> (candidatos, pastas, mtime das pastas, logo resolvida)
+        self._logos: Dict[tuple, tuple] = {}
+
+    def _candidate(self, name: str) -> Path:
+        p = Path(name)
+        return p if p.is_absolute() else self.assets_dir / name
+
+    def logo_candidates(self, env_cfg: Dict[str, str]) -> tuple:
+        """Caminhos testados, em ordem: LOGO_FILE, nomes comuns em assets/, LOGO_URL (compatibilidade)."""
+        names = [(env_cfg.get("LOGO_FILE") or "").strip()] + LOGO_NAMES + [(env_cfg.get("LOGO_URL") or "").strip()]
+        return tuple(dict.fromkeys(self._candidate(n) for n in names if n))
+
+    def logo_path(self, env_cfg: Dict[str, str]) -> Optional[Path]:
+        """Primeiro candidato existente (ou None), sem repetir os exists() enquanto as pastas não mudam."""
+        key = ((env_cfg.get("LOGO_FILE") or "").strip(), (env_cfg.get("LOGO_URL") or "").strip())
+        with self._lock:
+            cached = self._logos.get(key)
+        if cached is not None:
+            candidates, dirs, stamp, found = cached
+            if tuple(_dir_stamp(d) for d in dirs) == stamp:
+                return found
+        else:
+            candidates = self.logo_candidates(env_cfg)
+            dirs = tuple(dict.fromkeys(p.parent for p in candidates))
+        stamp = tuple(_dir_stamp(d) for d in dirs)
+        found = next((p for p in candidates if p.is_file()), None)
+        with self._lock:
+            self._logos[key] = (candidates, dirs, stamp, found)
+        return found
+
+
+_asset_manifests: Dict[str, AssetManifest] = {}
+_asset_manifests_lock = threading.Lock()
+
+
+def asset_manifest(assets_dir: Path) -> AssetManifest:
+    """Manifesto compartilhado da pasta de assets (um por caminho absoluto, no processo)."""
+    key = str(Path(assets_dir).resolve())
+    with _asset_manifests_lock:
+        manifest = _asset_manifests.get(key)
+        if manifest is None:
+            manifest = _asset_manifests[key] = AssetManifest(Path(assets_dir))
+        return manifest
+
+
+class RenderBatch:
+    """
+    Contexto invariante de um lote de renders do mesmo Emailer (uma região,
+    um job): template, logo, cores da marca e data de geração são resolvidos
+    uma vez; a ordem final das colunas é memorizada por lista pedida.
+    """
+
+    def __init__(self, emailer: "Emailer", hoje: Optional[str] = None):
+        self.emailer = emailer
+        self.template = emailer.jenv.get_template(emailer.TEMPLATE_NAME)
+        self.hoje = hoje or emailer.today_str()
+        self.logo_cid = emailer.logo_cid()
+        self.logo_img_src = emailer._logo_img_src(self.logo_cid)
+        self.logo_http_url = emailer.env_cfg.get("LOGO_HTTP_URL", "").strip() or None
+        self.brand_vars = emailer.brand_vars()
+        self._column_orders: Dict[Optional[tuple], List[str]] = {}
+
+    def column_order(self, table_columns: Optional[List[str]]) -> List[str]:
+        """_compute_final_order memorizado no lote (a lista devolvida é compartilhada)."""
+        key = tuple(table_columns) if table_columns else None
+        order = self._column_orders.get(key)
+        if order is None:
+            order = self._column_orders[key] = self.emailer._compute_final_order(table_columns)
+        return order
+
+
+def _joined_chunks(parts: Iterable[str], size: int) -> Iterator[str]:
+    """Junta os pedaços miúdos do template.generate em blocos de ~size caracteres."""
+    buf: List[str] = []
+    buffered = 0
+    for part in parts:
+        buf.append(part)
+        buffered += len(part)
+        if buffered >= size:
+            yield "".join(buf)
+            buf.clear()
+            buffered = 0
+    if buf:
+        yield "".join(buf)
+
+
+# Pool de render: cada processo monta o próprio Emailer e lote uma única vez
+_worker_emailer: Optional["Emailer"] = None
+_worker_batch: Optional[RenderBatch] = None
+
+
+def _init_render_worker(templates_dir: Path, assets_dir: Path, env_cfg: Dict[str, str], hoje: str):
+    global _worker_emailer, _worker_batch
+    _worker_emailer = Emailer(templates_dir, assets_dir, env_cfg)
+    _worker_batch = _worker_emailer.batch_context(hoje=hoje)
+
+
+def _render_in_worker(payload: Dict[str, Any], path: Optional[Path] = None) -> Any:
+    if path is not None:
+        return _worker_emailer.render_to_file(path, **payload, batch=_worker_batch)
+    return _worker_emailer.render_html(**payload, batch=_worker_batch)
+
+
 class Emailer:
+    TEMPLATE_NAME = "email_template_dark.html"
+    # Tamanho (caracteres) dos pedaços entregues por render_stream
+    STREAM_CHUNK_SIZE = 64 * 1024
+
     COPY_ENV_KEYS = {
         "greeting": "COPY_GREETING",
         "intro": "COPY_INTRO",
@@ -185,31 +540,34 @@ class Emailer:
         self.templates_dir = templates_dir
         self.assets_dir = assets_dir
         self.env_cfg = env_cfg
-        self.jenv = Environment(
-            loader=FileSystemLoader(str(templates_dir)),
-            autoescape=select_autoescape(["html", "xml"]),
-        )
-        # Filtros customizados
-        def _money_to_float(v: Any) -> float:
-            if v is None:
-                return 0.0
-            s = str(v)
-            s = s.replace("\u00A0", " ").strip()
-            if not s:
-                return 0.0
-            low = s.lower()
-            if low in {"nan", "none", "inf", "+inf", "-inf", "infinity", "+infinity", "-infinity"}:
-                return 0.0
-            s = s.replace("R$", "").replace(".", "").replace(",", ".").replace(" ", "")
-            try:
-                return float(s)
-            except Exception:
-                try:
-                    return float(str(v))
-                except Exception:
-                    return 0.0
-        self.jenv.filters["money_to_float"] = _money_to_float
-        self.jenv.filters["urlencode"] = lambda x: urllib.parse.quote(str(x or ""))
+        self.assets = asset_manifest(assets_dir)
+        templates = template_registry(templates_dir)
+        self.jenv = templates.env
+        # Textos de copy compilados uma vez por texto-fonte (LRU do registro, no processo)
+        self._copy_template = templates.copy_template
+
+    def precompile_copy(self, *copy_sets: Optional[Dict[str, Any]]) -> int:
+        """
+        Compila de antemão os textos de copy: padrões, COPY_* do .env e cada
+        conjunto de overrides informado (CLI, portal, config por unidade).
+        As renderizações seguintes só executam templates já compilados.
+
+        Retorna quantos textos distintos foram compilados.
+        """
+        sources = list(self.COPY_DEFAULTS.values())
+        for key in self.COPY_DEFAULTS:
+            env_val = self.env_cfg.get(self.COPY_ENV_KEYS[key])
+            if env_val is not None and str(env_val).strip():
+                sources.append(str(env_val))
+        for copy_set in copy_sets:
+            for key, value in (copy_set or {}).items():
+                if key in self.COPY_DEFAULTS and value:
+                    sources.append(str(value))
+
+        distinct = list(dict.fromkeys(sources))
+        for source in distinct:
+            self._copy_template(source)
+        return len(distinct)
 
     def _int_cfg(self, key: str, default: int) -> int:
         val = str(self.env_cfg.get(key, str(default))).strip()
@@ -218,39 +576,104 @@ class Emailer:
         except Exception:
             return default
 
+    def brand_vars(self) -> Dict[str, Any]:
+        """Cores e medidas da marca (.env) usadas pelo template."""
+        return {
+            "BODY_BG": self.env_cfg.get("BODY_BG", "#0F172A"),
+            "TABLE_HEADER_BG": self.env_cfg.get("TABLE_HEADER_BG", "#182A4B"),
+            "TABLE_HEADER_FG": self.env_cfg.get("TABLE_HEADER_FG", "#FFFFFF"),
+            "TABLE_BORDER": self.env_cfg.get("TABLE_BORDER", "#243045"),
+            "BRAND_COLOR_PRIMARY": self.env_cfg.get("BRAND_COLOR_PRIMARY", "#182A4B"),
+            "BRAND_COLOR_ACCENT": self.env_cfg.get("BRAND_COLOR_ACCENT", "#3B82F6"),
+            "NOTICE_BG": self.env_cfg.get("NOTICE_BG", "#14223B"),
+            "NOTICE_BORDER": self.env_cfg.get("NOTICE_BORDER", "#2B3B55"),
+            "ZEBRA_BG": self.env_cfg.get("ZEBRA_BG", "#121D34"),
+            "LOGO_WIDTH": self._int_cfg("LOGO_WIDTH", 176),
+        }
+
     def _resolve_logo_path(self) -> Optional[Path]:
         """
         Resolve o caminho do arquivo de logo.
         Prioriza LOGO_FILE, depois nomes comuns, depois LOGO_URL (compatibilidade).
         """
-        # Lista de nomes de arquivo comuns
-        LOGO_NAMES = ["logo-performance-horizontal-azul.png", "logo-performance-horizontal-azul.png", "logo.png", "atlas.png", "logo.jpg", "logo.jpeg"]
-        
-        # 1. Tentar LOGO_FILE do .env
-        env_name = (self.env_cfg.get("LOGO_FILE") or "").strip()
-        if env_name:
-            p = Path(env_name)
-            if not p.is_absolute():
-                p = self.assets_dir / env_name
-            if p.exists():
-                return p
-        
-        # 2. Tentar nomes comuns em assets/
-        for name in LOGO_NAMES:
-            p = self.assets_dir / name
-            if p.exists():
-                return p
-        
-        # 3. Tentar LOGO_URL (compatibilidade com versões antigas)
-        compat = (self.env_cfg.get("LOGO_URL") or "").strip()
-        if compat:
-            p = Path(compat)
-            if not p.is_absolute():
-                p = self.assets_dir / compat
-            if p.exists():
-                return p
-        
-        return None
+        return self.assets.logo_path(self.env_cfg)
+
+    def logo_cid(self) -> str:
+        """Content-ID da logo nos e-mails (LOGO_CID)."""
+        return self.env_cfg.get("LOGO_CID", "atlas-logo").strip() or "atlas-logo"
+
+    def logo_mode(self) -> str:
+        """LOGO_MODE do .env (inline, cid ou url); valor desconhecido vale inline."""
+        mode = (self.env_cfg.get("LOGO_MODE") or "inline").strip().lower()
+        if mode not in LOGO_MODES:
+            print(f"[WARN] LOGO_MODE '{mode}' inválido; usando 'inline'.")
+            return "inline"
+        return mode
+
+    def _logo_img_src(self, cid: str) -> Optional[str]:
+        """src da logo no HTML salvo, conforme o LOGO_MODE."""
+        mode = self.logo_mode()
+        if mode == "inline":
+            return self._resolve_logo_data_uri()
+        if mode == "cid" and self._resolve_logo_path() is not None:
+            return f"cid:{cid}"
+        return None  # template usa LOGO_HTTP_URL
+
+    def inline_assets(self, html: str) -> str:
+        """
+        Troca as referências cid:<LOGO_CID> pela logo em data URI, para
+        envios sem anexo inline (SendGrid). HTML sem CID volta intacto.
+        """
+        ref = f"cid:{self.logo_cid()}"
+        if ref not in html:
+            return html
+        data_uri = self._resolve_logo_data_uri()
+        return html.replace(ref, data_uri) if data_uri else html
+
+    def inline_asset_chunks(self, chunks: Iterable[str]) -> Iterator[str]:
+        """
+        inline_assets pedaço a pedaço (render_stream, stream_html_file):
+        uma referência cid: partida entre dois pedaços também é trocada.
+        """
+        ref = f"cid:{self.logo_cid()}"
+        data_uri: Optional[str] = None
+        pending = ""
+        for chunk in chunks:
+            text = pending + chunk
+            if ref in text:
+                if data_uri is None:
+                    data_uri = self._resolve_logo_data_uri() or ref
+                text = text.replace(ref, data_uri)
+            # Segura só o fim que ainda pode virar o começo de uma referência
+            keep = next((n for n in range(min(len(ref) - 1, len(text)), 0, -1) if ref.startswith(text[-n:])), 0)
+            pending = text[len(text) - keep:] if keep else ""
+            if len(text) > keep:
+                yield text[:len(text) - keep]
+        if pending:
+            yield pending
+
+    def stream_html_file(self, path: Path) -> Iterator[str]:
+        """
+        HTML salvo, em pedaços de até STREAM_CHUNK_SIZE caracteres e com a
+        logo embutida (para o navegador, que não resolve cid:). O arquivo é
+        aberto e o primeiro pedaço lido já na chamada: erros de leitura
+        aparecem antes da resposta começar.
+        """
+        fh = open(path, encoding="utf-8")
+        try:
+            first = fh.read(self.STREAM_CHUNK_SIZE)
+        except Exception:
+            fh.close()
+            raise
+
+        def _chunks() -> Iterator[str]:
+            with fh:
+                chunk = first
+                while chunk:
+                    yield chunk
+                    chunk = fh.read(self.STREAM_CHUNK_SIZE)
+
+        return self.inline_asset_chunks(_chunks())
 
     def _resolve_logo_data_uri(self) -> Optional[str]:
         """Retorna a logo como data URI (base64) para uso em HTML."""
@@ -349,7 +772,7 @@ class Emailer:
         final_order = [c for c in base if (c not in seen2 and not seen2.add(c))]
         return final_order
 
-    def render_html(
+    def _template_context(
         self,
         unidade: str,
         regiao: str,
@@ -363,25 +786,17 @@ class Emailer:
         rows_ytd: Optional[List[List[Dict[str, Any]]]] = None,
         rows_ytd_prev: Optional[List[List[Dict[str, Any]]]] = None,
         extra_prev: Optional[Dict[str, Any]] = None,
-    ) -> str:
+        totals_prev: Optional[Dict[str, Any]] = None,
+        totals_ytd: Optional[Dict[str, Any]] = None,
+        totals_ytd_prev: Optional[Dict[str, Any]] = None,
+        batch: Optional[RenderBatch] = None,
+    ) -> Tuple[Template, Dict[str, Any]]:
+        # Template e variáveis de um e-mail (base de render_html/render_stream/render_to_file).
+        # batch: contexto invariante já resolvido (render_many/batch_context).
+        # totals_*: totais já agregados (processor.cube_totals). Preferidos às
+        # listas rows_prev/rows_ytd, que continuam aceitas por compatibilidade.
+        batch = batch or self.batch_context()
         mes_extenso = self.format_mes_extenso(ym)
-        template = self.jenv.get_template("email_template_dark.html")
-        logo_b64 = self._resolve_logo_data_uri()
-        logo_cid = self.env_cfg.get("LOGO_CID", "atlas-logo").strip() or "atlas-logo"
-        logo_http_url = self.env_cfg.get("LOGO_HTTP_URL", "").strip() or None
-
-        brand_vars = {
-            "BODY_BG": self.env_cfg.get("BODY_BG", "#0F172A"),
-            "TABLE_HEADER_BG": self.env_cfg.get("TABLE_HEADER_BG", "#182A4B"),
-            "TABLE_HEADER_FG": self.env_cfg.get("TABLE_HEADER_FG", "#FFFFFF"),
-            "TABLE_BORDER": self.env_cfg.get("TABLE_BORDER", "#243045"),
-            "BRAND_COLOR_PRIMARY": self.env_cfg.get("BRAND_COLOR_PRIMARY", "#182A4B"),
-            "BRAND_COLOR_ACCENT": self.env_cfg.get("BRAND_COLOR_ACCENT", "#3B82F6"),
-            "NOTICE_BG": self.env_cfg.get("NOTICE_BG", "#14223B"),
-            "NOTICE_BORDER": self.env_cfg.get("NOTICE_BORDER", "#2B3B55"),
-            "ZEBRA_BG": self.env_cfg.get("ZEBRA_BG", "#121D34"),
-            "LOGO_WIDTH": self._int_cfg("LOGO_WIDTH", 176),
-        }
 
         ctx = {
             "unidade": unidade,
@@ -395,7 +810,7 @@ class Emailer:
         }
 
         def render_copy(value: str) -> str:
-            return self.jenv.from_string(value).render(**ctx)
+            return self._copy_template(value).render(**ctx)
 
         copy_overrides = copy_overrides or {}
 
@@ -413,7 +828,7 @@ class Emailer:
 
         # -------- Ordem final das colunas (preferir as do processor) --------
         requested_cols = table_columns or summary.get("display_columns")
-        resolved_columns = self._compute_final_order(requested_cols)
+        resolved_columns = batch.column_order(requested_cols)
 
         # -------- Totais já formatados --------
         sum_vmf_num = summary.get("sum_valor_mensal_final", 0.0)
@@ -473,11 +888,13 @@ class Emailer:
                                 s = str(val).strip()
                                 row[k] = s
                             continue
+                        if isinstance(val, MoneyCell):
+                            continue  # já formatada pelo processor, com centavos
                         if is_missing_like(val):
                             row[k] = "" if val is None else str(val).strip()
                         else:
                             s = str(val).strip()
-                            row[k] = s if s.startswith("R$") else fmt_brl(val)
+                            row[k] = brl_cell(s if s.startswith("R$") else fmt_brl(val))
                     elif k in self.TABLE_PERCENTAGE_COLUMNS:
                         val = row.get(k)
                         if is_missing_like(val):
@@ -498,11 +915,15 @@ class Emailer:
         rows_ytd_sanitized = _sanitize_rows_nested(rows_ytd)
         rows_ytd_prev_sanitized = _sanitize_rows_nested(rows_ytd_prev)
 
-        html = template.render(
+        # -------- KPIs (totais, variações e ranking de fornecedores) --------
+        prev_summary = {**(totals_prev or {}), **(extra_prev or {})}
+        kpis = build_kpis(rows_sanitized, summary, rows_prev_sanitized, prev_summary)
+
+        template_vars = dict(
             unidade=unidade,
             regiao=regiao,
             mes_extenso=mes_extenso,
-            hoje=self.today_str(),
+            hoje=batch.hoje,
             summary=summary,
             rows=rows_sanitized,
             rows_prev=rows_prev_sanitized,
@@ -515,19 +936,209 @@ class Emailer:
             sender_email=self.env_cfg.get("SENDER_EMAIL", ""),
             destinatarios_exibicao=destinatarios_exibicao,
             copy=copy,
-            logo_img_src=logo_b64,
-            logo_cid=logo_cid,
-            logo_http_url=logo_http_url,
+            logo_img_src=batch.logo_img_src,
+            logo_cid=batch.logo_cid,
+            logo_http_url=batch.logo_http_url,
             table_columns=resolved_columns,
             table_numeric_columns=self.TABLE_NUMERIC_COLUMNS,
             table_money_columns=self.TABLE_MONEY_COLUMNS,
             table_percentage_columns=self.TABLE_PERCENTAGE_COLUMNS,
             fmt_brl=fmt_brl,
             fmt_percentage=fmt_percentage,
-            prev_summary=(extra_prev or {}),
-            **brand_vars,
+            prev_summary=prev_summary,
+            kpis=kpis,
+            ytd_summary=(totals_ytd or {}),
+            ytd_prev_summary=(totals_ytd_prev or {}),
+            **batch.brand_vars,
+        )
+        return batch.template, template_vars
+
+    def render_html(
+        self,
+        unidade: str,
+        regiao: str,
+        ym: str,
+        rows: List[Dict[str, Any]],
+        summary: Dict[str, Any],
+        destinatarios_exibicao: str = "",
+        copy_overrides: Optional[Dict[str, str]] = None,
+        table_columns: Optional[List[str]] = None,
+        rows_prev: Optional[List[Dict[str, Any]]] = None,
+        rows_ytd: Optional[List[List[Dict[str, Any]]]] = None,
+        rows_ytd_prev: Optional[List[List[Dict[str, Any]]]] = None,
+        extra_prev: Optional[Dict[str, Any]] = None,
+        totals_prev: Optional[Dict[str, Any]] = None,
+        totals_ytd: Optional[Dict[str, Any]] = None,
+        totals_ytd_prev: Optional[Dict[str, Any]] = None,
+        batch: Optional[RenderBatch] = None,
+    ) -> str:
+        """HTML completo do e-mail de uma unidade."""
+        template, template_vars = self._template_context(
+            unidade=unidade,
+            regiao=regiao,
+            ym=ym,
+            rows=rows,
+            summary=summary,
+            destinatarios_exibicao=destinatarios_exibicao,
+            copy_overrides=copy_overrides,
+            table_columns=table_columns,
+            rows_prev=rows_prev,
+            rows_ytd=rows_ytd,
+            rows_ytd_prev=rows_ytd_prev,
+            extra_prev=extra_prev,
+            totals_prev=totals_prev,
+            totals_ytd=totals_ytd,
+            totals_ytd_prev=totals_ytd_prev,
+            batch=batch,
+        )
+        return template.render(template_vars)
+
+    def render_stream(
+        self,
+        unidade: str,
+        regiao: str,
+        ym: str,
+        rows: List[Dict[str, Any]],
+        summary: Dict[str, Any],
+        destinatarios_exibicao: str = "",
+        copy_overrides: Optional[Dict[str, str]] = None,
+        table_columns: Optional[List[str]] = None,
+        rows_prev: Optional[List[Dict[str, Any]]] = None,
+        rows_ytd: Optional[List[List[Dict[str, Any]]]] = None,
+        rows_ytd_prev: Optional[List[List[Dict[str, Any]]]] = None,
+        extra_prev: Optional[Dict[str, Any]] = None,
+        totals_prev: Optional[Dict[str, Any]] = None,
+        totals_ytd: Optional[Dict[str, Any]] = None,
+        totals_ytd_prev: Optional[Dict[str, Any]] = None,
+        batch: Optional[RenderBatch] = None,
+    ) -> Iterator[str]:
+        """
+        HTML do e-mail em pedaços de até STREAM_CHUNK_SIZE caracteres
+        (template.generate), sem montar o documento inteiro na memória.
+
+        Linhas, KPIs e textos são preparados já na chamada (erros de dados
+        aparecem aqui, antes do primeiro pedaço); o template roda sob demanda,
+        então erros do próprio template só surgem ao consumir os pedaços.
+        """
+        template, template_vars = self._template_context(
+            unidade=unidade,
+            regiao=regiao,
+            ym=ym,
+            rows=rows,
+            summary=summary,
+            destinatarios_exibicao=destinatarios_exibicao,
+            copy_overrides=copy_overrides,
+            table_columns=table_columns,
+            rows_prev=rows_prev,
+            rows_ytd=rows_ytd,
+            rows_ytd_prev=rows_ytd_prev,
+            extra_prev=extra_prev,
+            totals_prev=totals_prev,
+            totals_ytd=totals_ytd,
+            totals_ytd_prev=totals_ytd_prev,
+            batch=batch,
         )
-        return html
+        return _joined_chunks(template.generate(template_vars), self.STREAM_CHUNK_SIZE)
+
+    def render_to_file(
+        self,
+        path: Path,
+        unidade: str,
+        regiao: str,
+        ym: str,
+        rows: List[Dict[str, Any]],
+        summary: Dict[str, Any],
+        destinatarios_exibicao: str = "",
+        copy_overrides: Optional[Dict[str, str]] = None,
+        table_columns: Optional[List[str]] = None,
+        rows_prev: Optional[List[Dict[str, Any]]] = None,
+        rows_ytd: Optional[List[List[Dict[str, Any]]]] = None,
+        rows_ytd_prev: Optional[List[List[Dict[str, Any]]]] = None,
+        extra_prev: Optional[Dict[str, Any]] = None,
+        totals_prev: Optional[Dict[str, Any]] = None,
+        totals_ytd: Optional[Dict[str, Any]] = None,
+        totals_ytd_prev: Optional[Dict[str, Any]] = None,
+        batch: Optional[RenderBatch] = None,
+    ) -> Path:
+        """
+        Grava o HTML em path à medida que o template é renderizado.
+
+        Escreve num arquivo temporário ao lado e troca no fim: quem lê o
+        HTML (preview, envio) nunca vê um arquivo pela metade.
+        """
+        path = Path(path)
+        chunks = self.render_stream(
+            unidade=unidade,
+            regiao=regiao,
+            ym=ym,
+            rows=rows,
+            summary=summary,
+            destinatarios_exibicao=destinatarios_exibicao,
+            copy_overrides=copy_overrides,
+            table_columns=table_columns,
+            rows_prev=rows_prev,
+            rows_ytd=rows_ytd,
+            rows_ytd_prev=rows_ytd_prev,
+            extra_prev=extra_prev,
+            totals_prev=totals_prev,
+            totals_ytd=totals_ytd,
+            totals_ytd_prev=totals_ytd_prev,
+            batch=batch,
+        )
+        tmp = path.with_name(path.name + ".tmp")
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+            os.replace(tmp, path)
+        finally:
+            if tmp.exists():
+                tmp.unlink()
+        return path
+
+    def batch_context(self, hoje: Optional[str] = None) -> RenderBatch:
+        """Contexto invariante para vários render_html seguidos (passar como batch=)."""
+        return RenderBatch(self, hoje)
+
+    def render_many(
+        self,
+        units_payloads: Iterable[Dict[str, Any]],
+        workers: int = 1,
+        paths: Optional[List[Path]] = None,
+    ) -> List[Any]:
+        """
+        Renderiza várias unidades com o mesmo contexto de lote.
+
+        Cada payload traz os argumentos de render_html (unidade, regiao, ym,
+        rows, summary, ...). Com workers > 1 as unidades são renderizadas num
+        pool de processos; cada processo resolve o lote uma vez e todos usam
+        a mesma data de geração.
+
+        Com paths (um por payload), cada HTML é gravado direto no arquivo
+        (render_to_file) e nenhum documento inteiro fica na memória.
+
+        Returns:
+            HTMLs (ou os paths gravados) na ordem dos payloads
+        """
+        payloads = list(units_payloads)
+        targets = list(paths) if paths is not None else [None] * len(payloads)
+        if len(targets) != len(payloads):
+            raise ValueError(f"render_many: {len(targets)} paths para {len(payloads)} payloads")
+        batch = self.batch_context()
+        max_workers = min(workers or 1, len(payloads))
+        if max_workers <= 1:
+            return [
+                self.render_to_file(path, **payload, batch=batch) if path is not None
+                else self.render_html(**payload, batch=batch)
+                for payload, path in zip(payloads, targets)
+            ]
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=_init_render_worker,
+            initargs=(self.templates_dir, self.assets_dir, self.env_cfg, batch.hoje),
+        ) as pool:
+            chunksize = max(1, len(payloads) // (max_workers * 4))
+            return list(pool.map(_render_in_worker, payloads, targets, chunksize=chunksize))
 
     def subject(
         self,
@@ -594,11 +1205,11 @@ class Emailer:
                 att = mail.Attachments.Add(str(logo_path))
                 pa = att.PropertyAccessor
                 # PR_ATTACH_CONTENT_ID (Unicode)
-                pa.SetProperty("http://schemas.microsoft.com/mapi/proptag/0x3712001F", self.env_cfg.get("LOGO_CID", "atlas-logo"))
+                pa.SetProperty("http://schemas.microsoft.com/mapi/proptag/0x3712001F", self.logo_cid())
                 # PR_ATTACHMENT_HIDDEN (bool)
                 pa.SetProperty("http://schemas.microsoft.com/mapi/proptag/0x3714000B", True)
                 # MIME tag
-                mime = "image/png" if logo_path.suffix.lower() == ".png" else "image/jpeg"
+                mime = image_mime(logo_path)
                 pa.SetProperty("http://schemas.microsoft.com/mapi/proptag/0x370E001F", mime)
                 # posição de renderização (0)
                 try:
@@ -696,7 +1307,7 @@ class Emailer:
             from_email=from_email,
             to_emails=recipients,
             subject=subject,
-            html_content=html
+            html_content=self.inline_assets(html)  # LOGO_MODE=cid: logo embutida só no envio
         )
         
         # Adiciona CC se fornecido
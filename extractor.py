@@ -1,122 +1,908 @@
 # extractor_optimized.py — leitura Excel otimizada com cache
 
 from pathlib import Path
+import hashlib
+import os
+import pickle
+import numpy as np
 import pandas as pd
 import re
-from typing import Optional, Tuple
-from functools import lru_cache
+import threading
+import time
+import weakref
+from fnmatch import fnmatch
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from openpyxl import load_workbook
+
+import xlsx_fast
+from processor import pipeline_column_filter, typed_column_filter
+
+try:  # Parquet é opcional: sem pyarrow os snapshots usam pickle
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - depende do ambiente
+    pa = None
+    pq = None
 
 # Regex pré-compilado
 HEADER_CLEANUP = re.compile(r"\s+")
 
+# Engines de leitura alternativos ("stream" e "fast")
+EXTRACTOR_ENGINE_ENV = "EXTRACTOR_ENGINE"
+ENGINES = ("pandas", "stream", "fast")
+EXTRACTOR_TYPED_ENV = "EXTRACTOR_TYPED"
+EXTRACTOR_CATEGORICAL_ENV = "EXTRACTOR_CATEGORICAL"
+# Colunas de texto com até esta fração de valores distintos viram Categorical
+CATEGORICAL_MAX_RATIO = 0.5
+# Linhas vazias seguidas que encerram a leitura (abas com max_row inflado por formatação)
+EMPTY_ROW_RUN_LIMIT = 1000
+# Mesmos textos que o pd.read_excel trata como ausentes (na_values padrão)
+NA_STRINGS = frozenset({
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan",
+    "1.#IND", "1.#QNAN", "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+})
+# Erros do Excel (no modo values_only chegam como texto; o pandas os converte em NaN)
+EXCEL_ERROR_CODES = frozenset({
+    "#NULL!", "#DIV/0!", "#VALUE!", "#REF!", "#NAME?", "#NUM!", "#N/A",
+    "#GETTING_DATA", "#SPILL!", "#CALC!", "#FIELD!", "#BLOCKED!", "#CONNECT!", "#BUSY!", "#UNKNOWN!",
+})
+
+
+def _clean_header(c) -> str:
+    """Limpeza de cabeçalho aplicada por todos os leitores."""
+    return HEADER_CLEANUP.sub(" ", str(c).replace("\u00A0", " ").replace("&nbsp;", " ").replace("\r", " ").replace("\n", " ")).strip()
+
+
+def _raw_cell(v):
+    """Valor de célula como o read_excel(dtype=object) entrega: ausentes/erros viram NaN e 1.0 vira 1."""
+    if v is None:
+        return np.nan
+    if isinstance(v, str):
+        return np.nan if v in NA_STRINGS or v in EXCEL_ERROR_CODES else v
+    if isinstance(v, float) and v.is_integer():
+        return int(v)
+    return v
+
+
+def _clean_values(series: pd.Series) -> pd.Series:
+    """Valores como texto sem espaços nas bordas (mesma limpeza para todos os engines)."""
+    # O fillna reinfere o tipo de colunas sem vazios (ex.: [0.5, 1] vira float64 -> "1.0")
+    return series.fillna("").astype(str).str.strip()
+
+
+def _typed_value(v):
+    """Valor nativo da célula (extração tipada): números e datas ficam como estão, texto sem espaços, ausentes viram ""."""
+    v = _raw_cell(v)
+    if isinstance(v, str):
+        return v.strip()
+    if v is pd.NaT or (isinstance(v, float) and v != v):
+        return ""
+    return v
+
+
+def _typed_values(values: Iterable, index=None) -> pd.Series:
+    # dtype object explícito: sem reinferência de tipo da coluna
+    return pd.Series([_typed_value(v) for v in values], index=index, dtype=object)
+
+
+def _categorize(df: pd.DataFrame, max_ratio: float = CATEGORICAL_MAX_RATIO) -> pd.DataFrame:
+    """
+    Converte (no lugar) as colunas de texto com poucos valores distintos
+    (unidade, fornecedor, mês, e-mails...) em Categorical: cada texto
+    distinto fica guardado uma vez e o processor passa a trabalhar por
+    categoria. Colunas tipadas (números/datas) não são alteradas.
+    """
+    n = len(df)
+    if n == 0:
+        return df
+    for i in range(df.shape[1]):
+        col = df.iloc[:, i]
+        if col.dtype != object or pd.api.types.infer_dtype(col, skipna=False) != "string":
+            continue
+        if col.nunique() <= max_ratio * n:
+            df.isetitem(i, col.astype("category"))
+    return df
+
+
+def _dedup_headers(raw: List) -> List:
+    """Nomes de coluna como o read_excel: vazios viram 'Unnamed: i' e duplicados ganham sufixo '.n'."""
+    names = []
+    unnamed = []
+    for i, c in enumerate(raw):
+        if c is None or c == "":
+            names.append(f"Unnamed: {i}")
+            unnamed.append(i)
+        elif isinstance(c, float) and c.is_integer():
+            names.append(int(c))
+        else:
+            names.append(c)
+
+    counts: dict = {}
+    original = list(names)
+    order = [i for i in range(len(names)) if i not in set(unnamed)] + unnamed
+    for i in order:
+        col = names[i]
+        old_col = col
+        cur_count = counts.get(col, 0)
+        while cur_count > 0:
+            counts[old_col] = cur_count + 1
+            col = f"{old_col}.{cur_count}"
+            cur_count = cur_count + 1 if col in original else counts.get(col, 0)
+        names[i] = col
+        counts[col] = cur_count + 1
+    return names
+
+
+def rows_to_frame(
+    rows_iter: Iterator[tuple],
+    keep_column: Optional[Callable[[str], bool]] = None,
+    empty_run_limit: int = EMPTY_ROW_RUN_LIMIT,
+    typed_column: Optional[Callable[[str], bool]] = None,
+) -> pd.DataFrame:
+    """
+    Monta o DataFrame limpo a partir de linhas de valores (como as de
+    openpyxl iter_rows(values_only=True)), com o mesmo resultado da leitura
+    via pandas: cabeçalhos limpos e valores como texto sem espaços nas bordas.
+
+    Para após empty_run_limit linhas vazias seguidas e, com keep_column,
+    só converte as colunas aceitas. Colunas aceitas por typed_column mantêm
+    o valor nativo (ver _typed_value).
+    """
+    header = list(next(rows_iter, ()) or ())
+    raw_rows = []
+    pending_empty = 0
+    for row in rows_iter:
+        if all(v is None or v == "" for v in row):
+            pending_empty += 1
+            if pending_empty >= empty_run_limit:
+                break
+            continue
+        # Linhas vazias no meio dos dados são mantidas (como no read_excel)
+        raw_rows.extend([()] * pending_empty)
+        pending_empty = 0
+        raw_rows.append(row)
+
+    # Largura: última célula preenchida entre cabeçalho e dados
+    def _width(row) -> int:
+        n = len(row)
+        while n and (row[n - 1] is None or row[n - 1] == ""):
+            n -= 1
+        return n
+
+    width = max([_width(header)] + [_width(r) for r in raw_rows]) if (header or raw_rows) else 0
+    names = [_clean_header(c) for c in _dedup_headers(header[:width] + [None] * (width - len(header)))]
+    positions = [i for i, name in enumerate(names) if keep_column is None or keep_column(name)]
+
+    if not positions:
+        return pd.DataFrame(index=range(len(raw_rows)))
+    columns = []
+    for pos in positions:
+        values = [r[pos] if pos < len(r) else None for r in raw_rows]
+        if typed_column is not None and typed_column(names[pos]):
+            columns.append(_typed_values(values))
+        else:
+            columns.append(_clean_values(pd.Series([_raw_cell(v) for v in values], dtype=object)))
+    df = pd.concat(columns, axis=1, ignore_index=True)
+    df.columns = [names[pos] for pos in positions]
+    return df
+
+
+def read_sheet_streaming(
+    path: Path,
+    sheet_name: str,
+    keep_column: Optional[Callable[[str], bool]] = None,
+    empty_run_limit: int = EMPTY_ROW_RUN_LIMIT,
+    typed_column: Optional[Callable[[str], bool]] = None,
+) -> pd.DataFrame:
+    """Lê uma aba com openpyxl em modo read_only/values_only, linha a linha (engine="stream")."""
+    wb = load_workbook(path, read_only=True, data_only=True, keep_links=False)
+    try:
+        ws = wb[sheet_name]
+        ws.reset_dimensions()  # ignora o max_row/max_column gravado no arquivo
+        return rows_to_frame(ws.iter_rows(values_only=True), keep_column, empty_run_limit, typed_column)
+    finally:
+        wb.close()
+
+
+def _decode_sheet_fast(
+    catalog: Optional[xlsx_fast.WorkbookCatalog],
+    sheet_name: str,
+    prune_columns: bool = False,
+    keep_columns: Optional[List[str]] = None,
+    typed: bool = False,
+    categorical: bool = False,
+) -> pd.DataFrame:
+    """Decodifica uma aba pelo engine "fast"; sem catálogo usa o do processo do pool."""
+    catalog = catalog or xlsx_fast.worker_catalog()
+    keep = pipeline_column_filter(keep_columns) if prune_columns else None
+    typed_column = typed_column_filter() if typed else None
+    df = rows_to_frame(xlsx_fast.iter_sheet_rows(catalog, sheet_name), keep, typed_column=typed_column)
+    return _categorize(df) if categorical else df
+
+
+# Snapshots em disco das abas já limpas (compartilhados entre CLI e backend)
+SNAPSHOT_DIR_ENV = "SHEET_SNAPSHOT_DIR"
+DEFAULT_SNAPSHOT_DIR = Path(__file__).resolve().parent / ".cache" / "sheets"
+# Incrementar quando a limpeza do DataFrame mudar (invalida snapshots antigos)
+SNAPSHOT_VERSION = 2
+
+
+def default_snapshot_dir() -> Path:
+    """Pasta de snapshots: SHEET_SNAPSHOT_DIR ou .cache/sheets na raiz do projeto."""
+    env_dir = os.getenv(SNAPSHOT_DIR_ENV, "").strip()
+    return Path(env_dir) if env_dir else DEFAULT_SNAPSHOT_DIR
+
+
+class SheetSnapshotCache:
+    """
+    Cache em disco das abas regionais já limpas.
+
+    A chave é (caminho da planilha, mtime, tamanho, região): qualquer
+    alteração no arquivo gera uma chave nova e o snapshot anterior do mesmo
+    arquivo/região é removido. Grava Parquet quando o pyarrow está
+    disponível e pickle caso contrário.
+    """
+
+    def __init__(self, directory: Optional[Path] = None):
+        self.directory = Path(directory) if directory else default_snapshot_dir()
+
+    def _prefix(self, path: Path, regiao: str) -> str:
+        ident = f"{Path(path).resolve()}|{regiao}".encode("utf-8")
+        return hashlib.sha1(ident).hexdigest()[:20]
+
+    def _stem(self, path: Path, regiao: str) -> Optional[str]:
+        try:
+            st = Path(path).stat()
+        except OSError:
+            return None
+        return f"{self._prefix(path, regiao)}-{st.st_mtime_ns}-{st.st_size}-v{SNAPSHOT_VERSION}"
+
+    def load(self, path: Path, regiao: str) -> Optional[Tuple[pd.DataFrame, str]]:
+        """Retorna (df, nome da aba) do snapshot válido, ou None."""
+        stem = self._stem(path, regiao)
+        if stem is None:
+            return None
+        try:
+            parquet_file = self.directory / f"{stem}.parquet"
+            if pq is not None and parquet_file.exists():
+                table = pq.read_table(parquet_file)
+                sheet_name = (table.schema.metadata or {}).get(b"sheet_name", b"").decode("utf-8")
+                return table.to_pandas(), sheet_name
+
+            pickle_file = self.directory / f"{stem}.pkl"
+            if pickle_file.exists():
+                with open(pickle_file, "rb") as f:
+                    payload = pickle.load(f)
+                return payload["df"], payload["sheet_name"]
+        except Exception as e:
+            print(f"[WARN] Snapshot da planilha ignorado ({Path(path).name}): {e}")
+        return None
+
+    def store(self, path: Path, regiao: str, df: pd.DataFrame, sheet_name: str) -> Optional[Path]:
+        """Grava o snapshot de forma atômica e remove versões antigas do mesmo arquivo/região."""
+        stem = self._stem(path, regiao)
+        if stem is None:
+            return None
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            target = None
+            if pq is not None:
+                try:
+                    table = pa.Table.from_pandas(df, preserve_index=False)
+                    metadata = dict(table.schema.metadata or {})
+                    metadata[b"sheet_name"] = sheet_name.encode("utf-8")
+                    target = self.directory / f"{stem}.parquet"
+                    tmp = target.with_name(f"{target.name}.{os.getpid()}.tmp")
+                    pq.write_table(table.replace_schema_metadata(metadata), tmp)
+                    os.replace(tmp, target)
+                except Exception:
+                    # Ex.: cabeçalhos duplicados não são aceitos pelo Parquet
+                    target = None
+            if target is None:
+                target = self.directory / f"{stem}.pkl"
+                tmp = target.with_name(f"{target.name}.{os.getpid()}.tmp")
+                with open(tmp, "wb") as f:
+                    pickle.dump({"df": df, "sheet_name": sheet_name}, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp, target)
+        except Exception as e:
+            print(f"[WARN] Nao foi possivel gravar snapshot da planilha ({Path(path).name}): {e}")
+            return None
+
+        self._prune(path, regiao, keep=target)
+        return target
+
+    def _prune(self, path: Path, regiao: str, keep: Path) -> None:
+        prefix = self._prefix(path, regiao)
+        for old in self.directory.glob(f"{prefix}-*"):
+            if old != keep and not old.name.endswith(".tmp"):
+                try:
+                    old.unlink()
+                except OSError:
+                    pass
+
+
+# Cache em memória das abas lidas (compartilhado pelos Extractors do processo)
+SHEET_CACHE_MB_ENV = "SHEET_CACHE_MAX_MB"
+DEFAULT_SHEET_CACHE_MB = 256
+
+
+def file_identity(path: Path) -> Optional[Tuple[str, int, int]]:
+    """(caminho absoluto, mtime_ns, tamanho) do arquivo, ou None se não existir."""
+    try:
+        resolved = Path(path).resolve()
+        st = resolved.stat()
+    except OSError:
+        return None
+    return str(resolved), st.st_mtime_ns, st.st_size
+
+
+def _estimate_bytes(value: Any) -> int:
+    """Tamanho aproximado de uma entrada do cache (DataFrames pelo memory_usage)."""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, (tuple, list)):
+        return 64 + sum(_estimate_bytes(v) for v in value)
+    if isinstance(value, str):
+        return 49 + len(value)
+    return 64
+
+
+def _detached(value: Any) -> Any:
+    """Cópia dos DataFrames (também dentro de tuplas); os demais valores voltam como estão."""
+    if isinstance(value, pd.DataFrame):
+        return value.copy()
+    if isinstance(value, tuple):
+        return tuple(_detached(v) for v in value)
+    return value
+
+
+class SheetCache:
+    """
+    LRU em memória limitado por bytes, com chave (caminho, mtime_ns,
+    tamanho, tipo): um arquivo alterado ou substituído gera chave nova e a
+    entrada antiga do mesmo arquivo é descartada ao gravar.
+
+    DataFrames entram e saem como cópias: quem altera a aba que leu não
+    muda o cache nem o que os outros leitores recebem.
+
+    Conta acertos, faltas e remoções (stats()) e aceita invalidação
+    explícita por arquivo (invalidate()), usada após uploads.
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None):
+        if max_bytes is None:
+            max_bytes = int(float(os.getenv(SHEET_CACHE_MB_ENV, DEFAULT_SHEET_CACHE_MB)) * 1024 * 1024)
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple, Tuple[Any, int]]" = OrderedDict()
+        self._lock = threading.RLock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, path: Path, kind: str) -> Optional[Any]:
+        ident = file_identity(path)
+        with self._lock:
+            entry = self._entries.get((ident, kind)) if ident else None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((ident, kind))
+            self.hits += 1
+        return _detached(entry[0])
+
+    def put(self, path: Path, kind: str, value: Any) -> None:
+        ident = file_identity(path)
+        if ident is None:
+            return
+        value = _detached(value)
+        size = _estimate_bytes(value)
+        with self._lock:
+            # Versões anteriores do mesmo arquivo não serão mais lidas
+            for key in [k for k in self._entries if k[0][0] == ident[0] and k[1] == kind]:
+                self._discard(key)
+            if size > self.max_bytes:
+                return
+            self._entries[(ident, kind)] = (value, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                self._discard(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _discard(self, key: Tuple) -> None:
+        _value, size = self._entries.pop(key)
+        self.current_bytes -= size
+
+    def invalidate(self, path: Optional[Path] = None, kind: Optional[str] = None) -> int:
+        """
+        Remove as entradas do arquivo (todas, sem path); com kind, só as
+        desse tipo. Retorna quantas saíram.
+        """
+        with self._lock:
+            if path is None:
+                keys = list(self._entries)
+            else:
+                target = str(Path(path).resolve())
+                keys = [k for k in self._entries if k[0][0] == target]
+            if kind is not None:
+                keys = [k for k in keys if k[1] == kind]
+            for key in keys:
+                self._discard(key)
+            return len(keys)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+_shared_sheet_cache: Optional[SheetCache] = None
+
+
+def shared_sheet_cache() -> SheetCache:
+    """Cache padrão dos Extractors (um por processo)."""
+    global _shared_sheet_cache
+    if _shared_sheet_cache is None:
+        _shared_sheet_cache = SheetCache()
+    return _shared_sheet_cache
+
+
+# Métodos chamados por invalidate_workbook (caches montados fora do extractor,
+# ex.: RegionFrames do PipelineService); referências fracas, não prendem o dono
+_invalidation_hooks: List["weakref.WeakMethod"] = []
+_invalidation_hooks_lock = threading.Lock()
+
+
+def on_invalidate_workbook(method: Callable[[Path], Any]) -> None:
+    """Registra um método de instância chamado com o caminho a cada invalidate_workbook."""
+    with _invalidation_hooks_lock:
+        _invalidation_hooks.append(weakref.WeakMethod(method))
+
+
+def clear_sheet_cache() -> int:
+    """Esvazia o cache compartilhado (todas as planilhas, de todos os Extractors)."""
+    return shared_sheet_cache().invalidate()
+
+
+def invalidate_workbook(path: Path) -> int:
+    """
+    Descarta do cache compartilhado tudo que foi lido do arquivo e marca o
+    índice da pasta para nova varredura (ex.: após novo upload ou remoção).
+    Os métodos registrados em on_invalidate_workbook também são avisados.
+    """
+    workbook_index(Path(path).parent).refresh()
+    with _invalidation_hooks_lock:
+        _invalidation_hooks[:] = [ref for ref in _invalidation_hooks if ref() is not None]
+        hooks = [ref() for ref in _invalidation_hooks]
+    for hook in hooks:
+        if hook is not None:
+            hook(Path(path))
+    return shared_sheet_cache().invalidate(path)
+
+
+# Janela em que o mtime da pasta não é confiável para pular a varredura
+RACY_MTIME_NS = 2_000_000_000
+
+
+def workbook_patterns(regiao: str) -> List[str]:
+    """Padrões de nome da planilha da região, em ordem de prioridade."""
+    return [
+        f"*planilha *Medição Mensal*_{regiao}_*.xlsx",
+        f"*Medição Mensal*_{regiao}.xlsx",
+        f"*Medição*{regiao}*.xlsx",
+    ]
+
+
+class WorkbookIndex:
+    """
+    Índice das planilhas .xlsx de uma pasta, montado com um único
+    os.scandir (nome, caminho e mtime de cada arquivo).
+
+    A pasta é varrida de novo quando o mtime dela muda (arquivo criado,
+    removido ou renomeado) ou após refresh(). A planilha escolhida por
+    região fica memorizada até a próxima varredura.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self._lock = threading.RLock()
+        self._dir_mtime_ns: Optional[int] = None
+        self._entries: List[Tuple[str, Path, float]] = []
+        self._by_region: Dict[str, Optional[Path]] = {}
+
+    def refresh(self) -> None:
+        """Força nova varredura na próxima consulta."""
+        with self._lock:
+            self._dir_mtime_ns = None
+
+    def _scan(self) -> None:
+        try:
+            dir_mtime = os.stat(self.directory).st_mtime_ns
+        except OSError:
+            dir_mtime = -1
+        if dir_mtime == self._dir_mtime_ns:
+            return
+        entries = []
+        if dir_mtime != -1:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if not os.path.normcase(entry.name).endswith(".xlsx") or entry.name.startswith("~$"):
+                        continue
+                    try:
+                        if entry.is_file():
+                            entries.append((entry.name, Path(entry.path), entry.stat().st_mtime))
+                    except OSError:
+                        continue
+        self._entries = entries
+        self._by_region = {}
+        # mtime da pasta muito recente pode não refletir alterações no mesmo
+        # tique do relógio do sistema de arquivos: varre de novo na próxima vez
+        racy = dir_mtime >= time.time_ns() - RACY_MTIME_NS
+        self._dir_mtime_ns = None if racy else dir_mtime
+
+    def files(self) -> List[Path]:
+        """Planilhas .xlsx da pasta (ignora arquivos temporários do Excel)."""
+        with self._lock:
+            self._scan()
+            return [path for _name, path, _mtime in self._entries]
+
+    def find(
+        self,
+        regiao: str,
+        sheet_names: Optional[Callable[[Path], Iterable[str]]] = None,
+    ) -> Optional[Path]:
+        """
+        Planilha da região: a mais recente do primeiro padrão de nome com
+        resultados; sem nenhum, a primeira com aba 'Faturamento <regiao>'
+        (consultada via sheet_names, não memorizada).
+        """
+        with self._lock:
+            self._scan()
+            if regiao not in self._by_region:
+                found = None
+                for pat in workbook_patterns(regiao):
+                    # fnmatch normaliza a caixa como o sistema (sem distinção no Windows, igual ao Path.glob)
+                    matches = [(mtime, path) for name, path, mtime in self._entries if fnmatch(name, pat)]
+                    if matches:
+                        # Mais recente primeiro (empate: ordem da varredura)
+                        found = max(matches, key=lambda m: m[0])[1]
+                        break
+                self._by_region[regiao] = found
+            found = self._by_region[regiao]
+            entries = list(self._entries)
+
+        if found is not None or sheet_names is None:
+            return found
+        for _name, path, _mtime in entries:
+            if find_region_sheet(sheet_names(path), regiao):
+                return path
+        return None
+
+
+_workbook_indexes: Dict[str, WorkbookIndex] = {}
+_workbook_indexes_lock = threading.Lock()
+
+
+def workbook_index(directory: Path) -> WorkbookIndex:
+    """Índice compartilhado da pasta (um por caminho absoluto, no processo)."""
+    key = str(Path(directory).resolve())
+    with _workbook_indexes_lock:
+        index = _workbook_indexes.get(key)
+        if index is None:
+            index = _workbook_indexes[key] = WorkbookIndex(Path(directory))
+        return index
+
+
+def find_region_sheet(sheet_names: Iterable[str], regiao: str) -> Optional[str]:
+    """Aba 'Faturamento <regiao>' (comparação sem caixa, aceita nome contido), ou None."""
+    target = f"Faturamento {regiao}".lower().strip()
+    for s in sheet_names:
+        if s.lower().strip() == target or target in s.lower().strip():
+            return s
+    return None
+
+
+def _catalog_names(source) -> Optional[Tuple[str, ...]]:
+    """Abas de um caminho ou arquivo binário aberto; None se ilegível."""
+    try:
+        return tuple(xlsx_fast.read_sheet_names(source))
+    except Exception:
+        if hasattr(source, "seek"):
+            source.seek(0)
+        try:
+            return tuple(pd.ExcelFile(source).sheet_names)
+        except Exception:
+            return None
+
+
+def read_sheet_names(path: Union[Path, BinaryIO], cache: Optional[SheetCache] = None) -> Tuple[str, ...]:
+    """
+    Nomes das abas com cache pela identidade do arquivo (caminho, mtime,
+    tamanho). Lê só o xl/workbook.xml do zip; outros formatos (.xls) passam
+    pelo pd.ExcelFile. Arquivo ilegível retorna tupla vazia.
+
+    Também aceita um arquivo binário aberto com a planilha inteira (ex.:
+    upload ainda não salvo): nesse caso não há cache e a posição de leitura
+    é restaurada.
+    """
+    if hasattr(path, "read"):
+        pos = path.tell()
+        try:
+            return _catalog_names(path) or tuple()
+        finally:
+            path.seek(pos)
+    cache = cache if cache is not None else shared_sheet_cache()
+    names = cache.get(path, "sheet_names")
+    if names is not None:
+        return names
+    names = _catalog_names(path)
+    if names is None:
+        return tuple()
+    cache.put(path, "sheet_names", names)
+    return names
+
 
 class Extractor:
-    def __init__(self, xlsx_dir: Path):
+    def __init__(
+        self,
+        xlsx_dir: Path,
+        snapshot_dir: Optional[Path] = None,
+        engine: Optional[str] = None,
+        cache: Optional[SheetCache] = None,
+        typed: Optional[bool] = None,
+        categorical: Optional[bool] = None,
+    ):
         self.xlsx_dir = Path(xlsx_dir)
-        self._sheet_cache = {}  # Cache de abas por arquivo
+        # "pandas" (pd.read_excel), "stream" (openpyxl read_only, ver read_sheet_streaming)
+        # ou "fast" (zip + iterparse, ver xlsx_fast)
+        self.engine = (engine or os.getenv(EXTRACTOR_ENGINE_ENV, "") or "pandas").strip().lower()
+        if self.engine not in ENGINES:
+            raise ValueError(f"Engine de leitura inválida: {self.engine} (opções: {', '.join(ENGINES)})")
+        # Extração tipada: colunas monetárias e de mês com o valor nativo da célula
+        if typed is None:
+            typed = os.getenv(EXTRACTOR_TYPED_ENV, "").strip().lower() in ("1", "true", "yes", "sim")
+        self.typed = typed
+        # Colunas de texto repetitivas como Categorical (ver _categorize)
+        if categorical is None:
+            categorical = os.getenv(EXTRACTOR_CATEGORICAL_ENV, "").strip().lower() in ("1", "true", "yes", "sim")
+        self.categorical = categorical
+        # Cache de abas e nomes de abas por arquivo (padrão: compartilhado no processo)
+        self.cache = cache if cache is not None else shared_sheet_cache()
+        # Entradas (arquivo, tipo) que esta instância usou, para clear_cache()
+        self._cache_keys: set = set()
+        # Snapshots em disco (compartilhados entre processos e instâncias)
+        self.snapshots = SheetSnapshotCache(snapshot_dir)
+        # Índice da pasta de planilhas (compartilhado entre instâncias)
+        self.index = workbook_index(self.xlsx_dir)
 
     def find_workbook(self, regiao: str) -> Optional[Path]:
-        """Busca workbook de forma otimizada."""
-        patterns = [
-            f"*planilha *Medição Mensal*_{regiao}_*.xlsx",
-            f"*Medição Mensal*_{regiao}.xlsx",
-            f"*Medição*{regiao}*.xlsx",
-        ]
-        
-        # Busca direta por padrões
-        for pat in patterns:
-            matches = [
-                m for m in self.xlsx_dir.glob(pat) 
-                if not m.name.startswith("~$")
-            ]
-            if matches:
-                # Ordena por modificação (mais recente primeiro)
-                matches.sort(key=lambda p: p.stat().st_mtime, reverse=True)
-                return matches[0]
-        
-        # Fallback: busca em todos os .xlsx
-        target = f"Faturamento {regiao}".lower().strip()
-        candidates = [
-            p for p in self.xlsx_dir.glob("*.xlsx") 
-            if not p.name.startswith("~$")
-        ]
-        
-        for p in candidates:
-            try:
-                # Usa cache se possível
-                sheet_names = self._get_sheet_names(p)
-                for s in sheet_names:
-                    if s.lower().strip() == target or target in s.lower().strip():
-                        return p
-            except Exception:
-                continue
-        
-        return None
+        """Busca workbook pelo índice da pasta (padrões de nome e, em último caso, abas)."""
+        return self.index.find(regiao, self._get_sheet_names)
+
+    def workbook_files(self) -> List[Path]:
+        """Planilhas .xlsx da pasta (ignora arquivos temporários do Excel)."""
+        return self.index.files()
+
+    def available_regions(self, regioes: Iterable[str]) -> List[str]:
+        """Regiões (entre as informadas) com aba 'Faturamento <regiao>' em alguma planilha da pasta."""
+        sheet_lists = [self._get_sheet_names(p) for p in self.workbook_files()]
+        return [r for r in regioes if any(find_region_sheet(names, r) for names in sheet_lists)]
 
-    @lru_cache(maxsize=10)
     def _get_sheet_names(self, path: Path) -> Tuple[str, ...]:
-        """Obtém nomes de abas com cache."""
-        try:
-            xl = pd.ExcelFile(path)
-            return tuple(xl.sheet_names)
-        except Exception:
-            return tuple()
+        """Obtém nomes de abas com cache (chave inclui mtime e tamanho do arquivo)."""
+        self._cache_keys.add((Path(path), "sheet_names"))
+        return read_sheet_names(path, self.cache)
+
+    @staticmethod
+    def _match_region_sheet(sheet_names: Iterable[str], regiao: str, path: Path) -> str:
+        """Aba 'Faturamento <regiao>' (comparação sem caixa, aceita nome contido)."""
+        sheet_name = find_region_sheet(sheet_names, regiao)
+        if sheet_name is not None:
+            return sheet_name
+        raise RuntimeError(
+            f"Aba 'Faturamento {regiao}' não encontrada em {path.name}. "
+            f"Abas: {list(sheet_names)}"
+        )
+
+    @staticmethod
+    def _cache_variant(
+        regiao: str, prune_columns: bool, extra: List[str], typed: bool = False, categorical: bool = False
+    ) -> str:
+        # Leituras com colunas podadas, tipadas ou categóricas têm cache próprio
+        variant = f"{regiao}|typed" if typed else regiao
+        if categorical:
+            variant += "|cat"
+        if not prune_columns:
+            return variant
+        return f"{variant}|cols:" + hashlib.sha1("\x1f".join(extra).encode("utf-8")).hexdigest()[:12]
+
+    def _cached(self, path: Path, variant: str) -> Optional[Tuple[pd.DataFrame, str]]:
+        """Cache em memória e, em seguida, snapshot em disco da mesma versão do arquivo."""
+        kind = f"sheet:{variant}"
+        self._cache_keys.add((Path(path), kind))
+        cached = self.cache.get(path, kind)
+        if cached is not None:
+            return cached
+        snapshot = self.snapshots.load(path, variant)
+        if snapshot is not None:
+            self.cache.put(path, kind, snapshot)
+        return snapshot
+
+    def _remember(self, path: Path, variant: str, result: Tuple[pd.DataFrame, str]) -> None:
+        self._cache_keys.add((Path(path), f"sheet:{variant}"))
+        self.cache.put(path, f"sheet:{variant}", result)
+        self.snapshots.store(path, variant, result[0], result[1])
 
     def read_region_sheet(
         self, 
         path: Path, 
         regiao: str,
-        use_cache: bool = True
+        use_cache: bool = True,
+        engine: Optional[str] = None,
+        prune_columns: bool = False,
+        keep_columns: Optional[Iterable[str]] = None,
+        typed: Optional[bool] = None,
+        categorical: Optional[bool] = None,
     ) -> Tuple[pd.DataFrame, str]:
-        """Lê aba regional de forma otimizada."""
-        
-        # Cache key
-        cache_key = f"{path}:{regiao}"
-        if use_cache and cache_key in self._sheet_cache:
-            return self._sheet_cache[cache_key]
-        
-        target = f"Faturamento {regiao}".lower().strip()
-        sheet_names = self._get_sheet_names(path)
-        
-        sheet_name = None
-        for s in sheet_names:
-            if s.lower().strip() == target or target in s.lower().strip():
-                sheet_name = s
-                break
-        
-        if sheet_name is None:
-            raise RuntimeError(
-                f"Aba 'Faturamento {regiao}' não encontrada em {path.name}. "
-                f"Abas: {list(sheet_names)}"
+        """
+        Lê aba regional de forma otimizada.
+
+        Args:
+            path: Caminho da planilha
+            regiao: Código da região (aba "Faturamento <regiao>")
+            use_cache: Usa o cache em memória e os snapshots em disco
+            engine: "pandas", "stream" ou "fast" (padrão: engine do Extractor)
+            prune_columns: Mantém só as colunas usadas pelo pipeline
+                (processor.pipeline_column_filter) e keep_columns. Com o
+                engine "pandas" a leitura passa a ser em streaming.
+            keep_columns: Colunas extras a manter com prune_columns
+            typed: Extração tipada (padrão: a do Extractor). Colunas
+                monetárias e de mês (processor.typed_column_filter) mantêm
+                números e datas nativos, com "" nas células vazias; as
+                demais continuam como texto.
+            categorical: Colunas de texto com poucos valores distintos
+                como Categorical (padrão: a do Extractor)
+        """
+        engine = engine or self.engine
+        if prune_columns and engine == "pandas":
+            engine = "stream"
+        typed = self.typed if typed is None else typed
+        categorical = self.categorical if categorical is None else categorical
+        extra = sorted(set(keep_columns or [])) if prune_columns else []
+        variant = self._cache_variant(regiao, prune_columns, extra, typed, categorical)
+
+        if use_cache:
+            cached = self._cached(path, variant)
+            if cached is not None:
+                return cached
+
+        if engine == "fast":
+            # Zip + iterparse direto, sem abrir o workbook pelo openpyxl/pandas
+            catalog = xlsx_fast.WorkbookCatalog(path)
+            sheet_name = self._match_region_sheet(catalog.sheet_names, regiao, path)
+            df = _decode_sheet_fast(catalog, sheet_name, prune_columns, extra, typed, categorical)
+        elif engine == "stream":
+            sheet_name = self._match_region_sheet(self._get_sheet_names(path), regiao, path)
+            keep = pipeline_column_filter(extra) if prune_columns else None
+            df = read_sheet_streaming(path, sheet_name, keep_column=keep, typed_column=typed_column_filter() if typed else None)
+        else:
+            sheet_name = self._match_region_sheet(self._get_sheet_names(path), regiao, path)
+
+            # Leitura otimizada do Excel
+            df = pd.read_excel(
+                path, 
+                sheet_name=sheet_name, 
+                dtype=object,
+                engine='openpyxl'  # Engine mais rápida
             )
 
-        # Leitura otimizada do Excel
-        df = pd.read_excel(
-            path, 
-            sheet_name=sheet_name, 
-            dtype=object,
-            engine='openpyxl'  # Engine mais rápida
-        )
+            # Limpeza de cabeçalhos (vetorizada)
+            df.columns = [_clean_header(c) for c in df.columns]
 
-        # Limpeza de cabeçalhos (vetorizada)
-        df.columns = [
-            HEADER_CLEANUP.sub(" ", str(c).replace("\u00A0", " ").replace("&nbsp;", " ").replace("\r", " ").replace("\n", " ")).strip()
-            for c in df.columns
-        ]
+            # Limpeza de valores (vetorizada quando possível)
+            typed_column = typed_column_filter() if typed else None
+            for i, c in enumerate(df.columns):
+                if typed_column is not None and typed_column(c):
+                    df.isetitem(i, _typed_values(df.iloc[:, i], index=df.index))
+                else:
+                    # Usa vectorized operations do pandas
+                    df[c] = _clean_values(df[c])
 
-        # Limpeza de valores (vetorizada quando possível)
-        for c in df.columns:
-            # Usa vectorized operations do pandas
-            df[c] = df[c].fillna("").astype(str).str.strip()
+        if categorical and engine != "fast":
+            _categorize(df)
         
         result = (df, sheet_name)
         
         # Armazena no cache
         if use_cache:
-            self._sheet_cache[cache_key] = result
+            self._remember(path, variant, result)
         
         return result
 
-    def clear_cache(self):
-        """Limpa cache de sheets."""
-        self._sheet_cache.clear()
\ No newline at end of file
+    def read_region_sheets(
+        self,
+        path: Path,
+        regioes: List[str],
+        use_cache: bool = True,
+        workers: Optional[int] = None,
+        prune_columns: bool = False,
+        keep_columns: Optional[Iterable[str]] = None,
+        typed: Optional[bool] = None,
+        categorical: Optional[bool] = None,
+    ) -> Dict[str, Tuple[pd.DataFrame, str]]:
+        """
+        Lê várias abas regionais do mesmo arquivo com o engine "fast".
+
+        O catálogo (abas, estilos e strings compartilhadas) é lido uma vez e
+        as abas que não estão em cache são decodificadas em paralelo em um
+        pool de processos (workers=1 decodifica no próprio processo).
+
+        Returns:
+            Dicionário {regiao: (df, nome da aba)}, igual a read_region_sheet
+        """
+        typed = self.typed if typed is None else typed
+        categorical = self.categorical if categorical is None else categorical
+        extra = sorted(set(keep_columns or [])) if prune_columns else []
+        results: Dict[str, Tuple[pd.DataFrame, str]] = {}
+        pending: Dict[str, str] = {}
+        catalog = None
+
+        for regiao in dict.fromkeys(regioes):
+            variant = self._cache_variant(regiao, prune_columns, extra, typed, categorical)
+            cached = self._cached(path, variant) if use_cache else None
+            if cached is not None:
+                results[regiao] = cached
+                continue
+            if catalog is None:
+                catalog = xlsx_fast.WorkbookCatalog(path)
+            pending[regiao] = self._match_region_sheet(catalog.sheet_names, regiao, path)
+
+        if not pending:
+            return results
+
+        max_workers = min(workers or os.cpu_count() or 1, len(pending))
+        if max_workers <= 1:
+            frames = {
+                r: _decode_sheet_fast(catalog, s, prune_columns, extra, typed, categorical) for r, s in pending.items()
+            }
+        else:
+            with ProcessPoolExecutor(
+                max_workers=max_workers,
+                initializer=xlsx_fast.init_worker,
+                initargs=(catalog,),
+            ) as pool:
+                futures = {
+                    r: pool.submit(_decode_sheet_fast, None, s, prune_columns, extra, typed, categorical)
+                    for r, s in pending.items()
+                }
+                frames = {r: f.result() for r, f in futures.items()}
+
+        for regiao, sheet_name in pending.items():
+            result = (frames[regiao], sheet_name)
+            if use_cache:
+                self._remember(path, self._cache_variant(regiao, prune_columns, extra, typed, categorical), result)
+            results[regiao] = result
+        return results
+
+    def clear_cache(self, path: Optional[Path] = None) -> int:
+        """
+        Limpa do cache as abas e nomes de abas que este Extractor usou (só
+        as do arquivo informado, se houver). Entradas lidas só por outros
+        Extractors ficam; para esvaziar o cache inteiro, clear_sheet_cache().
+        """
+        target = Path(path).resolve() if path is not None else None
+        removed = 0
+        for key_path, kind in list(self._cache_keys):
+            if target is None or key_path.resolve() == target:
+                removed += self.cache.invalidate(key_path, kind)
+                self._cache_keys.discard((key_path, kind))
+        return removed
\ No newline at end of file
@@ -29,7 +29,7 @@ warnings.filterwarnings("ignore", message=".*Data Validation extension.*")
 
 from config_loader import load_overrides, resolve_overrides, ResolvedConfig, OverrideConfigError
 from extractor import Extractor
-from processor import DEFAULT_DISPLAY_COLUMNS, filter_and_prepare, map_columns
+from processor import DEFAULT_DISPLAY_COLUMNS, RegionFrame, build_monthly_cube, cube_totals, prepare_all_units
 from emailer import Emailer
 from utils import (
     previous_month_from_today,
@@ -48,7 +48,7 @@ def print_cache_stats():
     """Imprime estatísticas básicas de cache."""
     try:
         from utils import normalize_text_full, normalize_unit
-        from processor import _norm, _key_equiv
+        from processor import _norm, _key_equiv, _column_mapping, _canonical_rename_plan
 
         print("\n" + "="*50)
         print("ESTATÍSTICAS DE CACHE")
@@ -59,6 +59,8 @@ def print_cache_stats():
             ("normalize_unit", normalize_unit),
             ("_norm", _norm),
             ("_key_equiv", _key_equiv),
+            ("_column_mapping", _column_mapping),
+            ("_canonical_rename_plan", _canonical_rename_plan),
         ]
 
         total_hits = 0
@@ -102,13 +104,22 @@ def clear_all_caches():
         pass
 
     try:
-        from processor import _norm, _key_equiv
+        from processor import _norm, _key_equiv, _column_mapping, _canonical_rename_plan
         _norm.cache_clear()
         _key_equiv.cache_clear()
+        _column_mapping.cache_clear()
+        _canonical_rename_plan.cache_clear()
         print("[CACHE] Cache do processor limpo.")
     except Exception:
         pass
 
+    try:
+        from emailer import clear_template_registries
+        clear_template_registries()
+        print("[CACHE] Templates compilados descartados.")
+    except Exception:
+        pass
+
 COPY_PROMPTS = [
     ("greeting", "COPY_GREETING", "Saudacao"),
     ("intro", "COPY_INTRO", "Introducao"),
@@ -268,7 +279,7 @@ def collect_units(df, unit_col: str) -> Dict[str, str]:
         "preenchimento pendente", "pendente", "nao informado", "não informado",
     }
     mapping: Dict[str, str] = {}
-    for value in df[unit_col].dropna():
+    for value in df[unit_col].dropna().unique():
         raw = str(value).strip()
         lowered = raw.lower()
         normalized = "".join(ch for ch in unicodedata.normalize("NFKD", lowered) if not unicodedata.combining(ch))
@@ -311,6 +322,9 @@ def main() -> None:
     parser.add_argument("--units", required=False, help="Lista de unidades separadas por virgula (ignora menu interativo)")
     parser.add_argument("--columns", required=False, help="Lista de colunas separadas por virgula (ignora menu interativo)")
     parser.add_argument("--portal-overrides-path", required=False, help="Caminho para overrides do portal (JSON por unidade)")
+    parser.add_argument("--engine", choices=["pandas", "stream", "fast"], default=None, help="Leitor da planilha (padrao: EXTRACTOR_ENGINE ou pandas)")
+    parser.add_argument("--typed", action="store_true", default=None, help="Mantem numeros e datas nativos nas colunas de valor/mes (padrao: EXTRACTOR_TYPED)")
+    parser.add_argument("--categorical", action="store_true", default=None, help="Guarda colunas de texto repetitivas como categorias (padrao: EXTRACTOR_CATEGORICAL)")
 
     args = parser.parse_args()
 
@@ -355,14 +369,18 @@ def main() -> None:
     source_label = overrides_data.get("__source__") or ""
     print(f"[INFO] Overrides carregados de: {source_label}" if source_label else "[INFO] Overrides nao informados; utilizando comportamento padrao.")
 
-    extractor = Extractor(Path(args.xlsx_dir))
+    extractor = Extractor(Path(args.xlsx_dir), engine=args.engine, typed=args.typed, categorical=args.categorical)
     emailer = Emailer(templates_dir, assets_dir, env_cfg)
 
     workbook = pick_workbook(Path(args.xlsx_dir), args.regiao, extractor)
     print(f"[INFO] Planilha: {workbook}")
     df, sheet_name = extractor.read_region_sheet(workbook, args.regiao)
 
-    mapping = map_columns(df)
+    # Indexa a planilha uma única vez: todas as consultas por unidade/mês abaixo reutilizam o índice
+    frame = RegionFrame(df)
+    mapping = dict(frame.mapping)
+    # Totais por unidade × mês em uma única passada (mês anterior e YTD saem daqui)
+    monthly_cube = build_monthly_cube(frame)
     unit_col = mapping.get("Unidade")
     mes_col = mapping.get("Mes_Emissão_NF")
 
@@ -498,6 +516,11 @@ def main() -> None:
         if nk and nk not in portal_overrides_norm:
             portal_overrides_norm[nk] = v
 
+    # Compila os textos de copy (padrões, .env, CLI e portal) antes do laço de unidades
+    emailer.precompile_copy(copy_overrides_cli, *[v for v in portal_overrides_norm.values() if isinstance(v, dict)])
+    # Template, logo e cores da marca resolvidos uma vez para todas as unidades
+    render_batch = emailer.batch_context()
+
     for unidade in unidades:
         resolved: Optional[ResolvedConfig] = None
         summary: Optional[Dict[str, Any]] = None
@@ -547,11 +570,10 @@ def main() -> None:
                 pass
 
             # 2) Processamento (filtra + monta rows e colunas)
-            rows, recipients, summary = filter_and_prepare(
-                df,
-                unidade,
-                resolved.mes_ref_final,
-                columns_whitelist=columns_request or None,
+            #    O mês é formatado uma única vez para todas as unidades (cache no frame)
+            prepared = prepare_all_units(frame, resolved.mes_ref_final, {unidade: columns_request or None})
+            rows, recipients, summary = prepared.get(normalize_unit(unidade)) or (
+                [], [], {"row_count": 0, "sum_valor_mensal_final": 0.0}
             )
 
             # 2.1) Mês anterior (para KPIs com comparação)
@@ -568,45 +590,21 @@ def main() -> None:
 
             prev_ym = _prev_month(resolved.mes_ref_final)
             try:
-                rows_prev, _rec_prev, sum_prev = filter_and_prepare(
-                    df,
-                    unidade,
-                    prev_ym,
-                    columns_whitelist=columns_request or None,
-                )
+                sum_prev = cube_totals(monthly_cube, unidade, prev_ym)
             except Exception:
-                rows_prev = []
                 sum_prev = None
 
-            # 2.2) YTD: lista de linhas por mês (desde janeiro até o mês atual)
+            # 2.2) YTD: totais acumulados desde janeiro até o mês atual (e até o mês anterior)
             def _ytd_months(ym: str) -> list[str]:
                 y = int(ym[:4]); m = int(ym[-2:])
                 return [f"{y:04d}-{mm:02d}" for mm in range(1, m + 1)]
 
-            rows_ytd: list[list[dict]] = []
-            rows_ytd_prev: list[list[dict]] = []
             try:
-                for ym_it in _ytd_months(resolved.mes_ref_final):
-                    r_it, _r0, _s0 = filter_and_prepare(
-                        df,
-                        unidade,
-                        ym_it,
-                        columns_whitelist=columns_request or None,
-                    )
-                    rows_ytd.append(r_it)
-                # YTD até o mês anterior (para tendência YTD opcional)
-                prev_list = _ytd_months(prev_ym)
-                for ym_it in prev_list:
-                    r_it, _r0, _s0 = filter_and_prepare(
-                        df,
-                        unidade,
-                        ym_it,
-                        columns_whitelist=columns_request or None,
-                    )
-                    rows_ytd_prev.append(r_it)
+                sum_ytd = cube_totals(monthly_cube, unidade, _ytd_months(resolved.mes_ref_final))
+                sum_ytd_prev = cube_totals(monthly_cube, unidade, _ytd_months(prev_ym))
             except Exception:
-                rows_ytd = []
-                rows_ytd_prev = []
+                sum_ytd = None
+                sum_ytd_prev = None
 
             if not rows:
                 print(f"[WARN] Sem dados para unidade '{unidade}' no mes {resolved.mes_ref_final}; pulando.")
@@ -671,15 +669,14 @@ def main() -> None:
                 regiao=args.regiao,
                 ym=resolved.mes_ref_final,
                 rows=rows,
-                rows_prev=rows_prev,
-                rows_ytd=rows_ytd,
-                rows_ytd_prev=rows_ytd_prev,
                 summary=summary,
                 destinatarios_exibicao=destinatarios_display,
                 copy_overrides=final_copy,
                 table_columns=table_columns_for_html,
-                # extras para debug de totais prévios no template
-                extra_prev=sum_prev or {},
+                totals_prev=sum_prev,
+                totals_ytd=sum_ytd,
+                totals_ytd_prev=sum_ytd_prev,
+                batch=render_batch,
             )
 
             # --- DEBUG: imprime decisão de colunas e amostra do retroativo ---
@@ -0,0 +1,185 @@
+# money.py — valores monetários como centavos inteiros (int64), em lote
+
+import math
+import re
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Any, Dict, List, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from utils import _coerce_decimal_for_brl, category_parts, is_categorical
+
+# Tipos convertidos em lote via float (além de texto, fora do modo BRL)
+FLOAT_KINDS = (int, float, np.int64, np.float64)
+# Acima disso o float não representa todo centavo
+FLOAT_EXACT_CENTS = 2.0 ** 52
+CENT = Decimal("0.01")
+INT64_MAX = np.iinfo(np.int64).max
+# Texto exatamente no formato de fmt_brl / format_brl_cents
+BRL_TEXT_PATTERN = re.compile(r"^R\$ (-?)((?:0|[1-9][0-9]{0,2})(?:\.[0-9]{3})*),([0-9]{2})$")
+
+
+def _decimal_to_cents(dec: Decimal) -> int:
+    """Decimal -> centavos com o mesmo arredondamento de fmt_brl (ROUND_HALF_UP)."""
+    return int(dec.quantize(CENT, rounding=ROUND_HALF_UP) * 100)
+
+
+def _parse_one(value: Any, brl: bool) -> Tuple[int, bool]:
+    """
+    Conversão de um valor fora do caminho vetorizado: (centavos, falhou).
+
+    brl=False segue Decimal(str(x)) (Valor Mensal Final); brl=True segue
+    _coerce_decimal_for_brl (aceita "R$ 1.234,50" e afins). Valores que não
+    convertem valem 0.
+    """
+    if isinstance(value, float) and not math.isfinite(value):
+        # inf/-inf numéricos valem 0 sem aviso (como NaN)
+        return 0, False
+    if brl:
+        dec = _coerce_decimal_for_brl(value)
+        failed = False
+    else:
+        try:
+            dec = value if isinstance(value, Decimal) else Decimal(str(value))
+            failed = not dec.is_finite()
+        except Exception:
+            dec, failed = None, True
+    if dec is None or not dec.is_finite():
+        return 0, failed
+    cents = _decimal_to_cents(dec)
+    if abs(cents) > INT64_MAX:
+        return 0, True
+    return cents, failed
+
+
+def parse_cents(series: pd.Series, brl: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Converte uma coluna em centavos (int64), arredondando meio centavo para
+    longe do zero como fmt_brl.
+
+    Números (e, com brl=False, textos numéricos como "1500" ou "-12.345")
+    são convertidos em lote via float; só os casos em que o float não
+    decide o arredondamento (meio centavo exato, valores acima de 2**52
+    centavos, NaN/inf em texto) e os textos BRL ("R$ 1.234,50") passam pelo
+    conversor exato, uma vez por valor distinto.
+    Ausentes (None/NaN) valem 0 sem contar como falha.
+
+    Returns:
+        (centavos, falhas): falhas marca as células que não puderam ser
+        convertidas (só com brl=False; no modo BRL texto inválido vale 0).
+    """
+    n = len(series)
+    cents = np.zeros(n, dtype=np.int64)
+    failed = np.zeros(n, dtype=bool)
+    if n == 0:
+        return cents, failed
+
+    if is_categorical(series):
+        # Uma conversão por categoria
+        categories, codes = category_parts(series)
+        cat_cents, cat_failed = parse_cents(categories, brl)
+        return cat_cents[codes], cat_failed[codes]
+
+    if pd.api.types.is_integer_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        values = series.to_numpy(dtype=np.int64)
+        if np.abs(values).max() <= INT64_MAX // 100:
+            return values * 100, failed
+
+    values = series.to_numpy(dtype=object)
+    missing = pd.isna(values)
+    # bool/Decimal/datas ficam no caminho exato; texto BRL também
+    fast_kinds = FLOAT_KINDS if brl else FLOAT_KINDS + (str,)
+    inferred = pd.api.types.infer_dtype(values, skipna=True)
+    if inferred in ("integer", "floating", "mixed-integer-float") or (inferred == "string" and not brl):
+        fast = ~missing
+    else:
+        fast = np.fromiter((type(v) in fast_kinds for v in values), dtype=bool, count=n) & ~missing
+
+    if fast.any():
+        nums = pd.to_numeric(pd.Series(values[fast], dtype=object), errors="coerce").to_numpy(dtype=np.float64)
+        with np.errstate(invalid="ignore"):
+            scaled = np.abs(nums) * 100
+            frac = scaled - np.floor(scaled)
+            # Longe de meio centavo o erro do float não muda o arredondamento
+            decided = np.isfinite(scaled) & (scaled < FLOAT_EXACT_CENTS) & (np.abs(frac - 0.5) > 1e-9 + scaled * 1e-15)
+        rounded = np.floor(np.where(decided, scaled, 0) + 0.5).astype(np.int64)
+        idx = np.flatnonzero(fast)
+        cents[idx[decided]] = np.where(nums[decided] < 0, -rounded[decided], rounded[decided])
+        fast[idx[~decided]] = False
+
+    rest = ~fast & ~missing
+    if rest.any():
+        lookup: Dict[Any, Tuple[int, bool]] = {}
+        for i in np.flatnonzero(rest):
+            v = values[i]
+            key = (type(v), v)
+            if key not in lookup:
+                lookup[key] = _parse_one(v, brl)
+            cents[i], failed[i] = lookup[key]
+    return cents, failed
+
+
+def cents_to_float(cents: int) -> float:
+    """Centavos inteiros -> float em reais (divisão exata, arredondada uma vez)."""
+    return int(cents) / 100
+
+
+def format_brl_cents(cents: np.ndarray) -> List[str]:
+    """Formata centavos como fmt_brl ("R$ 1.234,50" / "R$ -10,00"), uma vez por valor distinto."""
+    cents = np.asarray(cents, dtype=np.int64)
+    if cents.size == 0:
+        return []
+    uniques, inverse = np.unique(cents, return_inverse=True)
+    formatted = []
+    for c in uniques.tolist():
+        reais, cent = divmod(abs(c), 100)
+        body = f"{reais:,}".replace(",", ".") + f",{cent:02d}"
+        formatted.append(f"R$ -{body}" if c < 0 else f"R$ {body}")
+    return [formatted[i] for i in inverse.tolist()]
+
+
+class MoneyCell(str):
+    """
+    Célula monetária das rows: o texto de exibição (formato fmt_brl) com
+    os centavos ao lado.
+
+    Por ser um str, quem só lê texto (template, JSON, comparações) continua
+    vendo "R$ 1.234,50"; quem precisa do número lê cents/value sem
+    reinterpretar o texto.
+    """
+
+    __slots__ = ("cents",)
+
+    def __new__(cls, text: str, cents: int = 0) -> "MoneyCell":
+        cell = super().__new__(cls, text)
+        cell.cents = int(cents)
+        return cell
+
+    @property
+    def value(self) -> float:
+        """Valor em reais (float)."""
+        return cents_to_float(self.cents)
+
+    def __reduce__(self):
+        return (MoneyCell, (str(self), self.cents))
+
+
+def money_cells(cents: np.ndarray) -> List[MoneyCell]:
+    """Centavos -> MoneyCell com o texto de format_brl_cents."""
+    cents = np.asarray(cents, dtype=np.int64)
+    return [MoneyCell(text, c) for text, c in zip(format_brl_cents(cents), cents.tolist())]
+
+
+def brl_cell(text: str) -> Union[MoneyCell, str]:
+    """MoneyCell para um texto no formato exato de fmt_brl; qualquer outro volta como está."""
+    match = BRL_TEXT_PATTERN.match(text)
+    if not match:
+        return text
+    negative, reais, cent = match.groups()
+    cents = int(reais.replace(".", "")) * 100 + int(cent)
+    if negative:
+        if cents == 0:
+            return text
+        cents = -cents
+    return MoneyCell(text, cents)
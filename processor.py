@@ -1,9 +1,12 @@
 # processor_optimized.py — processamento otimizado com vetorização
 
-from typing import Dict, Any, List, Tuple, Optional
+from collections import OrderedDict
+from typing import Dict, Any, List, Tuple, Optional, Union
+from datetime import date, timedelta
 from decimal import Decimal
 import unicodedata
 import re
+import threading
 import pandas as pd
 import numpy as np
 from functools import lru_cache
@@ -15,10 +18,14 @@ from utils import (
     split_emails,
     normalize_unit,
     parse_year_month,
+    parse_year_month_series,
     is_missing_like,    
     parse_brl_money,
     normalize_text_full,
+    is_categorical,
+    category_parts,
 )
+from money import cents_to_float, money_cells, parse_cents
 
 # --------------------------
 # Constantes (pré-computadas)
@@ -57,6 +64,9 @@ COLUMN_CANDIDATES = {
     ],
 }
 
+# Aliases do fallback de "Mês de emissão" em map_columns (já normalizados)
+MES_EMISSAO_ALIASES = ["mes de emissao da nf", "mes emissao nf", "mes nf"]
+
 DEFAULT_DISPLAY_COLUMNS = [
     "Unidade","Categoria","Fornecedor","HC Planilha","Dias Faltas","Horas Atrasos",
     "Valor Planilha","Desc. Falta Validado Atlas","Desc. Atraso Validado Atlas",
@@ -64,6 +74,18 @@ DEFAULT_DISPLAY_COLUMNS = [
     "Mês de emissão da NF",
 ]
 
+# Colunas de desconto somadas nos KPIs do relatório (cubo mensal e emailer.build_kpis)
+KPI_DISCOUNT_COLUMNS = [
+    "Desc. Falta Validado Atlas","Desc. Atraso Validado Atlas",SLA_DESCONTO_CANONICAL,
+    "Desconto SLA Retroativo","Desconto Equipamentos","Outros descontos","Prêmio Assiduidade",
+]
+
+# Colunas monetárias mantidas como número na extração tipada (Extractor typed=True)
+MONEY_COLUMN_CANONICALS = [
+    "Valor Planilha","Valor Mensal Final",*KPI_DISCOUNT_COLUMNS,
+    "Valor mensal com prorrogação do prazo pagamento","Retroativo de dissídio","Valor extras validado Atlas",
+]
+
 DISPLAY_HEADER_SYNONYMS = {
     "Desc. Falta Validado Atlas": ["Desconto Falta Validado Atlas","Desc_Falta"],
     "Desc. Atraso Validado Atlas": ["Desconto Atraso Validado Atlas","Desconto Atrasos Validado Atlas","Desc_Atraso"],
@@ -99,6 +121,10 @@ EXTRA_TOKEN_SETS = {
 # Regex pré-compilados
 HORAS_PATTERN_1 = re.compile(r"^\s*([+-]?\d+):\s*(\d{1,2})\s*$")
 HORAS_PATTERN_2 = re.compile(r"^\s*([+-]?\d+)\s*h\s*(\d{1,2})?\s*m?\s*$", re.IGNORECASE)
+# Mesmas formas, para str.extract (só dígitos ASCII e horas que cabem em int64)
+HORAS_COLUMN_PATTERN_1 = r"^([+-]?)([0-9]{1,15}):\s*([0-9]{1,2})$"
+HORAS_COLUMN_PATTERN_2 = r"^([+-]?)([0-9]{1,15})\s*[hH]\s*([0-9]{1,2})?\s*[mM]?$"
+HORAS_COLUMN_DECIMAL = r"^([+-]?)([0-9]{0,15})(?:\.([0-9]*))?$"
 
 # --------------------------
 # Funções com cache
@@ -119,24 +145,35 @@ def _key_equiv(s: str) -> str:
 SLA_DESCONTO_NAMES_NORMALIZED = frozenset(_norm(n) for n in [SLA_DESCONTO_CANONICAL, *SLA_DESCONTO_SYNONYMS])
 PENDENTE_LABELS_NORMALIZED = frozenset(_norm(x) for x in PENDENTE_LABELS)
 
+# Índices pré-computados do mapeamento de colunas
+COLUMN_CANDIDATES_NORMALIZED = {key: [_norm(c) for c in cands] for key, cands in COLUMN_CANDIDATES.items()}
+DISPLAY_CANONICALS_NORMALIZED = {canonical: _norm(canonical) for canonical in DISPLAY_HEADER_SYNONYMS}
+
+
+def _build_synonym_index() -> Dict[str, Tuple[str, ...]]:
+    """Sinônimo normalizado -> canônicos que o aceitam (na ordem de DISPLAY_HEADER_SYNONYMS)."""
+    index: Dict[str, Tuple[str, ...]] = {}
+    for canonical, synonyms in DISPLAY_HEADER_SYNONYMS.items():
+        for syn in synonyms:
+            targets = index.get(_norm(syn), ())
+            if canonical not in targets:
+                index[_norm(syn)] = targets + (canonical,)
+    return index
+
+
+DISPLAY_SYNONYM_INDEX = _build_synonym_index()
+
 
 # --------------------------
 # Funções de mapeamento (otimizadas)
 # --------------------------
-def _pick_column(df: pd.DataFrame, candidates: List[str]) -> Optional[str]:
-    """Busca coluna de forma otimizada."""
-    # Normaliza todas as colunas uma vez
-    norm_map = {_norm(c): c for c in df.columns}
-    
-    # Busca exata
-    for cand in candidates:
-        nc = _norm(cand)
+def _pick_normalized(norm_map: Dict[str, str], candidates: List[str]) -> Optional[str]:
+    """Busca exata e depois parcial de candidatos já normalizados."""
+    for nc in candidates:
         if nc in norm_map:
             return norm_map[nc]
-    
-    # Busca parcial
-    for cand in candidates:
-        nc = _norm(cand)
+
+    for nc in candidates:
         if nc:
             for k, original in norm_map.items():
                 if nc in k:
@@ -144,6 +181,11 @@ def _pick_column(df: pd.DataFrame, candidates: List[str]) -> Optional[str]:
     return None
 
 
+def _pick_column(df: pd.DataFrame, candidates: List[str]) -> Optional[str]:
+    """Busca coluna de forma otimizada."""
+    return _pick_normalized({_norm(c): c for c in df.columns}, [_norm(c) for c in candidates])
+
+
 def _find_col_by_tokens(df: pd.DataFrame, token_sets: List[List[str]]) -> Optional[str]:
     """Busca por tokens."""
     norm_cols = {c: _norm(c) for c in df.columns}
@@ -155,6 +197,25 @@ def _find_col_by_tokens(df: pd.DataFrame, token_sets: List[List[str]]) -> Option
     return None
 
 
+@lru_cache(maxsize=128)
+def _column_mapping(columns: Tuple[str, ...]) -> Dict[str, Optional[str]]:
+    """Mapeamento de map_columns para um layout de cabeçalho (resolvido uma vez por processo)."""
+    norm_map = {_norm(c): c for c in columns}
+    mapping = {key: _pick_normalized(norm_map, cands) for key, cands in COLUMN_CANDIDATES_NORMALIZED.items()}
+
+    # Fallback para Mês de emissão
+    if not mapping.get("Mes_Emissao_NF") or mapping["Mes_Emissao_NF"] not in columns:
+        for c in columns:
+            nc = _norm(c)
+            if any(alias in nc for alias in MES_EMISSAO_ALIASES):
+                mapping["Mes_Emissao_NF"] = c
+                break
+
+    if mapping.get("Mes_Emissao_NF"):
+        mapping["Mês_Emissão_NF"] = mapping["Mes_Emissao_NF"]
+    return mapping
+
+
 def map_columns(df: pd.DataFrame, warn_missing: bool = True) -> Dict[str, Optional[str]]:
     """
     Mapeia colunas de forma otimizada com validação.
@@ -166,19 +227,7 @@ def map_columns(df: pd.DataFrame, warn_missing: bool = True) -> Dict[str, Option
     Returns:
         Dicionário com mapeamento de colunas
     """
-    mapping = {key: _pick_column(df, cands) for key, cands in COLUMN_CANDIDATES.items()}
-    
-    # Fallback para Mês de emissão
-    if not mapping.get("Mes_Emissao_NF") or mapping["Mes_Emissao_NF"] not in df.columns:
-        aliases = ["mes de emissao da nf", "mes emissao nf", "mes nf"]
-        for c in df.columns:
-            nc = _norm(c)
-            if any(alias in nc for alias in aliases):
-                mapping["Mes_Emissao_NF"] = c
-                break
-    
-    if mapping.get("Mes_Emissao_NF"):
-        mapping["Mês_Emissão_NF"] = mapping["Mes_Emissao_NF"]
+    mapping = dict(_column_mapping(tuple(df.columns)))
     
     # ✅ VALIDAÇÃO: Verifica colunas críticas
     if warn_missing:
@@ -200,107 +249,301 @@ def map_columns(df: pd.DataFrame, warn_missing: bool = True) -> Dict[str, Option
     return mapping
 
 
+def pipeline_column_filter(extra_columns: Optional[List[str]] = None):
+    """
+    Predicado que diz se uma coluna da planilha pode ser usada pelo pipeline.
+
+    Cobre tudo que map_columns (inclusive as buscas parciais), a canonização
+    por sinônimos, as colunas padrão e os KPIs podem selecionar, além de
+    extra_columns (ex.: colunas configuradas por unidade). Usado pelo
+    Extractor para descartar colunas na leitura.
+    """
+    partial = {_norm(c) for cands in COLUMN_CANDIDATES.values() for c in cands}
+    partial.update(MES_EMISSAO_ALIASES)
+    partial.discard("")
+    exact = {
+        _norm(c)
+        for c in [
+            *DEFAULT_DISPLAY_COLUMNS, *EXTRA_OPTIONAL_CANONICALS, *KPI_DISCOUNT_COLUMNS,
+            *DISPLAY_HEADER_SYNONYMS.keys(),
+            *(syn for syns in DISPLAY_HEADER_SYNONYMS.values() for syn in syns),
+            *(extra_columns or []),
+        ]
+    }
+    token_sets = [[_norm(t) for t in tokens] for sets in EXTRA_TOKEN_SETS.values() for tokens in sets]
+
+    def keep(column: str) -> bool:
+        nc = _norm(str(column))
+        if nc in exact or any(p in nc for p in partial):
+            return True
+        return any(all(t in nc for t in tokens) for tokens in token_sets)
+
+    return keep
+
+
+@lru_cache(maxsize=128)
+def _canonical_rename_plan(columns: Tuple[str, ...]) -> Tuple[Tuple[str, str], ...]:
+    """
+    Pares (coluna, canônico) da renomeação para um layout de cabeçalho.
+
+    Cada coluna vai para o primeiro canônico (na ordem de
+    DISPLAY_HEADER_SYNONYMS) do qual é sinônimo, desde que nenhuma coluna
+    até ela já tenha o nome canônico.
+    """
+    normalized = [_norm(col) for col in columns]
+    canonical_pos: Dict[str, int] = {}
+    for canonical, nc in DISPLAY_CANONICALS_NORMALIZED.items():
+        canonical_pos[canonical] = next((i for i, n in enumerate(normalized) if n == nc), len(columns))
+
+    plan: Dict[str, str] = {}
+    for i, (col, nc) in enumerate(zip(columns, normalized)):
+        if col in plan:
+            continue
+        for canonical in DISPLAY_SYNONYM_INDEX.get(nc, ()):
+            if canonical_pos[canonical] > i:
+                plan[col] = canonical
+                break
+    return tuple(plan.items())
+
+
+def _canonical_rename_map(columns) -> Dict[str, str]:
+    """Plano de renomeação das colunas da planilha para os nomes canônicos de exibição."""
+    return dict(_canonical_rename_plan(tuple(columns)))
+
+
+def typed_column_filter():
+    """
+    Predicado das colunas que a extração tipada mantém com o valor nativo
+    da célula: monetárias (número) e de mês (data ou serial do Excel). As
+    demais continuam como texto.
+    """
+    money = {
+        _norm(c)
+        for c in [
+            *MONEY_COLUMN_CANONICALS, *COLUMN_CANDIDATES["Valor_Mensal_Final"],
+            *(syn for canonical in MONEY_COLUMN_CANONICALS for syn in DISPLAY_HEADER_SYNONYMS.get(canonical, [])),
+        ]
+    }
+    months = {_norm(c) for key in ("Mes_Emissao_NF", "Mes_Ref_Faturamento") for c in COLUMN_CANDIDATES[key]}
+
+    def typed(column: str) -> bool:
+        nc = _norm(str(column))
+        return nc in money or nc in months or any(alias in nc for alias in MES_EMISSAO_ALIASES)
+
+    return typed
+
+
 # --------------------------
 # Processamento vetorizado
 # --------------------------
 def _vectorized_parse_year_month(series: pd.Series) -> pd.Series:
-    """Parse vetorizado de ano/mês."""
-    return series.apply(parse_year_month)
+    """Parse vetorizado de ano/mês (por coluna, ver parse_year_month_series)."""
+    return parse_year_month_series(series)
 
 
 def _vectorized_normalize_unit(series: pd.Series) -> pd.Series:
-    """Normalização vetorizada de unidades."""
-    return series.astype(str).apply(normalize_unit)
+    """Normalização vetorizada de unidades (uma vez por valor distinto)."""
+    if is_categorical(series):
+        categories, codes = category_parts(series)
+    else:
+        codes, uniques = pd.factorize(series.astype(str))
+        categories = pd.Series(uniques, dtype=object)
+    normalized = categories.astype(str).map(normalize_unit).to_numpy(dtype=object)
+    return pd.Series(normalized[codes], index=series.index, name=series.name, dtype=object)
 
 
-def _to_decimal_sane_vectorized(series: pd.Series) -> pd.Series:
-    """Conversão vetorizada para Decimal com logging de erros."""
-    errors = []
+def _vmf_cents(series: pd.Series) -> np.ndarray:
+    """Valor Mensal Final em centavos (money.parse_cents), avisando sobre valores não numéricos."""
+    cents, failed = parse_cents(series)
+    if failed.any():
+        total_failed = int(failed.sum())
+        print(f"[WARN] {total_failed} valor(es) numérico(s) falharam na conversão:")
+        for x in series[failed].head(3):
+            print(f"  - '{x}' ({type(x).__name__})")
+        if total_failed > 3:
+            print(f"  ... e mais {total_failed - 3} valores")
+    return cents
+
+
+def _canonical_source(df: pd.DataFrame, names: List[str], canonical: str) -> Optional[pd.Series]:
+    """Primeira coluna de df cujo nome canonizado (names, na ordem de df) é canonical."""
+    norm_target = _norm(canonical)
+    for pos, name in enumerate(names):
+        if _norm(name) == norm_target:
+            return df.iloc[:, pos]
+    return None
+
+
+def _kpi_cents(
+    df: pd.DataFrame,
+    names: Optional[List[str]] = None,
+    positions: Optional[np.ndarray] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Centavos de Valor Planilha e da soma de KPI_DISCOUNT_COLUMNS por linha,
+    lidos das colunas da planilha (exibidas ou não) como no cubo mensal.
+    names são os nomes canonizados de df (padrão: os próprios nomes) e
+    positions restringe às linhas nessas posições.
+    """
+    names = list(df.columns) if names is None else names
+    count = len(df) if positions is None else len(positions)
+
+    def _cents(canonical: str) -> Optional[np.ndarray]:
+        series = _canonical_source(df, names, canonical)
+        if series is None:
+            return None
+        return parse_cents(series if positions is None else series.take(positions), brl=True)[0]
+
+    vplan_cents = _cents(CUBE_VALOR_PLANILHA)
+    desc_cents = np.zeros(count, dtype=np.int64)
+    for col in KPI_DISCOUNT_COLUMNS:
+        cents = _cents(col)
+        if cents is not None:
+            desc_cents = desc_cents + cents
+    return (vplan_cents if vplan_cents is not None else np.zeros(count, dtype=np.int64)), desc_cents
+
+
+def _format_horas_atrasos_value(val: Any) -> str:
+    """Formata uma célula de Horas Atrasos (H:MM, 4h 30m ou decimal) como horas com vírgula."""
+    if not val or _norm(str(val)) == _norm("Informação pendente"):
+        return "Informação pendente"
     
-    def convert(x):
-        if isinstance(x, Decimal):
-            return x if not (x.is_nan() or x.is_infinite()) else Decimal("0")
-        if x is None or (isinstance(x, float) and (pd.isna(x) or np.isnan(x) or np.isinf(x))):
-            return Decimal("0")
-        try:
-            return Decimal(str(x))
-        except Exception as e:
-            # Registra erro para análise posterior
-            if len(errors) < 3:  # Limita a 3 exemplos para não inundar logs
-                errors.append(f"'{x}' ({type(x).__name__}): {str(e)}")
-            return Decimal("0")
+    s = str(val).strip()
     
-    result = series.apply(convert)
+    # Formato H:MM
+    m = HORAS_PATTERN_1.match(s)
+    if m:
+        try:
+            h, mi = int(m.group(1)), int(m.group(2))
+            if mi >= 60:
+                h += mi // 60
+                mi = mi % 60
+            negative = h < 0
+            h = abs(h)
+            total_min = h * 60 + mi
+            dec = (Decimal(total_min) / Decimal("60")).quantize(Decimal("0.1"))
+            if negative:
+                dec = -dec
+            return str(dec).replace(".", ",")
+        except:
+            pass
     
-    # Avisa sobre erros encontrados
-    if errors:
-        print(f"[WARN] {len(errors)} valor(es) numérico(s) falharam na conversão:")
-        for err in errors:
-            print(f"  - {err}")
-        # Check if there are more failed conversions than logged errors
-        total_failed = sum(1 for x in series if convert(x) == Decimal("0") and x is not None)
-        if total_failed > len(errors):
-            print(f"  ... e mais {total_failed - len(errors)} valores")
+    # Formato 4h 30m
+    m = HORAS_PATTERN_2.match(s)
+    if m:
+        try:
+            h = int(m.group(1))
+            mi = int(m.group(2)) if m.group(2) else 0
+            if mi >= 60:
+                h += mi // 60
+                mi = mi % 60
+            negative = h < 0
+            h = abs(h)
+            total_min = h * 60 + mi
+            dec = (Decimal(total_min) / Decimal("60")).quantize(Decimal("0.1"))
+            if negative:
+                dec = -dec
+            return str(dec).replace(".", ",")
+        except:
+            pass
     
+    # Decimal direto
+    raw = s.replace(" ", "")
+    if "," in raw:
+        raw = raw.replace(",", ".")
+    try:
+        dec = Decimal(raw).quantize(Decimal("0.1"))
+        return str(dec).replace(".", ",")
+    except:
+        return s
+
+
+def _tenths_text(negative: pd.Series, tenths: pd.Series) -> pd.Series:
+    """Décimos inteiros -> "1,5" / "-1,5" (mesmo texto de str(Decimal) com vírgula)."""
+    text = (tenths // 10).astype(str) + "," + (tenths % 10).astype(str)
+    return text.where(~negative, "-" + text)
+
+
+def _minutes_to_tenths(sign: pd.Series, hours: pd.Series, minutes: pd.Series) -> Tuple[pd.Series, pd.Series]:
+    """
+    (negativo, décimos de hora) para H:MM, com a mesma aritmética da versão
+    por célula: minutos >= 60 somam às horas antes do sinal e o décimo é
+    arredondado meio-para-par (quantize padrão do Decimal).
+    """
+    h = pd.to_numeric(hours).astype(np.int64)
+    h = h.where(sign != "-", -h)
+    mi = pd.to_numeric(minutes.fillna("0")).astype(np.int64)
+    h = h + mi // 60
+    total = h.abs() * 60 + mi % 60
+    q, r = total // 6, total % 6
+    tenths = q + ((r > 3) | ((r == 3) & (q % 2 == 1))).astype(np.int64)
+    return h < 0, tenths
+
+
+def _format_horas_distinct(texts: pd.Series) -> pd.Series:
+    """_format_horas_atrasos_value para textos distintos, com operações de coluna."""
+    result = pd.Series([None] * len(texts), index=texts.index, dtype=object)
+    s = texts.str.strip()
+    result[texts == ""] = "Informação pendente"
+
+    for pattern in (HORAS_COLUMN_PATTERN_1, HORAS_COLUMN_PATTERN_2):
+        parts = s.str.extract(pattern)
+        hit = parts[1].notna() & result.isna()
+        if hit.any():
+            negative, tenths = _minutes_to_tenths(parts.loc[hit, 0], parts.loc[hit, 1], parts.loc[hit, 2])
+            result[hit] = _tenths_text(negative, tenths)
+
+    # Decimal direto: arredonda para décimos meio-para-par olhando os dígitos
+    raw = s.str.replace(" ", "", regex=False).str.replace(",", ".", regex=False)
+    parts = raw.str.extract(HORAS_COLUMN_DECIMAL)
+    whole, frac = parts[1].fillna(""), parts[2].fillna("")
+    hit = parts[1].notna() & ((whole.str.len() + frac.str.len()) > 0) & result.isna()
+    if hit.any():
+        whole, frac = whole[hit], frac[hit]
+        tenths = pd.to_numeric(whole.where(whole != "", "0")).astype(np.int64) * 10
+        tenths += pd.to_numeric(frac.str[:1].where(frac != "", "0")).astype(np.int64)
+        rest = frac.str[1:].str.rstrip("0")
+        tenths += ((rest > "5") | ((rest == "5") & (tenths % 2 == 1))).astype(np.int64)
+        result[hit] = _tenths_text(parts.loc[hit, 0] == "-", tenths)
+
+    # Placeholders, dígitos não ASCII, notação científica etc.
+    rest = result.isna()
+    if rest.any():
+        result[rest] = [_format_horas_atrasos_value(v) for v in texts[rest]]
     return result
 
 
 def _format_horas_atrasos_vectorized(series: pd.Series) -> pd.Series:
-    """Formatação vetorizada de horas."""
-    def format_val(val):
-        if not val or _norm(str(val)) == _norm("Informação pendente"):
-            return "Informação pendente"
-        
-        s = str(val).strip()
-        
-        # Formato H:MM
-        m = HORAS_PATTERN_1.match(s)
-        if m:
-            try:
-                h, mi = int(m.group(1)), int(m.group(2))
-                if mi >= 60:
-                    h += mi // 60
-                    mi = mi % 60
-                negative = h < 0
-                h = abs(h)
-                total_min = h * 60 + mi
-                dec = (Decimal(total_min) / Decimal("60")).quantize(Decimal("0.1"))
-                if negative:
-                    dec = -dec
-                return str(dec).replace(".", ",")
-            except:
-                pass
-        
-        # Formato 4h 30m
-        m = HORAS_PATTERN_2.match(s)
-        if m:
-            try:
-                h = int(m.group(1))
-                mi = int(m.group(2)) if m.group(2) else 0
-                if mi >= 60:
-                    h += mi // 60
-                    mi = mi % 60
-                negative = h < 0
-                h = abs(h)
-                total_min = h * 60 + mi
-                dec = (Decimal(total_min) / Decimal("60")).quantize(Decimal("0.1"))
-                if negative:
-                    dec = -dec
-                return str(dec).replace(".", ",")
-            except:
-                pass
-        
-        # Decimal direto
-        raw = s.replace(" ", "")
-        if "," in raw:
-            raw = raw.replace(",", ".")
-        try:
-            dec = Decimal(raw).quantize(Decimal("0.1"))
-            return str(dec).replace(".", ",")
-        except:
-            return s
-    
-    return series.apply(format_val)
+    """
+    Formatação vetorizada de horas: H:MM, "4h 30m" e decimais são
+    convertidos com str.extract e aritmética inteira, uma vez por texto
+    distinto; o restante passa por _format_horas_atrasos_value.
+    """
+    if is_categorical(series):
+        categories, codes = category_parts(series)
+        formatted = _format_horas_atrasos_vectorized(categories).to_numpy(dtype=object)
+        return pd.Series(formatted[codes], index=series.index, name=series.name, dtype=object)
+
+    values = series.to_numpy(dtype=object)
+    out = np.empty(len(values), dtype=object)
+    if pd.api.types.infer_dtype(values, skipna=False) == "string":
+        is_text = np.ones(len(values), dtype=bool)
+    else:
+        is_text = np.fromiter((isinstance(v, str) for v in values), dtype=bool, count=len(values))
+
+    if is_text.any():
+        codes, uniques = pd.factorize(values[is_text])
+        formatted = _format_horas_distinct(pd.Series(uniques, dtype=object)).to_numpy(dtype=object)
+        out[is_text] = formatted[codes]
+
+    cache: Dict[Any, str] = {}
+    for i in np.flatnonzero(~is_text):
+        v = values[i]
+        key = (type(v), v)
+        if key not in cache:
+            cache[key] = _format_horas_atrasos_value(v)
+        out[i] = cache[key]
+    return pd.Series(out, index=series.index, name=series.name, dtype=object)
 
 
 def _format_month_year(ym: str) -> str:
@@ -311,14 +554,227 @@ def _format_month_year(ym: str) -> str:
     return ym
 
 
+# --------------------------
+# Plano de colunas por consulta
+# --------------------------
+# Modos de filter_and_prepare / prepare_all_units:
+# - "full": rows, destinatários e sumário (comportamento padrão)
+# - "rows": rows e sumário, sem resolver destinatários
+# - "summary": só o sumário (contagem e somas de Valor Mensal Final, Valor
+#   Planilha e descontos); nada é formatado nem materializado em rows
+PREPARE_MODES = ("full", "rows", "summary")
+
+CRITICAL_DISPLAY_COLUMNS = ["Valor Mensal Final", "Mês de emissão da NF"]
+
+# Colunas que _format_period_rows cria (existem mesmo sem estar na planilha)
+FORMATTED_COLUMNS = frozenset(["Mês de emissão da NF", "Mês referência para faturamento", "Valor Mensal Final"])
+
+
+class ColumnPlan:
+    """
+    Colunas que uma consulta vai exibir e, a partir delas, quais etapas de
+    formatação precisam rodar.
+
+    As colunas de exibição são a whitelist (ou DEFAULT_DISPLAY_COLUMNS) com
+    as críticas garantidas no fim. Horas Atrasos e o mês de referência só
+    são formatados quando exibidos; se faltar alguma coluna de exibição, as
+    rows saem com todas as colunas (fallback histórico) e tudo é formatado.
+    """
+
+    def __init__(self, columns_whitelist: Optional[List[str]] = None):
+        display = list(columns_whitelist or DEFAULT_DISPLAY_COLUMNS)
+        for col in CRITICAL_DISPLAY_COLUMNS:
+            if col not in display:
+                display.append(col)
+        self.display_columns: List[str] = display
+
+    def formats_all(self, columns) -> bool:
+        """True se as rows vão usar todas as colunas (alguma de exibição falta)."""
+        available = set(columns) | FORMATTED_COLUMNS
+        return not all(c in available for c in self.display_columns)
+
+    def needs(self, column: str, columns) -> bool:
+        """True se a coluna derivada precisa ser formatada para estas rows."""
+        return column in self.display_columns or self.formats_all(columns)
+
+
+def _check_mode(mode: str) -> None:
+    if mode not in PREPARE_MODES:
+        raise ValueError(f"mode inválido: {mode!r} (use um de {', '.join(PREPARE_MODES)})")
+
+
+# --------------------------
+# Destinatários por planilha
+# --------------------------
+class RecipientDirectory:
+    """
+    Destinatários de uma planilha regional resolvidos uma única vez.
+
+    Cada texto distinto da coluna de e-mail é separado uma vez
+    (split_emails) e as listas ficam prontas por unidade normalizada
+    (by_unit) e por (unidade, YYYY-MM) (by_group): na ordem das linhas e
+    sem repetição, como filter_and_prepare sempre montou. Endereços
+    inválidos ficam em rejected e são avisados uma vez, na construção.
+    """
+
+    def __init__(self, cells: Optional[pd.Series], groups: Dict[Tuple[str, str], np.ndarray]):
+        self.by_group: Dict[Tuple[str, str], List[str]] = {}
+        self.by_unit: Dict[str, List[str]] = {}
+        self.rejected: List[str] = []
+        if cells is None:
+            return
+
+        texts = cells.astype(str).to_numpy(dtype=object)
+        present = cells.notna().to_numpy()
+        split: Dict[str, List[str]] = {}
+        rejected: List[str] = []
+
+        def collect(positions: np.ndarray) -> List[str]:
+            found: List[str] = []
+            for text in dict.fromkeys(texts[positions[present[positions]]]):
+                if text not in split:
+                    split[text] = split_emails(text, rejected=rejected)
+                found.extend(split[text])
+            return list(dict.fromkeys(found))
+
+        unit_positions: Dict[str, List[np.ndarray]] = {}
+        for key, positions in groups.items():
+            self.by_group[key] = collect(positions)
+            unit_positions.setdefault(key[0], []).append(positions)
+        for nu, parts in unit_positions.items():
+            self.by_unit[nu] = collect(np.sort(np.concatenate(parts)))
+
+        self.rejected = list(dict.fromkeys(rejected))
+        for address in self.rejected:
+            print(f"[WARN] Email inválido descartado: '{address}'")
+
+    def lookup(self, unidade: str, ym: Optional[str] = None) -> List[str]:
+        """Destinatários da unidade (só do mês, se informado), em uma lista nova."""
+        nu = normalize_unit(unidade)
+        found = self.by_unit.get(nu) if ym is None else self.by_group.get((nu, ym))
+        return list(found or [])
+
+
+# --------------------------
+# Planilha regional indexada
+# --------------------------
+class RegionFrame:
+    """
+    Planilha regional preparada uma única vez para consultas repetidas.
+
+    Mapeia as colunas, interpreta o mês de emissão e normaliza a unidade de
+    todas as linhas na construção, agrupando as posições por
+    (unidade normalizada, YYYY-MM). Cada consulta passa a custar
+    O(linhas do grupo) em vez de reprocessar a planilha inteira.
+
+    Uso:
+        frame = RegionFrame(df)
+        rows, recipients, summary = filter_and_prepare(frame, unidade, ym)
+    """
+
+    # Meses já formatados mantidos em cache (LRU): o backend guarda o frame
+    # pelo processo inteiro e cada mês consultado no portal entraria aqui
+    MONTHS_CACHE_SIZE = 4
+
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        self.mapping = map_columns(df)
+        self.uni_col = self.mapping.get("Unidade")
+        self.mes_col = self.mapping.get("Mes_Emissão_NF") or self.mapping.get("Mes_Emissao_NF")
+        self._groups: Dict[Tuple[str, str], np.ndarray] = {}
+        # Chaves por linha (unidade normalizada / YYYY-MM), alinhadas a df
+        self.unit_keys: Optional[np.ndarray] = None
+        self.month_keys: Optional[np.ndarray] = None
+        self._months_prepared: "OrderedDict[str, Tuple[pd.DataFrame, Dict[str, np.ndarray]]]" = OrderedDict()
+        self._months_lock = threading.Lock()
+        self._recipients: Optional[RecipientDirectory] = None
+
+        if self.uni_col and self.mes_col:
+            self.unit_keys = _vectorized_normalize_unit(df[self.uni_col]).to_numpy()
+            self.month_keys = _vectorized_parse_year_month(df[self.mes_col]).to_numpy()
+            keys = pd.DataFrame({"nu": self.unit_keys, "ym": self.month_keys})
+            self._groups = keys.groupby(["nu", "ym"], sort=False).indices
+
+    def __len__(self) -> int:
+        return len(self.df)
+
+    @property
+    def months(self) -> List[str]:
+        """Meses (YYYY-MM) presentes na planilha, do mais recente ao mais antigo."""
+        return sorted({ym for _, ym in self._groups}, reverse=True)
+
+    @property
+    def recipients(self) -> RecipientDirectory:
+        """Diretório de destinatários da planilha (montado na primeira consulta)."""
+        if self._recipients is None:
+            email_col = self.mapping.get("Email_Destinatario")
+            cells = self.df[email_col] if email_col and email_col in self.df.columns else None
+            self._recipients = RecipientDirectory(cells, self._groups)
+        return self._recipients
+
+    def positions(self, unidade: str, ym: str) -> np.ndarray:
+        """Posições (iloc) das linhas da unidade no mês informado."""
+        idx = self._groups.get((normalize_unit(unidade), ym))
+        return idx if idx is not None else np.empty(0, dtype=np.intp)
+
+    def filter_and_prepare(
+        self,
+        unidade: str,
+        ym: str,
+        columns_whitelist: Optional[List[str]] = None,
+        mode: str = "full",
+    ) -> Tuple[List[Dict[str, Any]], List[str], Dict[str, Any]]:
+        """Equivalente a filter_and_prepare(df, ...) usando o índice pré-computado."""
+        _check_mode(mode)
+        if not self.uni_col or not self.mes_col:
+            return [], [], {"row_count": 0, "sum_valor_mensal_final": 0.0}
+
+        idx = self.positions(unidade, ym)
+        if len(idx) == 0:
+            return [], [], {"row_count": 0, "sum_valor_mensal_final": 0.0}
+
+        recipients = self.recipients.lookup(unidade, ym) if mode == "full" else []
+        return _prepare_unit_rows(self.df, idx, self.mapping, unidade, ym, columns_whitelist, recipients, mode)
+
+    def prepare_month(self, ym: str) -> Tuple[pd.DataFrame, Dict[str, np.ndarray]]:
+        """
+        Linhas do mês (todas as unidades) já formatadas, e as posições de cada
+        unidade normalizada dentro delas. O resultado fica em cache no frame
+        (os MONTHS_CACHE_SIZE meses usados mais recentemente).
+        """
+        with self._months_lock:
+            cached = self._months_prepared.get(ym)
+            if cached is not None:
+                self._months_prepared.move_to_end(ym)
+                return cached
+
+        unit_idx = {nu: idx for (nu, ym_key), idx in self._groups.items() if ym_key == ym}
+        if not unit_idx:
+            prepared = (self.df.iloc[0:0].copy(), {})
+        else:
+            # Linhas do mês na ordem da planilha; cada unidade vira um intervalo de posições locais
+            positions = np.sort(np.concatenate(list(unit_idx.values())))
+            dfm = _take_rows(self.df, positions)
+            local = {nu: np.searchsorted(positions, idx) for nu, idx in unit_idx.items()}
+            prepared = (_format_period_rows(dfm, self.mapping, ym), local)
+
+        with self._months_lock:
+            self._months_prepared[ym] = prepared
+            self._months_prepared.move_to_end(ym)
+            while len(self._months_prepared) > self.MONTHS_CACHE_SIZE:
+                self._months_prepared.popitem(last=False)
+        return prepared
+
+
 # --------------------------
 # Função principal (otimizada)
 # --------------------------
 def filter_and_prepare(
-    df: pd.DataFrame,
+    df: Union[pd.DataFrame, RegionFrame],
     unidade: str,
     ym: str,
     columns_whitelist: Optional[List[str]] = None,
+    mode: str = "full",
 ) -> Tuple[List[Dict[str, Any]], List[str], Dict[str, Any]]:
     """
     Filtra e prepara dados de uma planilha para geração de relatórios HTML.
@@ -331,66 +787,165 @@ def filter_and_prepare(
     5. Preparação de dados para renderização
     
     Args:
-        df: DataFrame com dados brutos da planilha
+        df: DataFrame com dados brutos da planilha, ou um RegionFrame já
+            indexado (recomendado quando há várias consultas na mesma planilha)
         unidade: Nome da unidade a filtrar
         ym: Mês de referência no formato YYYY-MM
         columns_whitelist: Lista opcional de colunas a incluir no resultado
+        mode: "full" (padrão), "rows" (sem destinatários) ou "summary" (só
+            o sumário; rows e destinatários voltam vazios). Ver PREPARE_MODES.
     
     Returns:
         Tupla contendo:
         - Lista de dicionários com linhas processadas
         - Lista de emails de destinatários
-        - Dicionário de sumário (row_count, sum_valor_mensal_final)
+        - Dicionário de sumário (row_count, sum_valor_mensal_final,
+          sum_valor_planilha, sum_descontos_gerais)
     """
+    _check_mode(mode)
+    if isinstance(df, RegionFrame):
+        return df.filter_and_prepare(unidade, ym, columns_whitelist, mode)
     
     # 1. Mapeamento de colunas (uma vez)
     mapping = map_columns(df)
     uni_col = mapping.get("Unidade")
     mes_col = mapping.get("Mes_Emissão_NF") or mapping.get("Mes_Emissao_NF")
-    email_col = mapping.get("Email_Destinatario")
-    vmf_col = mapping.get("Valor_Mensal_Final")
 
     if not uni_col or not mes_col:
         return [], [], {"row_count": 0, "sum_valor_mensal_final": 0.0}
 
-    # 2. Filtragem por mês (vetorizada)
-    ym_series = _vectorized_parse_year_month(df[mes_col])
-    dfm = df.loc[ym_series == ym].copy()
+    # 2. Filtragem por mês (vetorizada): só posições, nenhuma cópia da planilha
+    month_positions = np.flatnonzero((_vectorized_parse_year_month(df[mes_col]) == ym).to_numpy())
     
-    if dfm.empty:
+    if len(month_positions) == 0:
         return [], [], {"row_count": 0, "sum_valor_mensal_final": 0.0}
 
-    # 3. Filtragem por unidade (vetorizada)
+    # 3. Filtragem por unidade (vetorizada), normalizando só as linhas do mês
     target_nu = normalize_unit(unidade)
-    dfm["_nu"] = _vectorized_normalize_unit(dfm[uni_col])
-    dfu = dfm.loc[dfm["_nu"] == target_nu].copy()
-    dfu.drop(columns=["_nu"], errors="ignore", inplace=True)
+    units = _vectorized_normalize_unit(df[uni_col].take(month_positions))
+    positions = month_positions[(units == target_nu).to_numpy()]
     
-    if dfu.empty:
+    if len(positions) == 0:
         return [], [], {"row_count": 0, "sum_valor_mensal_final": 0.0}
 
+    return _prepare_unit_rows(df, positions, mapping, unidade, ym, columns_whitelist, mode=mode)
+
+
+def _take_rows(df: pd.DataFrame, positions: np.ndarray, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Linhas de df nas posições informadas, como um DataFrame novo (pode ser
+    alterado sem afetar df). Com columns, só essas colunas são recortadas:
+    as demais nunca são copiadas.
+    """
+    if columns is None:
+        return df.take(positions)
+    wanted = set(columns)
+    return pd.concat(
+        [df.iloc[:, j].take(positions) for j, col in enumerate(df.columns) if col in wanted],
+        axis=1,
+    )
+
+
+def _source_columns(
+    df: pd.DataFrame,
+    mapping: Dict[str, Optional[str]],
+    plan: ColumnPlan,
+    rename_map: Dict[str, str],
+) -> Optional[List[str]]:
+    """
+    Colunas da planilha que as rows do plano usam: as exibidas (pelo nome
+    já canonizado) e as lidas na formatação/destinatários. None quando
+    alguma coluna exibida falta e as rows levam todas as colunas.
+    """
+    renamed = [rename_map.get(col, col) for col in df.columns]
+    if plan.formats_all(renamed):
+        return None
+    read = {
+        mapping.get("Mes_Emissão_NF"), mapping.get("Mes_Emissao_NF"), mapping.get("Mes_Ref_Faturamento"),
+        mapping.get("Valor_Mensal_Final"), mapping.get("Email_Destinatario"),
+    }
+    # Colunas dos KPIs do sumário entram mesmo fora da exibição (mesmas somas do cubo)
+    kpi = {_norm(c) for c in (CUBE_VALOR_PLANILHA, *KPI_DISCOUNT_COLUMNS)}
+    display = set(plan.display_columns)
+    return [
+        col for col, name in zip(df.columns, renamed)
+        if name in display or col in read or _norm(name) in kpi
+    ]
+
+
+def _positions_summary(
+    df: pd.DataFrame,
+    positions: np.ndarray,
+    mapping: Dict[str, Optional[str]],
+    unidade: str,
+    columns_whitelist: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    """Sumário (modo "summary") das linhas nas posições: só as colunas de valor são lidas."""
+    vmf_col = mapping.get("Valor_Mensal_Final")
+    if vmf_col and vmf_col in df.columns:
+        cents = _vmf_cents(df[vmf_col].take(positions))
+    else:
+        cents = np.zeros(len(positions), dtype=np.int64)
+    rename_map = _canonical_rename_map(df.columns)
+    kpi_cents = _kpi_cents(df, [rename_map.get(c, c) for c in df.columns], positions)
+    return _unit_summary(cents, unidade, ColumnPlan(columns_whitelist), columns_whitelist, kpi_cents=kpi_cents)
+
+
+def _prepare_unit_rows(
+    df: pd.DataFrame,
+    positions: np.ndarray,
+    mapping: Dict[str, Optional[str]],
+    unidade: str,
+    ym: str,
+    columns_whitelist: Optional[List[str]] = None,
+    recipients: Optional[List[str]] = None,
+    mode: str = "full",
+) -> Tuple[List[Dict[str, Any]], List[str], Dict[str, Any]]:
+    """
+    Formata as linhas de uma unidade/mês (etapas 3.5 a 8) a partir das
+    posições em df. Só as colunas que o plano usa são copiadas.
+    """
+    if mode == "summary":
+        return [], [], _positions_summary(df, positions, mapping, unidade, columns_whitelist)
+
+    plan = ColumnPlan(columns_whitelist)
+    # Renomeação decidida sobre o cabeçalho completo (depende de todas as colunas)
+    rename_map = _canonical_rename_map(df.columns)
+    dfu = _take_rows(df, positions, _source_columns(df, mapping, plan, rename_map))
+    _format_period_rows(dfu, mapping, ym, plan, rename_map)
+    return _finish_unit_rows(dfu, mapping, unidade, columns_whitelist, recipients, mode)
+
+
+def _format_period_rows(
+    dfu: pd.DataFrame,
+    mapping: Dict[str, Optional[str]],
+    ym: str,
+    plan: Optional[ColumnPlan] = None,
+    rename_map: Optional[Dict[str, str]] = None,
+) -> pd.DataFrame:
+    """
+    Etapas 3.5 e 4, linha a linha e independentes da unidade: canoniza os
+    nomes das colunas e formata meses, Valor Mensal Final e Horas Atrasos.
+    Com um ColumnPlan, o mês de referência e Horas Atrasos só são formatados
+    se forem exibidos; sem plano (mês inteiro, várias unidades) tudo é.
+    rename_map vem pronto quando dfu tem só parte das colunas da planilha.
+    Altera dfu no lugar (e o retorna).
+    """
+    mes_col = mapping.get("Mes_Emissão_NF") or mapping.get("Mes_Emissao_NF")
+    vmf_col = mapping.get("Valor_Mensal_Final")
+
     # 3.5. Canonização de nomes de colunas usando sinônimos
     # Mapeia variantes de nomes (ex: "Desconto Atrasos Validado Atlas") para canônicos
-    rename_map = {}
-    for canonical, synonyms in DISPLAY_HEADER_SYNONYMS.items():
-        for col in dfu.columns:
-            if _norm(col) == _norm(canonical):
-                # Nome já canônico
-                break
-            elif col not in rename_map:  # Evita sobrescrever se já mapeado
-                for syn in synonyms:
-                    if _norm(col) == _norm(syn):
-                        rename_map[col] = canonical
-                        break
-    
+    if rename_map is None:
+        rename_map = _canonical_rename_map(dfu.columns)
     if rename_map:
         dfu.rename(columns=rename_map, inplace=True)
 
+    def _needed(column: str) -> bool:
+        return plan is None or plan.needs(column, dfu.columns)
 
     # 4. Processamento de colunas canônicas
     # Mês de emissão da NF (formato MM/YY) e Mês referência (sempre anterior)
-    from datetime import date, timedelta
-    
     def _format_mmyy(ym_str: str) -> str:
         """Converte YYYY-MM para MM/YY."""
         if not ym_str: return ""
@@ -412,73 +967,266 @@ def filter_and_prepare(
             return ym_str
 
     # Processa Mês de Emissão
-    dfu["Mês de emissão da NF"] = dfu[mes_col].apply(
-        lambda x: _format_mmyy(parse_year_month(x) or ym)
-    )
+    emissao = parse_year_month_series(dfu[mes_col])
+    dfu["Mês de emissão da NF"] = emissao.where(emissao.notna(), ym).map(_format_mmyy)
 
     # Processa Mês de Referência para Faturamento
     # ✅ NOVA LÓGICA: Respeita o valor da planilha quando disponível
     ref_col_name = mapping.get("Mes_Ref_Faturamento")
     
-    if ref_col_name and ref_col_name in dfu.columns:
+    if not _needed("Mês referência para faturamento"):
+        pass  # não exibido: nem lê a coluna da planilha
+    elif ref_col_name and ref_col_name in dfu.columns:
         # ✅ Coluna existe na planilha: usa os valores e apenas formata
-        dfu["Mês referência para faturamento"] = dfu[ref_col_name].apply(
-            lambda x: _format_mmyy(parse_year_month(x) or _get_prev_month(ym))
-        )
+        referencia = parse_year_month_series(dfu[ref_col_name])
+        dfu["Mês referência para faturamento"] = referencia.where(referencia.notna(), _get_prev_month(ym)).map(_format_mmyy)
     else:
         # ✅ Coluna não existe: calcula como (Mês da NF - 1)
         ref_ym = _get_prev_month(ym)
         ref_formatted = _format_mmyy(ref_ym)
         dfu["Mês referência para faturamento"] = ref_formatted
-    
-    # Valor Mensal Final (vetorizado)
+    # Valor Mensal Final (vetorizado, em centavos: cada célula leva texto e centavos)
     if vmf_col and vmf_col in dfu.columns:
-        dfu["_vmf_num"] = _to_decimal_sane_vectorized(dfu[vmf_col])
+        cents = _vmf_cents(dfu[vmf_col])
     else:
-        dfu["_vmf_num"] = Decimal("0")
-
-    dfu["Valor Mensal Final"] = dfu["_vmf_num"].apply(fmt_brl)
-
-    # Validação de valores monetários suspeitos
-    negatives = dfu[dfu["_vmf_num"] < 0]
-    if not negatives.empty:
-        print(f"[WARN] Valor Mensal Final negativo detectado na unidade '{unidade}': {negatives['_vmf_num'].tolist()}")
+        cents = np.zeros(len(dfu), dtype=np.int64)
+    dfu["_vmf_cents"] = cents
+    dfu["_vplan_cents"], dfu["_desc_cents"] = _kpi_cents(dfu)
+    dfu["Valor Mensal Final"] = money_cells(cents)
 
     # Horas Atrasos (vetorizada)
-    if "Horas Atrasos" in dfu.columns:
+    if "Horas Atrasos" in dfu.columns and _needed("Horas Atrasos"):
         dfu["Horas Atrasos"] = _format_horas_atrasos_vectorized(dfu["Horas Atrasos"])
+
+    return dfu
+
+
+def _finish_unit_rows(
+    dfu: pd.DataFrame,
+    mapping: Dict[str, Optional[str]],
+    unidade: str,
+    columns_whitelist: Optional[List[str]] = None,
+    recipients: Optional[List[str]] = None,
+    mode: str = "full",
+) -> Tuple[List[Dict[str, Any]], List[str], Dict[str, Any]]:
+    """
+    Etapas 5 a 8 sobre as linhas já formatadas de uma unidade: totais,
+    destinatários e rows. recipients já resolvidos (RecipientDirectory)
+    dispensam a leitura da coluna de e-mail; no modo "rows" eles não são
+    coletados.
+    """
+    email_col = mapping.get("Email_Destinatario")
+    plan = ColumnPlan(columns_whitelist)
+
+    # 5. Cálculo de totais (soma exata em centavos)
+    summary = _unit_summary(
+        dfu["_vmf_cents"].to_numpy(), unidade, plan, columns_whitelist,
+        kpi_cents=(dfu["_vplan_cents"].to_numpy(), dfu["_desc_cents"].to_numpy()),
+    )
     
-    # 5. Cálculo de totais (operação única no final)
-    total_vmf = dfu["_vmf_num"].sum()
-    
-    # 6. Coleta de destinatários
-    recipients = []
-    if email_col and email_col in dfu.columns:
-        raw = dfu[email_col].dropna().astype(str).tolist()
-        for cell in raw:
-            # ✅ Validação integrada em split_emails
-            recipients.extend(split_emails(cell, warn=True) or [])
-        recipients = list(dict.fromkeys(recipients))  # Remove duplicatas mantendo ordem
-    
-    # 7. Montagem de colunas de display
-    display_columns = columns_whitelist or DEFAULT_DISPLAY_COLUMNS
+    # 6. Coleta de destinatários (já resolvidos, quando vêm do RecipientDirectory)
+    if mode != "full":
+        recipients = []
+    elif recipients is None:
+        recipients = []
+        if email_col and email_col in dfu.columns:
+            # Cada texto distinto uma vez (a ordem da primeira ocorrência é mantida)
+            raw = dict.fromkeys(dfu[email_col].dropna().astype(str).tolist())
+            for cell in raw:
+                # ✅ Validação integrada em split_emails
+                recipients.extend(split_emails(cell, warn=True) or [])
+            recipients = list(dict.fromkeys(recipients))  # Remove duplicatas mantendo ordem
     
-    # Garante colunas críticas
-    for col in ["Valor Mensal Final", "Mês de emissão da NF"]:
-        if col not in display_columns:
-            display_columns.append(col)
+    # 7. Montagem de colunas de display (críticas garantidas pelo plano)
+    display_columns = plan.display_columns
     
     # 8. Conversão para dicionários (operação final)
-    df_display = dfu[display_columns].copy() if all(c in dfu.columns for c in display_columns) else dfu
+    df_display = dfu[display_columns] if all(c in dfu.columns for c in display_columns) else dfu
     rows = df_display.to_dict(orient="records")
     
+    return rows, recipients, summary
+
+
+def _unit_summary(
+    cents: np.ndarray,
+    unidade: str,
+    plan: ColumnPlan,
+    columns_whitelist: Optional[List[str]] = None,
+    kpi_cents: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+) -> Dict[str, Any]:
+    """
+    Sumário de uma unidade a partir dos centavos do Valor Mensal Final.
+    Com kpi_cents (Valor Planilha, descontos) leva também sum_valor_planilha
+    e sum_descontos_gerais, somados sobre todas as colunas da planilha como
+    em cube_totals (e não só sobre as colunas exibidas).
+    """
+    # Validação de valores monetários suspeitos
+    negatives = cents[cents < 0]
+    if negatives.size:
+        print(f"[WARN] Valor Mensal Final negativo detectado na unidade '{unidade}': {[cents_to_float(c) for c in negatives]}")
+
     summary = {
-        "row_count": len(rows),
-        "sum_valor_mensal_final": float(total_vmf),
-        "display_columns": display_columns,
+        "row_count": len(cents),
+        "sum_valor_mensal_final": cents_to_float(cents.sum()),
+        "display_columns": plan.display_columns,
         "missing_columns": [],
         "requested_columns": columns_whitelist or [],
         "fallback_used": False,
     }
-    
-    return rows, recipients, summary
\ No newline at end of file
+    if kpi_cents is not None:
+        summary["sum_valor_planilha"] = cents_to_float(kpi_cents[0].sum())
+        summary["sum_descontos_gerais"] = cents_to_float(kpi_cents[1].sum())
+    return summary
+
+
+def prepare_all_units(
+    df: Union[pd.DataFrame, RegionFrame],
+    ym: str,
+    columns_whitelist_by_unit: Optional[Dict[str, Optional[List[str]]]] = None,
+    mode: str = "full",
+) -> Dict[str, Tuple[List[Dict[str, Any]], List[str], Dict[str, Any]]]:
+    """
+    Prepara todas as unidades de um mês de uma só vez.
+
+    O mapeamento, a canonização de colunas e a formatação das linhas são
+    feitos uma vez para o mês inteiro; cada unidade só separa as suas linhas
+    e monta rows/destinatários/sumário. O custo cresce com o total de
+    linhas, e não com unidades × linhas.
+
+    Args:
+        df: DataFrame bruto da planilha ou RegionFrame já indexado
+        ym: Mês de referência no formato YYYY-MM
+        columns_whitelist_by_unit: Unidades a preparar (nome em qualquer
+            grafia) e suas colunas; None como valor usa as colunas padrão.
+            Se omitido, prepara todas as unidades do mês com as colunas padrão.
+        mode: "full", "rows" ou "summary", como em filter_and_prepare. No
+            modo "summary" o mês não é formatado: cada unidade lê só as
+            colunas de valor das suas linhas.
+
+    Returns:
+        Dicionário {unidade normalizada: (rows, recipients, summary)}, no
+        mesmo formato de filter_and_prepare, para cada unidade com dados no mês.
+
+    A formatação do mês fica em cache no RegionFrame: chamadas seguintes
+    para o mesmo mês (ex.: uma unidade por vez no CLI) só montam as rows.
+    """
+    _check_mode(mode)
+    frame = df if isinstance(df, RegionFrame) else RegionFrame(df)
+    if not frame.uni_col or not frame.mes_col:
+        return {}
+
+    whitelist_by_nu: Dict[str, Optional[List[str]]] = {}
+    names_by_nu: Dict[str, str] = {}
+    for name, cols in (columns_whitelist_by_unit or {}).items():
+        nu = normalize_unit(name)
+        whitelist_by_nu[nu] = cols
+        names_by_nu[nu] = name
+
+    def wanted(nu: str) -> bool:
+        return columns_whitelist_by_unit is None or nu in whitelist_by_nu
+
+    results = {}
+    if mode == "summary":
+        for (nu, ym_key), idx in frame._groups.items():
+            if ym_key != ym or not wanted(nu):
+                continue
+            unidade = names_by_nu.get(nu) or str(frame.df[frame.uni_col].iloc[idx[0]])
+            results[nu] = ([], [], _positions_summary(frame.df, idx, frame.mapping, unidade, whitelist_by_nu.get(nu)))
+        return results
+
+    dfm, unit_positions = frame.prepare_month(ym)
+    for nu, local in unit_positions.items():
+        if not wanted(nu):
+            continue
+        dfu = dfm.iloc[local]
+        unidade = names_by_nu.get(nu) or str(dfu[frame.uni_col].iloc[0])
+        recipients = list(frame.recipients.by_group.get((nu, ym), [])) if mode == "full" else []
+        results[nu] = _finish_unit_rows(dfu, frame.mapping, unidade, whitelist_by_nu.get(nu), recipients, mode)
+    return results
+
+
+# --------------------------
+# Cubo mensal (KPIs por unidade × mês)
+# --------------------------
+CUBE_ROW_COUNT = "row_count"
+CUBE_VALOR_PLANILHA = "Valor Planilha"
+CUBE_VALOR_MENSAL_FINAL = "Valor Mensal Final"
+CUBE_DESCONTOS = "Descontos"
+
+
+def build_monthly_cube(df: Union[pd.DataFrame, RegionFrame]) -> pd.DataFrame:
+    """
+    Agrega a planilha inteira em um cubo unidade × mês × métrica em um único groupby.
+
+    Substitui os filter_and_prepare repetidos do mês anterior e do acumulado
+    do ano (YTD), que só eram usados para somar totais.
+
+    Returns:
+        DataFrame indexado por (unidade normalizada, YYYY-MM) com as colunas
+        row_count, Valor Planilha, Valor Mensal Final, cada coluna de
+        KPI_DISCOUNT_COLUMNS presente na planilha e Descontos (soma delas).
+    """
+    frame = df if isinstance(df, RegionFrame) else RegionFrame(df)
+    columns = [CUBE_ROW_COUNT, CUBE_VALOR_PLANILHA, CUBE_VALOR_MENSAL_FINAL, CUBE_DESCONTOS]
+    if frame.unit_keys is None or len(frame.df) == 0:
+        empty_index = pd.MultiIndex.from_arrays([[], []], names=["unidade", "mes"])
+        return pd.DataFrame(columns=columns, index=empty_index, dtype=float)
+
+    src = frame.df
+    rename_map = _canonical_rename_map(src.columns)
+    canonical_cols = [rename_map.get(c, c) for c in src.columns]
+
+    def _source(canonical: str) -> Optional[pd.Series]:
+        # Primeira ocorrência da coluna canônica (mesma coluna usada na exibição)
+        return _canonical_source(src, canonical_cols, canonical)
+
+    metrics = pd.DataFrame({
+        "unidade": frame.unit_keys,
+        "mes": frame.month_keys,
+        CUBE_ROW_COUNT: 1,
+    })
+
+    # Métricas monetárias em centavos (int64): somas exatas, convertidas para reais no final
+    vmf_col = frame.mapping.get("Valor_Mensal_Final")
+    metrics[CUBE_VALOR_MENSAL_FINAL] = parse_cents(src[vmf_col])[0] if vmf_col and vmf_col in src.columns else 0
+
+    vplan = _source(CUBE_VALOR_PLANILHA)
+    metrics[CUBE_VALOR_PLANILHA] = parse_cents(vplan, brl=True)[0] if vplan is not None else 0
+
+    discount_cols = []
+    for col in KPI_DISCOUNT_COLUMNS:
+        series = _source(col)
+        if series is not None:
+            metrics[col] = parse_cents(series, brl=True)[0]
+            discount_cols.append(col)
+    metrics[CUBE_DESCONTOS] = metrics[discount_cols].sum(axis=1) if discount_cols else 0
+
+    cube = metrics.groupby(["unidade", "mes"], sort=True).sum()
+    money_cols = [CUBE_VALOR_PLANILHA, CUBE_VALOR_MENSAL_FINAL, *discount_cols, CUBE_DESCONTOS]
+    cube[money_cols] = cube[money_cols].astype(float) / 100
+    return cube[[CUBE_ROW_COUNT, *money_cols[:2], *discount_cols, CUBE_DESCONTOS]]
+
+
+def cube_totals(cube: pd.DataFrame, unidade: str, months: Union[str, List[str]]) -> Dict[str, Any]:
+    """
+    Soma as métricas do cubo para uma unidade em um ou mais meses.
+
+    Returns:
+        Dicionário no formato do sumário de filter_and_prepare (row_count,
+        sum_valor_mensal_final, sum_valor_planilha, sum_descontos_gerais)
+        acrescido de descontos (total por coluna de desconto).
+    """
+    months = [months] if isinstance(months, str) else list(months)
+    keys = [(normalize_unit(unidade), ym) for ym in months]
+    present = [k for k in keys if k in cube.index]
+    totals = cube.loc[present].sum() if present else pd.Series(0.0, index=cube.columns)
+
+    discount_cols = [c for c in cube.columns if c in KPI_DISCOUNT_COLUMNS]
+    return {
+        "row_count": int(totals.get(CUBE_ROW_COUNT, 0)),
+        "sum_valor_mensal_final": float(totals.get(CUBE_VALOR_MENSAL_FINAL, 0.0)),
+        "sum_valor_planilha": float(totals.get(CUBE_VALOR_PLANILHA, 0.0)),
+        "sum_descontos_gerais": float(totals.get(CUBE_DESCONTOS, 0.0)),
+        "descontos": {c: float(totals.get(c, 0.0)) for c in discount_cols},
+        "months": months,
+    }
@@ -11,10 +11,11 @@ import io
 from decimal import Decimal, ROUND_HALF_UP, InvalidOperation
 from datetime import date, timedelta
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from functools import lru_cache
 import unicodedata
 
+import numpy as np
 import pandas as pd
 
 # --------------------------
@@ -78,6 +79,7 @@ YEAR_MONTH_PATTERNS = [
 
 BRL_CLEAN_PATTERN = re.compile(r"[^0-9.,]")
 MULTIPLE_SPACES = re.compile(r"\s+")
+EMAIL_ANGLE_PATTERN = re.compile(r"<([^>]+)>")
 
 
 def safe_read_text(path, encoding="utf-8"):
@@ -309,6 +311,125 @@ def parse_year_month(s: Any, warn: bool = False) -> Optional[str]:
     return None
 
 
+def is_categorical(series: pd.Series) -> bool:
+    """Coluna Categorical (ex.: Extractor com categorical=True)."""
+    return isinstance(series.dtype, pd.CategoricalDtype)
+
+
+def category_parts(series: pd.Series) -> Tuple[pd.Series, np.ndarray]:
+    """
+    Categorias (Series object) e códigos por linha de uma coluna
+    Categorical: cada valor distinto é processado uma vez e o resultado é
+    expandido com resultado[códigos]. Ausentes (código -1) apontam para um
+    NaN acrescentado no fim das categorias.
+    """
+    categories = pd.Series(series.cat.categories.to_numpy(dtype=object), dtype=object)
+    codes = series.cat.codes.to_numpy()
+    if (codes < 0).any():
+        codes = np.where(codes < 0, len(categories), codes)
+        categories = pd.concat([categories, pd.Series([np.nan], dtype=object)], ignore_index=True)
+    return categories, codes
+
+
+# Formas numéricas de parse_year_month (só dígitos ASCII) para parse_year_month_series
+YEAR_MONTH_SERIES_PATTERN = (
+    r"^(?:(?P<ym_y>[0-9]{4})[-/.](?P<ym_m>[0-9]{1,2})"
+    r"|(?P<my_m>[0-9]{1,2})[-/.](?P<my_y>[0-9]{4})"
+    r"|[0-9]{1,2}/(?P<dmy_m>[0-9]{1,2})/(?P<dmy_y>[0-9]{4})"
+    r"|(?P<ymd_y>[0-9]{4})[-/.](?P<ymd_m>[0-9]{1,2})[-/.][0-9]{1,2})$"
+)
+YEAR_SEARCH_PATTERN = r"(20[0-9]{2}|19[0-9]{2})"
+# Dígitos Unicode fora de 0-9 (casam com \d em parse_year_month)
+NON_ASCII_DIGIT_PATTERN = r"(?![0-9])\d"
+EXCEL_EPOCH = np.datetime64("1899-12-30", "D")
+EXCEL_MAX_SERIAL = (date.max - date(1899, 12, 30)).days
+
+
+def _year_month_texts(y: pd.Series, m: pd.Series) -> pd.Series:
+    """Anos (texto de 4 dígitos) e meses numéricos -> 'YYYY-MM'."""
+    return y + "-" + m.astype(int).astype(str).str.zfill(2)
+
+
+def _parse_year_month_distinct(texts: pd.Series) -> pd.Series:
+    """parse_year_month para textos distintos, com operações de coluna."""
+    result = pd.Series([None] * len(texts), index=texts.index, dtype=object)
+    # Mesma limpeza: sem espaços nas pontas e sem hora
+    s = texts.str.strip().str.replace("T", " ", regex=False).str.split(" ", n=1).str[0].str.strip()
+
+    odd = s.str.contains(NON_ASCII_DIGIT_PATTERN)
+    if odd.any():
+        result[odd] = [parse_year_month(v) for v in texts[odd]]
+    s = s.where(~odd, "")
+
+    parts = s.str.extract(YEAR_MONTH_SERIES_PATTERN)
+    for prefix in ("ym", "my", "dmy", "ymd"):
+        y = parts[f"{prefix}_y"]
+        m = pd.to_numeric(parts[f"{prefix}_m"])
+        valid = y.notna() & m.between(1, 12)
+        if valid.any():
+            result[valid] = _year_month_texts(y[valid], m[valid])
+
+    # Mês por extenso: primeiro mês (na ordem) citado, se houver ano no texto
+    low = s.str.lower()
+    year = low.str.extract(YEAR_SEARCH_PATTERN)[0]
+    for k, name in BR_MONTHS.items():
+        hit = result.isna() & year.notna() & low.str.contains(name.lower(), regex=False)
+        if hit.any():
+            result[hit] = year[hit] + f"-{k:02d}"
+
+    # Serial Excel (dias desde 1899-12-30)
+    # (zeros à esquerda não contam no limite de tamanho, como em int(s) no escalar)
+    digits = result.isna() & s.str.fullmatch(r"[0-9]+") & (s.str.lstrip("0").str.len() <= 7)
+    if digits.any():
+        days = pd.to_numeric(s[digits]).to_numpy(dtype=np.int64)
+        ok = days <= EXCEL_MAX_SERIAL
+        months = (EXCEL_EPOCH + days[ok].astype("timedelta64[D]")).astype("datetime64[M]").astype(np.int64)
+        idx = s[digits].index[ok]
+        y = pd.Series(months // 12 + 1970, index=idx).astype(str)
+        result[idx] = _year_month_texts(y, pd.Series(months % 12 + 1, index=idx))
+    return result
+
+
+def parse_year_month_series(series: pd.Series) -> pd.Series:
+    """
+    parse_year_month para uma coluna inteira, com o mesmo resultado célula a
+    célula (None quando não reconhece).
+
+    Textos são tratados uma vez por valor distinto com str.extract, tabela
+    de meses por extenso e conversão vetorizada de serial Excel; datas
+    tipadas viram YYYY-MM direto. Os demais valores (números, bool) passam
+    por parse_year_month.
+    """
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series.dt.strftime("%Y-%m").astype(object).where(series.notna(), None)
+    if is_categorical(series):
+        categories, codes = category_parts(series)
+        parsed = parse_year_month_series(categories).to_numpy(dtype=object)
+        return pd.Series(parsed[codes], index=series.index, dtype=object)
+
+    values = series.to_numpy(dtype=object)
+    out = np.full(len(values), None, dtype=object)
+    missing = pd.isna(values)
+    if pd.api.types.infer_dtype(values, skipna=True) == "string":
+        is_text = ~missing
+    else:
+        is_text = np.fromiter((isinstance(v, str) for v in values), dtype=bool, count=len(values))
+
+    if is_text.any():
+        codes, uniques = pd.factorize(values[is_text])
+        parsed = _parse_year_month_distinct(pd.Series(uniques, dtype=object)).to_numpy(dtype=object)
+        out[is_text] = parsed[codes]
+
+    cache: Dict[Any, Optional[str]] = {}
+    for i in np.flatnonzero(~is_text & ~missing):
+        v = values[i]
+        key = (type(v), v)
+        if key not in cache:
+            cache[key] = f"{v.year:04d}-{v.month:02d}" if isinstance(v, date) else parse_year_month(v)
+        out[i] = cache[key]
+    return pd.Series(out, index=series.index, dtype=object)
+
+
 def previous_month_from_today(today: Optional[date] = None) -> str:
     """Retorna mês anterior."""
     if not today:
@@ -567,32 +688,46 @@ def has_successful_send(
 
 
 # Cache para imagens base64
-_IMAGE_CACHE: Dict[str, str] = {}
+# caminho -> ((mtime_ns, tamanho), data URI): renovado quando o arquivo muda
+_IMAGE_CACHE: Dict[str, Tuple[Tuple[int, int], str]] = {}
+
+def image_mime(img_path: Path) -> str:
+    """Tipo MIME da imagem pela extensão (PNG ou JPEG)."""
+    return "image/png" if img_path.suffix.lower() == ".png" else "image/jpeg"
 
 def to_base64_image(img_path: Path) -> Optional[str]:
-    """Converte imagem para base64 com cache."""
+    """Converte imagem para base64 com cache (codifica de novo se o arquivo mudar)."""
     key = str(img_path)
-    if key in _IMAGE_CACHE:
-        return _IMAGE_CACHE[key]
+    try:
+        st = img_path.stat()
+    except OSError:
+        _IMAGE_CACHE.pop(key, None)
+        return None
+    stamp = (st.st_mtime_ns, st.st_size)
+    cached = _IMAGE_CACHE.get(key)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
     
     try:
-        if img_path.exists():
-            data = img_path.read_bytes()
-            mime = "image/png" if img_path.suffix.lower() == ".png" else "image/jpeg"
-            b64 = base64.b64encode(data).decode("ascii")
-            result = f"data:{mime};base64,{b64}"
-            _IMAGE_CACHE[key] = result
-            return result
+        data = img_path.read_bytes()
+        b64 = base64.b64encode(data).decode("ascii")
+        result = f"data:{image_mime(img_path)};base64,{b64}"
+        _IMAGE_CACHE[key] = (stamp, result)
+        return result
     except Exception:
         return None
-    return None
 
 
 # ==========================
 # E-mails
 # ==========================
-def split_emails(s: str, warn: bool = False) -> List[str]:
-    """Split de emails otimizado."""
+def split_emails(s: str, warn: bool = False, rejected: Optional[List[str]] = None) -> List[str]:
+    """
+    Split de emails otimizado.
+
+    Endereços inválidos são descartados (com aviso se warn=True) e, se
+    rejected for informado, acrescentados a essa lista.
+    """
     s = (s or "").replace(",", ";").replace("|", ";").replace("\n", ";").replace("\r", ";")
     parts = [p.strip() for p in s.split(";") if p.strip()]
     good: List[str] = []
@@ -600,7 +735,7 @@ def split_emails(s: str, warn: bool = False) -> List[str]:
     
     for p in parts:
         # Extrai email de "Nome <email>"
-        m = re.search(r"<([^>]+)>", p)
+        m = EMAIL_ANGLE_PATTERN.search(p)
         if m:
             p = m.group(1)
         if "@" in p and "." in p.split("@")[-1]:
@@ -608,8 +743,11 @@ def split_emails(s: str, warn: bool = False) -> List[str]:
             if pl not in seen:
                 seen.add(pl)
                 good.append(p)
-        elif warn:
-            print(f"[WARN] Email inválido descartado: '{p}'")
+        else:
+            if warn:
+                print(f"[WARN] Email inválido descartado: '{p}'")
+            if rejected is not None:
+                rejected.append(p)
     
     return good
 
@@ -0,0 +1,242 @@
+# xlsx_fast.py — decodificação direta do XLSX (zip + iterparse), sem montar o workbook do openpyxl
+
+import posixpath
+import zipfile
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+try:  # lxml é opcional: sem ele usa o ElementTree da biblioteca padrão
+    from lxml import etree as _etree
+
+    def _iterparse(source, tag):
+        return _etree.iterparse(source, events=("end",), tag=tag, resolve_entities=False, huge_tree=True)
+
+    HAS_LXML = True
+except ImportError:  # pragma: no cover - depende do ambiente
+    import xml.etree.ElementTree as _etree
+
+    def _iterparse(source, tag):
+        return ((event, elem) for event, elem in _etree.iterparse(source, events=("end",)) if elem.tag == tag)
+
+    HAS_LXML = False
+
+from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format
+from openpyxl.utils.datetime import MAC_EPOCH, WINDOWS_EPOCH, from_excel, from_ISO8601
+
+# Namespaces do SpreadsheetML
+MAIN_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+PKG_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+
+ROW_TAG = f"{{{MAIN_NS}}}row"
+CELL_TAG = f"{{{MAIN_NS}}}c"
+VALUE_TAG = f"{{{MAIN_NS}}}v"
+INLINE_TAG = f"{{{MAIN_NS}}}is"
+TEXT_TAG = f"{{{MAIN_NS}}}t"
+RUN_TAG = f"{{{MAIN_NS}}}r"
+SI_TAG = f"{{{MAIN_NS}}}si"
+
+SHARED_STRINGS_REL = f"{REL_NS}/sharedStrings"
+STYLES_REL = f"{REL_NS}/styles"
+
+
+def _text_content(node) -> str:
+    """Texto de <si>/<is>: <t> simples mais os trechos <r><t> (ignora fonética), como o openpyxl."""
+    parts = []
+    plain = node.find(TEXT_TAG)
+    if plain is not None and plain.text:
+        parts.append(plain.text)
+    for run in node.findall(RUN_TAG):
+        t = run.find(TEXT_TAG)
+        if t is not None and t.text:
+            parts.append(t.text)
+    return "".join(parts)
+
+
+def _column_index(ref: str) -> int:
+    """'AB12' -> 28."""
+    col = 0
+    for ch in ref:
+        if "A" <= ch <= "Z":
+            col = col * 26 + (ord(ch) - 64)
+        else:
+            break
+    return col
+
+
+def _cast_number(value: str):
+    """Mesma conversão do openpyxl: float se tiver ponto/expoente, senão int."""
+    if "." in value or "E" in value or "e" in value:
+        return float(value)
+    return int(value)
+
+
+def read_sheet_names(path: Path) -> List[str]:
+    """
+    Nomes das abas, na ordem do arquivo, lidos só de xl/workbook.xml (sem
+    strings compartilhadas nem planilhas). Levanta zipfile.BadZipFile /
+    KeyError para arquivos que não são XLSX.
+    """
+    with zipfile.ZipFile(path) as zf:
+        root = _etree.fromstring(zf.read("xl/workbook.xml"))
+    return [sheet.get("name") for sheet in root.iter(f"{{{MAIN_NS}}}sheet")]
+
+
+class WorkbookCatalog:
+    """
+    Metadados do XLSX lidos uma única vez: abas e seus arquivos XML, época
+    das datas, estilos de data e a tabela de strings compartilhadas.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.sheet_parts: Dict[str, str] = {}
+        self.epoch = WINDOWS_EPOCH
+        self.date_styles: frozenset = frozenset()
+        self.shared_strings: List[str] = []
+
+        with zipfile.ZipFile(self.path) as zf:
+            rels = self._read_rels(zf, "xl/_rels/workbook.xml.rels")
+            self._read_workbook(zf, rels)
+            styles_part = next((t for t, kind in rels.values() if kind == STYLES_REL), None)
+            if styles_part and styles_part in zf.namelist():
+                self.date_styles = self._read_date_styles(zf.read(styles_part))
+            strings_part = next((t for t, kind in rels.values() if kind == SHARED_STRINGS_REL), None)
+            if strings_part and strings_part in zf.namelist():
+                with zf.open(strings_part) as fh:
+                    self.shared_strings = [
+                        _text_content(si).replace("x005F_", "") for si in self._iter_clear(fh, SI_TAG)
+                    ]
+
+    @property
+    def sheet_names(self) -> List[str]:
+        return list(self.sheet_parts)
+
+    @staticmethod
+    def _iter_clear(source, tag):
+        for _, elem in _iterparse(source, tag):
+            yield elem
+            elem.clear()
+
+    @staticmethod
+    def _read_rels(zf: zipfile.ZipFile, name: str) -> Dict[str, Tuple[str, str]]:
+        rels: Dict[str, Tuple[str, str]] = {}
+        root = _etree.fromstring(zf.read(name))
+        for rel in root.iter(f"{{{PKG_REL_NS}}}Relationship"):
+            target = rel.get("Target", "")
+            if target.startswith("/"):
+                target = target.lstrip("/")
+            else:
+                target = posixpath.normpath(posixpath.join("xl", target))
+            rels[rel.get("Id")] = (target, rel.get("Type", ""))
+        return rels
+
+    def _read_workbook(self, zf: zipfile.ZipFile, rels: Dict[str, Tuple[str, str]]) -> None:
+        root = _etree.fromstring(zf.read("xl/workbook.xml"))
+        pr = root.find(f"{{{MAIN_NS}}}workbookPr")
+        if pr is not None and pr.get("date1904", "").lower() in ("1", "true"):
+            self.epoch = MAC_EPOCH
+        for sheet in root.iter(f"{{{MAIN_NS}}}sheet"):
+            rel = rels.get(sheet.get(f"{{{REL_NS}}}id"))
+            if rel:
+                self.sheet_parts[sheet.get("name")] = rel[0]
+
+    @staticmethod
+    def _read_date_styles(xml: bytes) -> frozenset:
+        """Índices de cellXfs cujo formato numérico é de data (mesma regra do openpyxl)."""
+        root = _etree.fromstring(xml)
+        custom = {}
+        numfmts = root.find(f"{{{MAIN_NS}}}numFmts")
+        if numfmts is not None:
+            for fmt in numfmts.findall(f"{{{MAIN_NS}}}numFmt"):
+                custom[int(fmt.get("numFmtId"))] = fmt.get("formatCode", "")
+        date_styles = set()
+        xfs = root.find(f"{{{MAIN_NS}}}cellXfs")
+        if xfs is not None:
+            for idx, xf in enumerate(xfs.findall(f"{{{MAIN_NS}}}xf")):
+                fmt_id = int(xf.get("numFmtId", 0))
+                fmt = custom[fmt_id] if fmt_id in custom else BUILTIN_FORMATS.get(fmt_id, "General")
+                if is_date_format(fmt):
+                    date_styles.add(idx)
+        return frozenset(date_styles)
+
+
+def iter_sheet_rows(catalog: WorkbookCatalog, sheet_name: str) -> Iterator[tuple]:
+    """
+    Linhas da aba como tuplas de valores, iguais às de
+    ws.iter_rows(values_only=True) do openpyxl em modo read_only
+    (após reset_dimensions): linhas ausentes viram tuplas vazias e cada
+    linha vai até a última célula gravada.
+    """
+    part = catalog.sheet_parts[sheet_name]
+    shared = catalog.shared_strings
+    date_styles = catalog.date_styles
+    epoch = catalog.epoch
+
+    with zipfile.ZipFile(catalog.path) as zf, zf.open(part) as fh:
+        row_counter = 0
+        for _, row in _iterparse(fh, ROW_TAG):
+            r = row.get("r")
+            idx = int(r) if r else row_counter + 1
+            # Linhas não gravadas no XML
+            while row_counter + 1 < idx:
+                row_counter += 1
+                yield ()
+            row_counter = idx
+
+            values: Dict[int, object] = {}
+            col = 0
+            last_col = 0
+            for c in row.iter(CELL_TAG):
+                ref = c.get("r")
+                col = _column_index(ref) if ref else col + 1
+                last_col = col
+                t = c.get("t", "n")
+                if t == "inlineStr":
+                    node = c.find(INLINE_TAG)
+                    value = _text_content(node) if node is not None else None
+                else:
+                    value = c.findtext(VALUE_TAG) or None
+                    if value is not None:
+                        if t == "n":
+                            value = _cast_number(value)
+                            s = c.get("s")
+                            if s and int(s) in date_styles:
+                                try:
+                                    value = from_excel(value, epoch)
+                                except (OverflowError, ValueError):
+                                    value = "#VALUE!"
+                        elif t == "s":
+                            value = shared[int(value)]
+                        elif t == "b":
+                            value = bool(int(value))
+                        elif t == "d":
+                            value = from_ISO8601(value)
+                if value is not None:
+                    values[col] = value
+
+            row.clear()
+            if HAS_LXML:
+                # Libera as linhas já processadas da árvore
+                while row.getprevious() is not None:
+                    del row.getparent()[0]
+
+            yield tuple(values.get(i) for i in range(1, last_col + 1)) if last_col else ()
+
+
+# --------------------------
+# Decodificação em processos paralelos
+# --------------------------
+_WORKER_CATALOG: Optional[WorkbookCatalog] = None
+
+
+def init_worker(catalog: WorkbookCatalog) -> None:
+    """Inicializador do pool: recebe o catálogo (e as strings compartilhadas) uma vez por processo."""
+    global _WORKER_CATALOG
+    _WORKER_CATALOG = catalog
+
+
+def worker_catalog() -> WorkbookCatalog:
+    if _WORKER_CATALOG is None:
+        raise RuntimeError("Pool de decodificação não inicializado (use init_worker)")
+    return _WORKER_CATALOG